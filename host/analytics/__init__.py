@@ -0,0 +1,24 @@
+"""Analytics of the controller history on the host, with NumPy.
+
+The history is read in chunks (sources), the metrics are computed per
+sample with vectorized NumPy operations (metrics) and summed up per hour,
+day or week (summary). Memory use depends on the chunk size, not on the
+length of the history.
+
+    from analytics import analyze
+    columns = analyze("datalog.bin", period="day")
+
+Needs NumPy (pip install numpy). The command line tool is host/analyze.py.
+"""
+from .metrics import dew_point, dew_point_margin, efficiency  # noqa: F401
+from .sources import CHUNK_ROWS, GRID_S, read
+from .summary import PeriodSummary, write  # noqa: F401
+
+
+def analyze(path, period="day", offset_s=0, chunk_rows=CHUNK_ROWS, grid_s=GRID_S, device="rdkr"):
+    """Summary columns of a data log, CSV or Home Assistant database"""
+    summary = PeriodSummary(period, offset_s)
+    for chunk in read(path, chunk_rows, grid_s, device):
+        summary.add(chunk)
+    return summary.finish()
+
@@ -0,0 +1,61 @@
+"""Vectorized metrics of the controller history.
+
+The functions take NumPy arrays (one value per sample) and return arrays,
+NaN where a value can not be computed from the inputs.
+"""
+import numpy as np
+
+# constants of strategy.calculate_dew_point (Magnus formula)
+MAGNUS_A = 17.27
+MAGNUS_B = 237.7
+# smallest return to fresh air difference the efficiency is computed for, in C
+MIN_DELTA = 3.0
+
+
+def dew_point(temp, hum):
+    """strategy.calculate_dew_point for arrays, NaN for humidities of 0 or less"""
+    temp = np.asarray(temp, dtype=np.float64)
+    hum = np.asarray(hum, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha = MAGNUS_A * temp / (MAGNUS_B + temp) + np.log(np.where(hum > 0, hum, np.nan) / 100.0)
+        return MAGNUS_B * alpha / (MAGNUS_A - alpha)
+
+
+def efficiency(fresh, supply, ret, min_delta=MIN_DELTA):
+    """Temperature efficiency of the heat recovery on the supply side: the
+    share of the return to fresh air difference the supply air recovers.
+    NaN where the difference is below min_delta, it is all noise there."""
+    delta = ret - fresh
+    with np.errstate(invalid="ignore"):
+        return np.where(np.abs(delta) >= min_delta, (supply - fresh) / np.where(delta == 0, np.nan, delta), np.nan)
+
+
+def dew_point_margin(fresh, ret_temp, ret_hum):
+    """Fresh air temperature above the dew point of the return air in C.
+    Below 0 the return air condenses in the rotor (rule_strategy keeps the
+    rotor on below dew_point_margin)."""
+    return fresh - dew_point(ret_temp, ret_hum)
+
+
+def durations(t, previous=np.nan, max_gap_s=600.0):
+    """Time in s from the sample before to each sample, which it is credited
+    to. previous is the time of the sample before t[0] (the first sample
+    counts 0 s without it). Gaps longer than max_gap_s, when the controller
+    was off, count 0 s as well."""
+    dt = np.diff(t, prepend=previous)
+    return np.where((dt > 0) & (dt <= max_gap_s), dt, 0.0)
+
+
+def compute(chunk, min_delta=MIN_DELTA):
+    """Per sample metrics of a chunk of columns (see sources)"""
+    fresh = chunk["fresh_air_temp"]
+    ret = chunk["return_air_temp"]
+    return dict(
+        efficiency=np.where(chunk["rotor"] == 1.0, efficiency(fresh, chunk["supply_air_temp"], ret, min_delta),
+                            np.nan),
+        # the same on the exhaust side: (return - exhaust) / (return - fresh)
+        exhaust_efficiency=np.where(chunk["rotor"] == 1.0,
+                                    efficiency(ret, chunk["exhaust_air_temp"], fresh, min_delta), np.nan),
+        dew_point=dew_point(ret, chunk["return_air_hum"]),
+        dew_point_margin=dew_point_margin(fresh, ret, chunk["return_air_hum"]),
+    )
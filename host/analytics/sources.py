@@ -0,0 +1,278 @@
+"""Readers yielding the controller history as chunks of columns.
+
+Every reader yields dicts of NumPy arrays with at most chunk_rows samples,
+oldest first: "time" (unix seconds, float64), the eight DHT values of
+datalog.DHT_KEYS and "r2" (float64, NaN when missing or stale) and "rotor"
+(1.0 running, 0.0 stopped, NaN when the RDKR decides by itself). Only one
+chunk is in memory at a time.
+
+- read_datalog: the binary data log of the board (src/datalog.py)
+- read_csv: a CSV written by datalog_reader.py --csv, or a Home Assistant
+  history export (entity_id, state, last_changed)
+- read_ha_sqlite: the recorder database of Home Assistant
+  (home-assistant_v2.db)
+
+Home Assistant stores every entity separately and only on change. Its
+states are carried forward onto a grid of grid_s seconds, the interval of
+the controller's data log by default.
+"""
+import csv
+import datetime
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+
+import datalog  # noqa: E402
+
+CHUNK_ROWS = 65536
+GRID_S = 120
+# columns of every chunk besides time
+KEYS = datalog.DHT_KEYS + ("r2", "rotor")
+
+# one record of RECORD_FORMAT ("<II8hffHBB")
+DATALOG_DTYPE = np.dtype([
+    ("seq", "<u4"), ("time", "<u4"), ("dht", "<i2", (8,)), ("r1", "<f4"), ("r2", "<f4"),
+    ("pwm", "<u2"), ("strategy", "u1"), ("stale", "u1"),
+])
+assert DATALOG_DTYPE.itemsize == datalog.RECORD_SIZE
+# rotor by strategy code: forced on or off, unknown for mirror and modulate
+ROTOR_BY_CODE = np.full(256, np.nan)
+ROTOR_BY_CODE[datalog.STRATEGY_CODES["on"]] = 1.0
+ROTOR_BY_CODE[datalog.STRATEGY_CODES["off"]] = 0.0
+# stale flag of each DHT column
+DHT_STALE_BITS = np.array([datalog.STALE_BITS[key.rsplit("_", 1)[0]] for key in datalog.DHT_KEYS])
+
+
+def read(path, chunk_rows=CHUNK_ROWS, grid_s=GRID_S, device="rdkr"):
+    """Chunks of any supported file, chosen by its extension and header"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return read_ha_sqlite(path, chunk_rows, grid_s, device)
+    if ext == ".csv":
+        return read_csv(path, chunk_rows, grid_s, device)
+    return read_datalog(path, chunk_rows)
+
+
+def _decode_records(records):
+    """Chunk of columns from DATALOG_DTYPE records"""
+    stale = records["stale"][:, None] & DHT_STALE_BITS != 0
+    dht = records["dht"].astype(np.float64) / 10
+    dht[(records["dht"] == datalog.MISSING) | stale] = np.nan
+    chunk = {key: dht[:, i] for i, key in enumerate(datalog.DHT_KEYS)}
+    chunk["time"] = records["time"].astype(np.float64)
+    r2 = records["r2"].astype(np.float64)
+    r2[records["stale"] & datalog.STALE_BITS["r2"] != 0] = np.nan
+    chunk["r2"] = r2
+    chunk["rotor"] = ROTOR_BY_CODE[records["strategy"]]
+    return chunk
+
+
+def read_datalog(path, chunk_rows=CHUNK_ROWS):
+    """Chunks of the board's data log, memory-mapped"""
+    with open(path, "rb") as f:
+        header = f.read(datalog.HEADER_SIZE)
+    magic, version, size, capacity = struct.unpack(datalog.HEADER_FORMAT, header)
+    if magic != datalog.MAGIC or version != datalog.VERSION or size != datalog.RECORD_SIZE:
+        raise ValueError(f"{path} is not a compatible data log")
+    count = min((os.path.getsize(path) - datalog.HEADER_SIZE) // size, capacity)
+    if not count:
+        return
+    records = np.memmap(path, DATALOG_DTYPE, "r", datalog.HEADER_SIZE, (count,))
+    seq = records["seq"]
+    # slots up to the newest record hold seq[0] + slot, the oldest follows
+    # (binary search as DataLog._find_next_seq, touches a few pages only)
+    lo, hi = 0, count - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if int(seq[mid]) == int(seq[0]) + mid:
+            lo = mid
+        else:
+            hi = mid - 1
+    oldest = (lo + 1) % count
+    for start, stop in ((oldest, count), (0, oldest)):
+        for i in range(start, stop, chunk_rows):
+            yield _decode_records(np.array(records[i:min(i + chunk_rows, stop)]))
+
+
+def _number(state):
+    """Home Assistant state as a number, NaN for unavailable or text"""
+    if state == "on":
+        return 1.0
+    if state == "off":
+        return 0.0
+    try:
+        return float(state)
+    except ValueError:
+        return np.nan
+
+
+def _timestamp(value):
+    """unix seconds from a number or an ISO 8601 time (UTC if no offset)"""
+    try:
+        return float(value)
+    except ValueError:
+        t = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=datetime.timezone.utc)
+        return t.timestamp()
+
+
+def entity_key(entity_id, device="rdkr"):
+    """Column of a Home Assistant entity of the controller, None for others"""
+    entity_id = entity_id.lower()
+    if device not in entity_id:
+        return None
+    name = entity_id.split(".", 1)[-1]
+    # "..._fresh_air_temp" or "..._fresh_air_temp_2" for a renamed duplicate
+    parts = name.rsplit("_", 1)
+    if len(parts) == 2 and parts[1].isdigit():
+        name = parts[0]
+    for key in sorted(KEYS + ("rotor_state",), key=len, reverse=True):
+        if name.endswith(key):
+            return "rotor" if key == "rotor_state" else key
+    return None
+
+
+class GridPivot:
+    """Carries the per-entity Home Assistant states forward onto a time grid.
+
+    add() takes time ordered (time, key index, value) rows and returns the
+    grid samples up to the last row's time; the last value of every key is
+    kept for the next call."""
+
+    def __init__(self, grid_s=GRID_S):
+        self.grid_s = grid_s
+        self.last = np.full(len(KEYS), np.nan)
+        self.next_t = None
+
+    def add(self, t, key, value):
+        if not len(t):
+            return None
+        if self.next_t is None:
+            self.next_t = np.ceil(t[0] / self.grid_s) * self.grid_s
+        grid = np.arange(self.next_t, t[-1] + 1e-9, self.grid_s)
+        chunk = dict(time=grid)
+        for k, name in enumerate(KEYS):
+            mask = key == k
+            tk = t[mask]
+            vk = value[mask]
+            i = np.searchsorted(tk, grid, side="right") - 1
+            column = vk[np.maximum(i, 0)] if len(vk) else np.empty(len(grid))
+            chunk[name] = np.where(i >= 0, column, self.last[k])
+            if len(vk):
+                self.last[k] = vk[-1]
+        if len(grid):
+            self.next_t = grid[-1] + self.grid_s
+        return chunk if len(grid) else None
+
+
+def _pivot_rows(rows, chunk_rows, grid_s):
+    """Grid chunks from time ordered (unix time, key, number) rows"""
+    pivot = GridPivot(grid_s)
+    index = {key: i for i, key in enumerate(KEYS)}
+    # enough rows for about chunk_rows grid samples when all entities change
+    batch = chunk_rows * len(KEYS)
+    t = np.empty(batch)
+    k = np.empty(batch, dtype=np.int8)
+    v = np.empty(batch)
+    n = 0
+    for row_t, key, value in rows:
+        t[n] = row_t
+        k[n] = index[key]
+        v[n] = value
+        n += 1
+        if n == batch:
+            chunk = pivot.add(t[:n], k[:n], v[:n])
+            if chunk is not None:
+                yield chunk
+            n = 0
+    chunk = pivot.add(t[:n], k[:n], v[:n])
+    if chunk is not None:
+        yield chunk
+
+
+def _ha_rows(db, query):
+    cursor = db.execute(query)
+    while True:
+        rows = cursor.fetchmany(4096)
+        if not rows:
+            return
+        yield from rows
+
+
+def read_ha_sqlite(path, chunk_rows=CHUNK_ROWS, grid_s=GRID_S, device="rdkr"):
+    """Chunks of the controller's entities in a Home Assistant recorder database"""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in db.execute("PRAGMA table_info(states)")}
+        if "metadata_id" in columns:
+            # schema 41 and later: entity ids in states_meta, unix timestamps
+            entities = db.execute("SELECT metadata_id, entity_id FROM states_meta").fetchall()
+            keys = {mid: entity_key(eid, device) for mid, eid in entities}
+            ids = ",".join(str(mid) for mid, key in keys.items() if key is not None)
+            query = (f"SELECT last_updated_ts, metadata_id, state FROM states "
+                     f"WHERE metadata_id IN ({ids}) ORDER BY last_updated_ts")
+        else:
+            entities = db.execute("SELECT DISTINCT entity_id FROM states").fetchall()
+            keys = {eid: entity_key(eid, device) for eid, in entities}
+            ids = ",".join(f"'{eid}'" for eid, key in keys.items() if key is not None)
+            query = (f"SELECT last_updated, entity_id, state FROM states "
+                     f"WHERE entity_id IN ({ids}) ORDER BY last_updated")
+        rows = ((_timestamp(str(t)), keys[e], _number(s)) for t, e, s in _ha_rows(db, query))
+        yield from _pivot_rows(rows, chunk_rows, grid_s)
+    finally:
+        db.close()
+
+
+def _wide_csv(reader, header, chunk_rows):
+    """Chunks of a CSV written by datalog_reader.py --csv"""
+    index = {name: header.index(name) for name in ("time",) + datalog.DHT_KEYS + ("r2", "strategy", "stale")}
+    rotor = {"on": 1.0, "off": 0.0}
+    while True:
+        rows = [row for _, row in zip(range(chunk_rows), reader)]
+        if not rows:
+            return
+        chunk = dict(time=np.array([float(row[index["time"]]) for row in rows]))
+        stale = [row[index["stale"]].split(",") for row in rows]
+        for key in datalog.DHT_KEYS + ("r2",):
+            sensor = "r2" if key == "r2" else key.rsplit("_", 1)[0]
+            chunk[key] = np.array([
+                np.nan if sensor in s else _number(row[index[key]] or "nan")
+                for row, s in zip(rows, stale)])
+        chunk["rotor"] = np.array([rotor.get(row[index["strategy"]], np.nan) for row in rows])
+        yield chunk
+
+
+def read_csv(path, chunk_rows=CHUNK_ROWS, grid_s=GRID_S, device="rdkr"):
+    """Chunks of a data log CSV or a Home Assistant history export"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if "seq" in header:
+            yield from _wide_csv(reader, header, chunk_rows)
+            return
+        e, s, t = (header.index(name) for name in ("entity_id", "state", "last_changed"))
+        # the export is grouped by entity: sort it by time in a temporary
+        # database on disk rather than in memory
+        with tempfile.TemporaryDirectory() as tmp:
+            db = sqlite3.connect(os.path.join(tmp, "history.db"))
+            db.execute("CREATE TABLE states (t REAL, key TEXT, value REAL)")
+            keys = dict()
+
+            def key(entity_id):
+                if entity_id not in keys:
+                    keys[entity_id] = entity_key(entity_id, device)
+                return keys[entity_id]
+
+            rows = ((_timestamp(row[t]), key(row[e]), _number(row[s])) for row in reader)
+            db.executemany("INSERT INTO states VALUES (?, ?, ?)", (row for row in rows if row[1] is not None))
+            db.commit()
+            yield from _pivot_rows(_ha_rows(db, "SELECT t, key, value FROM states ORDER BY t"),
+                                   chunk_rows, grid_s)
+            db.close()
@@ -0,0 +1,144 @@
+"""Per period summaries of the controller history, built chunk by chunk.
+
+Samples are weighted by the time they stand for (metrics.durations), so
+gaps in the history do not count. Within a chunk the sums of every period
+are taken with np.add.reduceat over the time ordered samples; only the
+period still open at the end of a chunk is carried to the next one.
+"""
+import csv
+
+import numpy as np
+
+from . import metrics
+
+PERIODS = dict(hour=3600, day=86400, week=7 * 86400)
+# time weighted means
+MEANS = ("fresh_air_temp", "supply_air_temp", "return_air_temp", "exhaust_air_temp", "return_air_hum",
+         "efficiency", "exhaust_efficiency", "dew_point_margin", "rotor")
+MINS = ("fresh_air_temp", "dew_point_margin")
+MAXS = ("fresh_air_temp", "return_air_temp")
+# output columns, in order
+COLUMNS = (("start", "samples", "hours")
+           + tuple(f"{key}_mean" for key in MEANS if key != "rotor")
+           + tuple(f"{key}_min" for key in MINS) + tuple(f"{key}_max" for key in MAXS)
+           + ("condensation_h", "rotor_duty", "rotor_known_h", "rotor_starts"))
+
+
+class PeriodSummary:
+    """Accumulates chunks of columns (see sources) into one row per period.
+
+    Example usage:
+        summary = PeriodSummary("day")
+        for chunk in sources.read("datalog.bin"):
+            summary.add(chunk)
+        columns = summary.finish()
+    """
+
+    def __init__(self, period="day", offset_s=0, max_gap_s=600.0, min_delta=metrics.MIN_DELTA):
+        """period: name of PERIODS or seconds
+        offset_s: added to the unix time before it is split into periods,
+            e.g. 7200 for days in UTC+2
+        max_gap_s: longer gaps between samples count as missing time
+        min_delta: see metrics.efficiency"""
+        self.period_s = PERIODS.get(period, period)
+        self.offset_s = offset_s
+        self.max_gap_s = max_gap_s
+        self.min_delta = min_delta
+        self.rows = {name: [] for name in COLUMNS}
+        # sums of the period not finished yet, and the sample before the chunk
+        self._open = None
+        self._previous_t = np.nan
+        self._previous_rotor = np.nan
+
+    def _sums(self, chunk):
+        """(period index, dict of per period sums) of one chunk"""
+        t = chunk["time"]
+        period = np.floor((t + self.offset_s) / self.period_s).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(period)) + 1))
+        w = metrics.durations(t, self._previous_t, self.max_gap_s)
+        values = dict(chunk)
+        values.update(metrics.compute(chunk, self.min_delta))
+
+        def add(x):
+            return np.add.reduceat(x, starts)
+
+        sums = dict(samples=add(np.ones(len(t))), seconds=add(w))
+        for key in MEANS:
+            x = values[key]
+            valid = ~np.isnan(x)
+            sums[f"{key}_w"] = add(np.where(valid, w, 0.0))
+            sums[f"{key}_wx"] = add(np.where(valid, w * np.where(valid, x, 0.0), 0.0))
+        for key in MINS:
+            sums[f"{key}_min"] = np.fmin.reduceat(values[key], starts)
+        for key in MAXS:
+            sums[f"{key}_max"] = np.fmax.reduceat(values[key], starts)
+        with np.errstate(invalid="ignore"):
+            sums["condensation_s"] = add(np.where(values["dew_point_margin"] < 0, w, 0.0))
+        rotor = values["rotor"]
+        before = np.concatenate(([self._previous_rotor], rotor[:-1]))
+        sums["rotor_starts"] = add(((rotor == 1.0) & (before == 0.0)).astype(np.float64))
+
+        self._previous_t = t[-1]
+        self._previous_rotor = rotor[-1]
+        return period[starts], sums
+
+    def add(self, chunk):
+        if not len(chunk["time"]):
+            return
+        periods, sums = self._sums(chunk)
+        for i, p in enumerate(periods):
+            row = {key: x[i] for key, x in sums.items()}
+            if self._open is not None and self._open[0] == p:
+                self._open = (p, _merge(self._open[1], row))
+                continue
+            if self._open is not None:
+                self._emit(*self._open)
+            self._open = (p, row)
+
+    def _emit(self, period, sums):
+        rows = self.rows
+        rows["start"].append(period * self.period_s - self.offset_s)
+        rows["samples"].append(int(sums["samples"]))
+        rows["hours"].append(sums["seconds"] / 3600)
+        means = {key: sums[f"{key}_wx"] / sums[f"{key}_w"] if sums[f"{key}_w"] else np.nan for key in MEANS}
+        for key in MEANS:
+            if key != "rotor":
+                rows[f"{key}_mean"].append(means[key])
+        for key in MINS:
+            rows[f"{key}_min"].append(sums[f"{key}_min"])
+        for key in MAXS:
+            rows[f"{key}_max"].append(sums[f"{key}_max"])
+        rows["condensation_h"].append(sums["condensation_s"] / 3600)
+        rows["rotor_duty"].append(means["rotor"])
+        rows["rotor_known_h"].append(sums["rotor_w"] / 3600)
+        rows["rotor_starts"].append(int(sums["rotor_starts"]))
+
+    def finish(self) -> dict:
+        """Close the last period, returns the summary as a dict of column arrays"""
+        if self._open is not None:
+            self._emit(*self._open)
+            self._open = None
+        return {name: np.array(values) for name, values in self.rows.items()}
+
+
+def _merge(a, b):
+    merged = dict()
+    for key in a:
+        if key.endswith("_min"):
+            merged[key] = np.fmin(a[key], b[key])
+        elif key.endswith("_max"):
+            merged[key] = np.fmax(a[key], b[key])
+        else:
+            merged[key] = a[key] + b[key]
+    return merged
+
+
+def write(columns, path):
+    """Write a summary: .npz keeps the columns as arrays, otherwise CSV"""
+    if path.endswith(".npz"):
+        np.savez(path, **columns)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(np.round(x, 4).tolist() for x in columns.values())))
@@ -0,0 +1,63 @@
+"""Summarize the controller history: heat recovery, dew point margin, rotor duty.
+
+Reads the board's data log, a CSV written by datalog_reader.py --csv, a
+Home Assistant history CSV export or its recorder database in chunks, and
+prints one line per day (or --period). --out writes all summary columns,
+as NumPy arrays (.npz) or CSV.
+
+Run from the repository root:
+    python host/analyze.py datalog.bin
+    python host/analyze.py home-assistant_v2.db --period week --out weeks.csv
+    python host/analyze.py history.csv --device rdkr_ed142 --utc-offset 2
+
+Needs NumPy (pip install numpy).
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analytics  # noqa: E402
+from analytics.summary import PERIODS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="datalog.bin, a .csv or a Home Assistant .db")
+    parser.add_argument("--period", default="day", choices=list(PERIODS))
+    parser.add_argument("--utc-offset", type=float, default=0, help="hours, where the periods start")
+    parser.add_argument("--device", default="rdkr",
+                        help="part of the Home Assistant entity ids of the controller")
+    parser.add_argument("--grid", type=float, default=analytics.GRID_S,
+                        help="sample interval in s for Home Assistant states")
+    parser.add_argument("--chunk", type=int, default=analytics.CHUNK_ROWS, help="samples per chunk")
+    parser.add_argument("--out", help="write the summary columns to this .npz or .csv file")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    columns = analytics.analyze(args.path, args.period, int(args.utc_offset * 3600),
+                                args.chunk, args.grid, args.device)
+    elapsed = time.perf_counter() - t0
+    n = len(columns["start"])
+    samples = int(columns["samples"].sum()) if n else 0
+    print(f"{samples} samples in {n} periods, {elapsed:.2f} s")
+    if n:
+        print(f"{'start':>16} {'hours':>6} {'fresh':>6} {'return':>6} {'efficiency':>10} "
+              f"{'dew margin':>10} {'condensing':>10} {'rotor':>6} {'starts':>6}")
+    for i in range(n):
+        start = datetime.datetime.fromtimestamp(columns["start"][i], datetime.timezone.utc)
+        start += datetime.timedelta(hours=args.utc_offset)
+        print(f"{start:%Y-%m-%d %H:%M} {columns['hours'][i]:>6.1f} "
+              f"{columns['fresh_air_temp_mean'][i]:>6.1f} {columns['return_air_temp_mean'][i]:>6.1f} "
+              f"{columns['efficiency_mean'][i]:>10.0%} {columns['dew_point_margin_min'][i]:>10.1f} "
+              f"{columns['condensation_h'][i]:>9.1f}h {columns['rotor_duty'][i]:>6.0%} "
+              f"{columns['rotor_starts'][i]:>6}")
+    if args.out:
+        analytics.write(columns, args.out)
+        print(f"written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark the history analytics (host/analytics) on a synthetic year.
+
+Writes a data log with a year of 2 minute samples (262800 records, wrapped
+around like the ring buffer on the board), then summarizes it per day:
+
+- vectorized: analytics.analyze, NumPy over chunks of --chunk samples
+- per record: datalog_reader.read_columns and strategy.calculate_dew_point
+  record by record, the way the host tools worked so far
+
+and reports the time, the peak of the traced memory and the largest
+difference of the vectorized dew point from calculate_dew_point. With
+--ha it also summarizes --ha days exported from Home Assistant (a history
+CSV with one row per entity change).
+
+Run from the repository root:
+    python host/bench/bench_analytics.py
+    python host/bench/bench_analytics.py --days 365 --chunk 16384 --ha 30
+
+Needs NumPy (pip install numpy).
+"""
+import argparse
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+import analytics  # noqa: E402
+import datalog  # noqa: E402
+from analytics.sources import DATALOG_DTYPE  # noqa: E402
+from datalog_reader import read_columns  # noqa: E402
+from strategy import calculate_dew_point  # noqa: E402
+
+INTERVAL_S = 120
+START = 1704067200  # 2024-01-01
+
+
+def history(days, seed=1):
+    """Columns of a synthetic history: seasons, days, a rotor following rules"""
+    rng = np.random.default_rng(seed)
+    n = int(days * 86400 / INTERVAL_S)
+    t = START + INTERVAL_S * np.arange(n)
+    day = 2 * np.pi * (t - START) / 86400
+    fresh = 8 - 10 * np.cos(2 * np.pi * (t - START) / (365 * 86400)) - 4 * np.cos(day)
+    ret = 21 + 0.5 * np.sin(day) + rng.normal(0, 0.1, n)
+    rotor = (fresh < 16) | (fresh > 24)
+    recovered = np.where(rotor, 0.8 * (ret - fresh), 0)
+    return dict(
+        time=t, fresh=fresh, ret=ret, supply=fresh + recovered + 0.5, exhaust=ret - recovered,
+        fresh_hum=np.clip(80 - 2 * fresh + rng.normal(0, 3, n), 5, 100),
+        ret_hum=np.clip(45 + rng.normal(0, 3, n), 5, 100),
+        rotor=rotor, r2=10000 - 750 * (fresh - 22))
+
+
+def write_datalog(path, h):
+    """Data log whose oldest record is in the middle of the file"""
+    n = len(h["time"])
+    records = np.zeros(n, DATALOG_DTYPE)
+    records["seq"] = np.arange(n)
+    records["time"] = h["time"]
+    temps = (h["fresh"], h["supply"], h["ret"], h["exhaust"])
+    hums = (h["fresh_hum"], h["fresh_hum"], h["ret_hum"], h["ret_hum"])
+    records["dht"] = np.round(np.stack(temps + hums, axis=1) * 10)
+    records["r2"] = h["r2"]
+    records["pwm"] = 500
+    records["strategy"] = np.where(h["rotor"], datalog.STRATEGY_CODES["on"], datalog.STRATEGY_CODES["off"])
+    with open(path, "wb") as f:
+        f.write(struct.pack(datalog.HEADER_FORMAT, datalog.MAGIC, datalog.VERSION,
+                                    datalog.RECORD_SIZE, n))
+        # slot = seq % capacity on the board, here the ring wrapped at n // 3
+        np.roll(records, n // 3).tofile(f)
+
+
+def write_ha_csv(path, h, days):
+    """Home Assistant history export: rows per entity, only on change"""
+    n = min(len(h["time"]), int(days * 86400 / INTERVAL_S))
+    entities = dict(fresh_air_temp=h["fresh"], supply_air_temp=h["supply"], return_air_temp=h["ret"],
+                    exhaust_air_temp=h["exhaust"], fresh_air_hum=h["fresh_hum"],
+                    supply_air_hum=h["fresh_hum"], return_air_hum=h["ret_hum"],
+                    exhaust_air_hum=h["ret_hum"], r2=h["r2"])
+    with open(path, "w") as f:
+        f.write("entity_id,state,last_changed\n")
+        for key, values in entities.items():
+            values = np.round(values[:n], 1)
+            changed = np.concatenate(([True], np.diff(values) != 0))
+            for t, v in zip(h["time"][:n][changed], values[changed]):
+                f.write(f"sensor.rdkr_ed142_{key},{v},{t}\n")
+        rotor = h["rotor"][:n]
+        changed = np.concatenate(([True], np.diff(rotor) != 0))
+        for t, v in zip(h["time"][:n][changed], rotor[changed]):
+            f.write(f"binary_sensor.rdkr_ed142_rotor_state,{'on' if v else 'off'},{t}\n")
+    return n
+
+
+def per_record(path):
+    """Daily mean efficiency and minimum dew point margin, record by record"""
+    columns = read_columns(path)
+    days = dict()
+    for i, t in enumerate(columns["time"]):
+        fresh = columns["fresh_air_temp"][i]
+        ret = columns["return_air_temp"][i]
+        margin = fresh - calculate_dew_point(ret, columns["return_air_hum"][i])
+        day = days.setdefault(t // 86400, [0.0, 0, math.inf])
+        if columns["strategy"][i] == "on" and abs(ret - fresh) >= 3:
+            day[0] += (columns["supply_air_temp"][i] - fresh) / (ret - fresh)
+            day[1] += 1
+        day[2] = min(day[2], margin)
+    return days
+
+
+def measure(function, traced=True):
+    """result, time in s and, if traced, the peak of the traced memory (a
+    second run, tracing slows it down)"""
+    t0 = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - t0
+    if not traced:
+        return result, elapsed, None
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=365)
+    parser.add_argument("--chunk", type=int, default=analytics.CHUNK_ROWS)
+    parser.add_argument("--ha", type=float, default=0, help="days of Home Assistant history to summarize")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    h = history(args.days)
+    path = os.path.join(tmp, "datalog.bin")
+    write_datalog(path, h)
+    n = len(h["time"])
+    print(f"{n} records ({os.path.getsize(path) / 1e6:.1f} MB), {args.days:.0f} days")
+
+    columns, elapsed, peak = measure(lambda: analytics.analyze(path, chunk_rows=args.chunk))
+    print(f"{'vectorized':>11}: {elapsed:6.3f} s, peak {peak / 1e6:6.1f} MB, chunks of {args.chunk}, "
+          f"{len(columns['start'])} days")
+    days, elapsed_py, _ = measure(lambda: per_record(path), traced=False)
+    print(f"{'per record':>11}: {elapsed_py:6.3f} s ({elapsed_py / elapsed:.0f}x slower), "
+          f"all records in lists")
+
+    # the two agree
+    efficiency = np.array([d[0] / d[1] if d[1] else np.nan for d in days.values()])
+    margin = np.array([d[2] for d in days.values()])
+    print(f"largest difference per day: efficiency "
+          f"{np.nanmax(np.abs(efficiency - columns['efficiency_mean'])):.2e}, "
+          f"dew point margin {np.max(np.abs(margin - columns['dew_point_margin_min'])):.2e} C")
+    temp = np.linspace(-30, 40, 1000)
+    hum = np.linspace(1, 100, 1000)
+    error = max(abs(analytics.dew_point(t, rh) - calculate_dew_point(t, rh)) for t, rh in zip(temp, hum))
+    print(f"vectorized dew point vs calculate_dew_point: {error:.1e} C")
+
+    if args.ha:
+        csv_path = os.path.join(tmp, "history.csv")
+        rows = write_ha_csv(csv_path, h, args.ha)
+        columns, elapsed, peak = measure(lambda: analytics.analyze(csv_path, chunk_rows=args.chunk))
+        print(f"{'HA export':>11}: {elapsed:6.3f} s, peak {peak / 1e6:6.1f} MB for {args.ha:.0f} days "
+              f"({rows} samples, {int(columns['samples'].sum())} on the grid)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compare the fixed 100 point calibration sweep with the adaptive sweep on the
+simulated vactrol (host/sim/vactrol_model.py), using simulated time.
+
+Reports sweep time, number of points and how far the fitted coefficients are
+from the true coefficients of the simulated LDRs.
+
+Run from the repository root:
+    python host/bench/bench_calibration.py
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+from machine import Pin  # noqa: E402
+from sim.vactrol_model import VactrolModel  # noqa: E402
+
+TRUE = dict(k1=-1.30, m1=5.20, k2=-1.22, m2=5.10)
+SEEDS = range(5)
+
+
+def run(adaptive, seed):
+    from vactrol import dualVactrol
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+    VactrolModel(vac, seed=seed, **TRUE)
+    t0 = sim.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if adaptive:
+            acc1, acc2, report = vac.run_adaptive_sweep()
+            vac.k1, vac.m1 = acc1.solve()
+            vac.k2, vac.m2 = acc2.solve()
+            points = report["points"]
+        else:
+            vac.calibrate()
+            points = 100
+    seconds = sim.monotonic() - t0
+    errors = {name: getattr(vac, name) - value for name, value in TRUE.items()}
+    return seconds, points, errors
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(dict(k1=0, m1=0, k2=0, m2=0), f)
+    os.chdir(workdir)
+
+    print(f"{'sweep':>9} {'time [s]':>9} {'points':>7} "
+          + " ".join(f"{'|' + name + ' error|':>12}" for name in TRUE))
+    for name, adaptive in (("fixed", False), ("adaptive", True)):
+        results = [run(adaptive, seed) for seed in SEEDS]
+        seconds = sum(r[0] for r in results) / len(results)
+        points = sum(r[1] for r in results) / len(results)
+        errors = [sum(abs(r[2][c]) for r in results) / len(results) for c in TRUE]
+        print(f"{name:>9} {seconds:>9.1f} {points:>7.1f} " + " ".join(f"{e:>12.4f}" for e in errors))
+
+
+if __name__ == "__main__":
+    main()
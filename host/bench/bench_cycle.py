@@ -0,0 +1,125 @@
+"""Time the stages of the control cycle on the host and compare with a baseline.
+
+Runs src/benchmark.py against the simulated vactrol and RDKR (host/sim) in
+virtual time, publishing to the stand-in broker. Stage times are CPU time on
+the host, set_r2 also reports its simulated settle time. Results are written
+as JSON, so a run can be compared with the one of an earlier release, or two
+result files from the board (benchmark.run in the REPL) can be compared.
+
+Run from the repository root:
+    python host/bench/bench_cycle.py --out cycle.json
+    python host/bench/bench_cycle.py --baseline cycle.json
+    python host/bench/bench_cycle.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+# a stage counts as a regression when its median grows by more than this
+TOLERANCE = 0.2
+# true LDR coefficients and the slightly off calibration in config.json
+TRUE = dict(k1=-1.30, m1=5.20, k2=-1.22, m2=5.10)
+CALIBRATED = dict(k1=-1.24, m1=5.10, k2=-1.28, m2=5.18)
+
+
+def clock_us():
+    """Host CPU clock, the simulation clock only moves while waiting"""
+    return time.perf_counter_ns() // 1000
+
+
+def measure(cycles, label):
+    """Benchmark the control cycle on the simulated hardware"""
+    sim.install(virtual_time=True)
+    from machine import Pin
+    from sim.broker import Broker
+    from sim.rdkr_model import RdkrModel
+    from sim.vactrol_model import VactrolModel
+    from sim.weather import SyntheticWeather
+
+    os.chdir(tempfile.mkdtemp())
+    with open("config.json", "w") as f:
+        json.dump(CALIBRATED, f)
+    vactrol = VactrolModel(None, pins=(21, 32, 33), **TRUE)
+    RdkrModel(vactrol, SyntheticWeather(mean_temp=19))
+
+    import benchmark
+    import ha_mqtt
+    from mqtt_robust import MQTTClient
+    from rdkr import Rdkr
+    from vactrol import dualVactrol
+
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+    rdkr = Rdkr(vac, 22, 10000, -750, Pin(15), Pin(27), Pin(26), Pin(25))
+    broker = Broker()
+    MQTTClient.DELAY = 0
+    group = ha_mqtt.setup_mqtt(None, None, "http://192.168.1.2:8266", "127.0.0.1", broker.start())
+    try:
+        return benchmark.run(rdkr, group, cycles, path=None, label=label, clock_us=clock_us)
+    finally:
+        group.mqtt.disconnect()
+        broker.stop()
+
+
+def compare(old, new):
+    """Print the medians of two result dicts, returns the regressed entries"""
+    if old.get("version") != new.get("version"):
+        print(f"results of version {old.get('version')} and {new.get('version')} are not comparable")
+        return []
+    rows = [("cycle", "us", old["cycle_us"], new["cycle_us"])]
+    for stage, r in new["stages"].items():
+        if stage in old["stages"]:
+            for unit in ("us", "bytes"):
+                rows.append((stage, unit, old["stages"][stage][unit], r[unit]))
+    rows.append(("set_r2", "steps", old["set_r2"]["steps"], new["set_r2"]["steps"]))
+    rows.append(("set_r2", "time_ms", old["set_r2"]["time_ms"], new["set_r2"]["time_ms"]))
+
+    print(f"{old.get('label') or 'old':>26} -> {new.get('label') or 'new'}")
+    regressions = []
+    for stage, unit, a, b in rows:
+        a, b = a["median"], b["median"]
+        change = (b - a) / a if a else 0.0
+        flag = ""
+        if change > TOLERANCE and b - a > 1:
+            flag = "  REGRESSION"
+            regressions.append(f"{stage} {unit}")
+        print(f"{stage:>12} {unit:>7}: {a:>10} -> {b:>10} {change:+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--label", default="", help="e.g. the release, stored in the results")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="only compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new) else 0)
+
+    paths = [os.path.abspath(p) if p else None for p in (args.out, args.baseline)]
+    results = measure(args.cycles, args.label)
+    out, baseline = paths
+    if out:
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            print()
+            sys.exit(1 if compare(json.load(f), results) else 0)
+
+
+if __name__ == "__main__":
+    main()
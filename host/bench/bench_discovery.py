@@ -0,0 +1,83 @@
+"""Count the MQTT traffic of Home Assistant discovery against a local broker.
+
+Runs ha_mqtt.setup_mqtt against the stand-in broker in host/sim and reports
+how many discovery configs are published, and how long it takes, on a first
+boot, a reconnect after a broker outage, a reboot, a Home Assistant restart
+(birth message on homeassistant/status) and a changed configuration.
+
+Run from the repository root:
+    python host/bench/bench_discovery.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+from sim.broker import Broker  # noqa: E402
+
+sim.install()
+
+import ha_mqtt  # noqa: E402
+from controller import MAX_MESSAGES  # noqa: E402
+from mqtt_robust import MQTTClient  # noqa: E402
+
+
+def poll(group):
+    """What the controller's mqtt task does"""
+    time.sleep(0.05)
+    for _ in range(MAX_MESSAGES):
+        group.mqtt.check_msg()
+    group.update_discovery()
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    broker = Broker()
+    port = broker.start()
+    MQTTClient.DELAY = 0
+    url = "http://192.168.1.2:8266"
+
+    def step(name, action):
+        configs = len(broker.received("homeassistant/+/+/+/config"))
+        connects = broker.connects
+        t0 = time.monotonic()
+        result = action()
+        ms = (time.monotonic() - t0) * 1000
+        configs = len(broker.received("homeassistant/+/+/+/config")) - configs
+        print(f"{name:>22}: {configs:>3} configs, {broker.connects - connects} connects, {ms:7.1f} ms")
+        return result
+
+    group = step("first boot", lambda: ha_mqtt.setup_mqtt(None, None, url, "127.0.0.1", port))
+    entities = len(group.entities)
+
+    def outage():
+        broker.stop()
+        broker.start()
+        group.mqtt.publish(group.state_topic, b"{}")
+        group.update_discovery()
+    step("reconnect", outage)
+
+    def reboot():
+        group.mqtt.disconnect()
+        return ha_mqtt.setup_mqtt(None, None, url, "127.0.0.1", port)
+    group = step("reboot", reboot)
+
+    def ha_restart():
+        broker.publish("homeassistant/status", "online")
+        poll(group)
+    step("Home Assistant restart", ha_restart)
+
+    def changed():
+        group.mqtt.disconnect()
+        return ha_mqtt.setup_mqtt(None, None, "http://192.168.1.3:8266", "127.0.0.1", port)
+    group = step("changed configuration", changed)
+
+    retained = [m for m in broker.retained.values() if m.topic.endswith("/config")]
+    assert len(retained) == entities
+    print(f"\n{entities} entities, discovery hash {group.discovery_hash().decode()[:16]}...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark set_r2 on a vactrol whose LED dims over months, with and without
+online drift tracking (src/drift.py), on the simulated vactrol and in
+simulated time.
+
+The light of the LED falls linearly by LED_LOSS over the run, on top of a
+daily swing of DAILY_SWING (temperature). The controller asks for a new r2
+every 30 minutes: the rotor on and off resistances and mirrored thermistor
+values in between. Both runs start from an exact calibration.
+
+Run from the repository root:
+    python host/bench/bench_drift.py
+    python host/bench/bench_drift.py --days 365 --loss 0.5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+from machine import Pin  # noqa: E402
+from sim.vactrol_model import VactrolModel  # noqa: E402
+
+TRUE = dict(k1=-1.30, m1=5.20, k2=-1.22, m2=5.10)
+INTERVAL_S = 1800
+DAILY_SWING = 0.05
+# rotor on (10 C) and off (22 C) with the default linear thermistor
+ROTOR_R2 = (19000, 10000)
+
+
+def light(t, days, loss):
+    """log10 light factor of the LED at time t (s)"""
+    trend = 1 - loss * t / (days * 86400)
+    daily = 1 + DAILY_SWING * math.sin(2 * math.pi * t / 86400)
+    return math.log10(trend * daily)
+
+
+def run(days, loss, track, seed=1):
+    from drift import VactrolDrift
+    from vactrol import dualVactrol
+    with open("config.json", "w") as f:
+        json.dump(TRUE, f)
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+    model = VactrolModel(vac, seed=seed, **TRUE)
+    model.settle()
+    saves = []
+    if track:
+        drift = VactrolDrift(vac)
+        save = vac.save_calibration
+        vac.save_calibration = lambda: (saves.append(sim.monotonic()), save())
+
+    rng = random.Random(seed)
+    t0 = sim.monotonic()
+    months = []
+    month = None
+    for i in range(int(days * 86400 / INTERVAL_S)):
+        t = sim.monotonic() - t0
+        d = light(t, days, loss)
+        for ldr, k, m in ((model.ldr1, TRUE["k1"], TRUE["m1"]), (model.ldr2, TRUE["k2"], TRUE["m2"])):
+            ldr.m = m + k * d
+        r2 = ROTOR_R2[i % 2] if rng.random() < 0.6 else rng.uniform(8000, 25000)
+
+        vac.set_r2(r2)
+        regulation = vac.regulation
+        if month is None or t >= 30 * 86400 * (len(months)):
+            month = dict(steps=0, time_ms=0, error=0.0, n=0, converged=0, light=0.0)
+            months.append(month)
+        month["steps"] += regulation["steps"]
+        month["time_ms"] += regulation["time_ms"]
+        month["error"] += abs(model.r2() - r2) / r2
+        month["converged"] += bool(regulation["converged"])
+        month["n"] += 1
+        month["light"] = (10**d - 1) * 100
+        month["drift"] = drift.percent() if track else None
+        sim.clock.advance(INTERVAL_S)
+    return months, saves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=180)
+    parser.add_argument("--loss", type=float, default=0.3, help="LED light lost over the run")
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    print(f"{'tracking':>8} {'month':>5} {'light':>7} {'drift':>7} {'steps':>6} {'time [s]':>9} "
+          f"{'r2 error':>9} {'converged':>10}")
+    for track in (False, True):
+        months, saves = run(args.days, args.loss, track)
+        for i, m in enumerate(months):
+            n = m["n"]
+            drift = f"{m['drift']:6.1f}%" if m["drift"] is not None else f"{'-':>7}"
+            print(f"{'yes' if track else 'no':>8} {i + 1:>5} {m['light']:6.1f}% {drift} "
+                  f"{m['steps'] / n:>6.2f} {m['time_ms'] / n / 1000:>9.2f} "
+                  f"{m['error'] / n:>8.2%} {m['converged']:>5}/{n}")
+        total = sum(m["time_ms"] for m in months) / 1000
+        steps = sum(m["steps"] for m in months) / sum(m["n"] for m in months)
+        print(f"{'yes' if track else 'no':>8} total: {steps:.2f} steps per set_r2, {total:.0f} s "
+              f"regulating, {len(saves)} config.json writes\n")
+
+
+if __name__ == "__main__":
+    main()
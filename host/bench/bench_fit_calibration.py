@@ -0,0 +1,147 @@
+"""Compare host/fit_calibration.py with the on-board fit of calibration sweeps.
+
+The board (dualVactrol.linear_regression) cuts the saturated ends of the
+sweep by counting the points at the highest and lowest resistance and fits
+the rest by least squares. fit_calibration finds the linear range with RANSAC
+and fits it with Huber regression. Both fit:
+
+- sweeps of the simulated vactrol (host/sim/vactrol_model.py), as they are
+  and with faults added: an open circuit (inf, logged as LOG_R_MAX) and a
+  spike in the middle of the sweep
+- --sweeps synthetic sweeps of LDRs with random coefficients, most of them
+  saturating at the dark or the bright end of the sweep, with noise growing
+  with the resistance and a share of them with faults
+
+and the errors of k1, m1, k2, m2 from the true coefficients are reported,
+with the time fit_calibration takes for the whole batch and for reading
+calibration.csv files.
+
+Run from the repository root:
+    python host/bench/bench_fit_calibration.py
+    python host/bench/bench_fit_calibration.py --sweeps 10000
+
+Needs NumPy (pip install numpy).
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+import fit_calibration  # noqa: E402
+from machine import Pin  # noqa: E402
+from sim.vactrol_model import LOG_R_DARK, LOG_R_MIN, VactrolModel  # noqa: E402
+from vactrol import dualVactrol  # noqa: E402
+
+TRUE = dict(k1=-1.30, m1=5.20, k2=-1.22, m2=5.10)
+SEEDS = range(3)
+# share of the synthetic sweeps with faults
+FAULTY = 0.3
+
+
+def add_faults(sweep, rng):
+    """An open circuit on each LDR and a spike on LDR 1 in the middle of the sweep"""
+    sweep = sweep.copy()
+    n = len(sweep)
+    middle = rng.integers(n // 3, 2 * n // 3, 3)
+    sweep[middle[0], 1] = fit_calibration.LOG_R_MAX
+    sweep[middle[1], 2] = fit_calibration.LOG_R_MAX
+    sweep[middle[2], 1] += 0.5
+    return sweep
+
+
+def simulated_sweep(seed):
+    """(100, 3) sweep of the simulated vactrol with the TRUE coefficients"""
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17, config=dict())
+    VactrolModel(vac, seed=seed, **TRUE)
+    return np.array(vac.run_calibration_sweep()).T
+
+
+def synthetic_sweeps(n, points=100, seed=1):
+    """(n, points, 3) sweeps and the (n, 4) true k1, m1, k2, m2"""
+    rng = np.random.default_rng(seed)
+    # k1, m1, k2, m2, intercepts up to the dark resistance and beyond
+    true = np.column_stack([rng.normal(-1.3, 0.1, n), rng.uniform(4.4, 7.0, n),
+                            rng.normal(-1.3, 0.1, n), rng.uniform(4.4, 7.0, n)])
+    x = np.broadcast_to(np.arange(points) * 2 / points, (n, points))
+    data = np.empty((n, points, 3))
+    data[:, :, 0] = x
+    for i, (k, m) in enumerate(((true[:, 0], true[:, 1]), (true[:, 2], true[:, 3]))):
+        y = np.clip(m[:, None] + k[:, None] * x, LOG_R_MIN, LOG_R_DARK)
+        # the ADC resolves high resistances worse
+        data[:, :, i + 1] = y + rng.normal(0, 0.003 * 10 ** (0.5 * (y - 4)))
+    for i in np.flatnonzero(rng.random(n) < FAULTY):
+        data[i] = add_faults(data[i], rng)
+    return data, true
+
+
+def on_board(sweep):
+    """k1, m1, k2, m2 of dualVactrol.linear_regression"""
+    coefficients = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for column in (1, 2):
+            k, m = dualVactrol.linear_regression(None, list(sweep[:, 0]), list(sweep[:, column]), 0.1, 100)
+            coefficients += [k, m]
+    return np.array(coefficients)
+
+
+def errors(fitted, true):
+    """Median and largest absolute error per coefficient"""
+    e = np.abs(fitted - true)
+    return np.nanmedian(e, axis=0), np.nanmax(e, axis=0)
+
+
+def report(name, fitted, true):
+    median, worst = errors(fitted, true)
+    print(f"{name:>26} " + " ".join(f"{m:>7.4f}/{w:<7.4f}" for m, w in zip(median, worst)))
+
+
+def fitted(columns):
+    return np.column_stack([columns[name] for name in fit_calibration.COEFFICIENTS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sweeps", type=int, default=5000)
+    parser.add_argument("--csv", type=int, default=1000, help="calibration.csv files to read")
+    args = parser.parse_args()
+
+    print(f"{'error median/max':>26} " + " ".join(f"{name:>15}" for name in fit_calibration.COEFFICIENTS))
+    rng = np.random.default_rng(1)
+    clean = np.array([simulated_sweep(seed) for seed in SEEDS])
+    faulty = np.array([add_faults(sweep, rng) for sweep in clean])
+    true = np.array([[TRUE[name] for name in fit_calibration.COEFFICIENTS]] * len(SEEDS))
+    for name, data in (("simulated", clean), ("simulated, faults", faulty)):
+        report(f"{name}: board", np.array([on_board(sweep) for sweep in data]), true)
+        report(f"{name}: robust", fitted(fit_calibration.fit(data)), true)
+
+    data, true = synthetic_sweeps(args.sweeps)
+    t0 = time.perf_counter()
+    columns = fit_calibration.fit(data)
+    elapsed = time.perf_counter() - t0
+    board = 200
+    report(f"{board} synthetic: board", np.array([on_board(sweep) for sweep in data[:board]]), true[:board])
+    report(f"{args.sweeps} synthetic: robust", fitted(columns), true)
+    print(f"fit_calibration: {args.sweeps} sweeps in {elapsed:.2f} s")
+
+    tmp = tempfile.mkdtemp()
+    paths = []
+    for i in range(min(args.csv, args.sweeps)):
+        paths.append(os.path.join(tmp, f"calibration_{i}.csv"))
+        np.savetxt(paths[-1], data[i], delimiter=",")
+    t0 = time.perf_counter()
+    fit_calibration.load(paths)
+    print(f"read {len(paths)} calibration.csv files in {time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Time the rolling statistics of the sensor history (src/history.py).
+
+Adds a week of sensor reads every 10 s (60480 snapshots of the 9 keys) to a
+history.History and compares, per ring size:
+
+- rolling: Ring.add, min/mean/max/slope kept up to date per sample
+- recompute: the same statistics computed from a list of the last samples
+  on every query, the way a history without rolling sums would work
+
+Both are queried once per sample (the strategy runs every 30 s, so this is
+the worst case). Also checks that the rolling statistics match the
+recomputed ones and reports the memory of the rings.
+
+Run from the repository root:
+    python host/bench/bench_history.py
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+from history import History, Ring  # noqa: E402
+from sensors import Snapshot  # noqa: E402
+
+SAMPLE_S = 10
+DAYS = 7
+N = 20000
+
+
+def recompute(window, period_s):
+    """min, mean, max and slope per hour of a list of samples"""
+    n = len(window)
+    mean = sum(window) / n
+    sx = (n - 1) / 2
+    slope = sum((i - sx) * (y - mean) for i, y in enumerate(window)) / sum((i - sx) ** 2 for i in range(n))
+    return min(window), mean, max(window), slope * 3600 / period_s
+
+
+def readings(n, seed=1):
+    """Fresh air temperature in tenths, a daily cycle with noise"""
+    rng = random.Random(seed)
+    return [int(round(10 * (15 + 5 * math.sin(2 * math.pi * i * SAMPLE_S / 86400) + rng.gauss(0, 0.2))))
+            for i in range(n)]
+
+
+def main():
+    samples = readings(N)
+    print(f"{N} samples, statistics queried after each")
+    for size in (16, 64, 180, 255):
+        ring = Ring(size, 10, SAMPLE_S)
+        t0 = time.perf_counter()
+        for y in samples:
+            ring.add(y)
+            ring.min(), ring.mean(), ring.max(), ring.slope()
+        rolling = (time.perf_counter() - t0) / N * 1e6
+
+        window = list()
+        t0 = time.perf_counter()
+        for y in samples:
+            window.append(y / 10)
+            if len(window) > size:
+                window.pop(0)
+            if len(window) > 1:
+                expected = recompute(window, SAMPLE_S)
+        recomputed = (time.perf_counter() - t0) / N * 1e6
+        # compare after the last sample
+        got = (ring.min(), ring.mean(), ring.max(), ring.slope())
+        error = max(abs(a - b) for a, b in zip(got, expected))
+        print(f"ring of {size:3}: rolling {rolling:5.1f} us, recompute {recomputed:6.1f} us per sample, "
+              f"largest difference {error:.1e}")
+
+    history = History(sample_s=SAMPLE_S)
+    n = DAYS * 86400 // SAMPLE_S
+    fresh = readings(n, seed=2)
+    t0 = time.perf_counter()
+    for i in range(n):
+        values = {key: 21.0 for key in history.keys}
+        values["fresh_air_temp"] = fresh[i] / 10
+        values["r2"] = 10000.0
+        history.add(Snapshot(values, [], time.ticks_add(0, i * SAMPLE_S * 1000)))
+    elapsed = time.perf_counter() - t0
+    rings = [ring for key_rings in history.rings.values() for ring in key_rings]
+    size = sum(len(ring.values) * 2 + len(ring._min) + len(ring._max) for ring in rings)
+    print(f"History: {n} snapshots in {elapsed:.2f} s, {len(rings)} rings, {size / 1024:.1f} kB of arrays")
+    for resolution in history.resolutions:
+        ring = history.get("fresh_air_temp", resolution)
+        print(f"  fresh air {resolution:>5}: {len(ring):3} samples, min {ring.min():5.1f} "
+              f"mean {ring.mean():5.1f} max {ring.max():5.1f} C, slope {ring.slope():+6.2f} C/h")
+
+
+if __name__ == "__main__":
+    main()
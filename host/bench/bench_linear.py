@@ -0,0 +1,58 @@
+"""Benchmark the least-squares solver of linear.linearRegressor against the
+gradient descent loop on synthetic log(PWM)/log(R) calibration sweeps.
+
+Run from the repository root:
+    python host/bench/bench_linear.py
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from linear import linearRegressor  # noqa: E402
+
+# typical coefficients of a LDR in the feedback vactrol
+K = -1.3
+M = 5.2
+
+
+def make_sweep(n_points, noise=0.01, seed=1):
+    rnd = random.Random(seed)
+    log_pwm = [2 * i / n_points for i in range(n_points)]
+    log_r = [K * x + M + rnd.gauss(0, noise) for x in log_pwm]
+    return log_pwm, log_r
+
+
+def run(solver, X, y, max_iter):
+    reg = linearRegressor(max_iter=max_iter, lr=0.1, solver=solver)
+    # the gradient descent loop prints every iteration, keep it out of the timing output
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        reg.fit(X, y)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return reg, elapsed, peak
+
+
+def main():
+    print(f"{'points':>7} {'solver':>6} {'time [ms]':>10} {'peak alloc [kB]':>16} "
+          f"{'k':>8} {'m':>8} {'R2':>7}")
+    for n_points in (100, 10_000):
+        X, y = make_sweep(n_points)
+        for solver in ("gd", "lstsq"):
+            reg, elapsed, peak = run(solver, X, y, max_iter=100)
+            m, k = reg.coeficients
+            print(f"{n_points:>7} {solver:>6} {elapsed * 1000:>10.2f} {peak / 1024:>16.1f} "
+                  f"{k:>8.4f} {m:>8.4f} {reg.r_squared:>7.4f}")
+    print(f"true coefficients: k={K}, m={M}")
+
+
+if __name__ == "__main__":
+    main()
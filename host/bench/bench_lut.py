@@ -0,0 +1,108 @@
+"""Compare ways to get the set_r2 feed-forward for a target resistance.
+
+The feed-forward (dualVactrol._feed_forward_row) turns r2 into the starting
+log_pwm, the log10 LSR1 target and its tolerance bounds: three log10, one
+pow and a few divisions. Timed per call for random targets:
+
+- math: _feed_forward_row
+- cached: dualVactrol.feed_forward for a repeated target (rotor on/off)
+- table: a lookup table in array('f') keyed by the calibration, 250 Ohm
+  grid with linear interpolation, indexed with floats and with integers
+
+Also reports the interpolation error of the table.
+
+Run from the repository root:
+    python host/bench/bench_lut.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+from machine import Pin  # noqa: E402
+
+COEFFICIENTS = dict(k1=-1.3, m1=5.2, k2=-1.25, m2=5.15)
+N = 20000
+R_MIN = 2000
+R_MAX = 40000
+R_STEP = 250
+
+
+class FeedForwardTable:
+    """Feed-forward rows on a uniform r2 grid, one array('f') per column"""
+
+    def __init__(self, row, lo=R_MIN, hi=R_MAX, step=R_STEP):
+        self.lo = lo
+        self.step = step
+        self.n = (hi - lo) // step + 1
+        self.columns = [array("f", [0.0] * self.n) for _ in range(4)]
+        for i in range(self.n):
+            for column, v in zip(self.columns, row(lo + i * step)):
+                column[i] = v
+
+    def lookup(self, r2):
+        pos = (r2 - self.lo) / self.step
+        i = int(pos)
+        frac = pos - i
+        a, b, c, d = self.columns
+        return (a[i] + (a[i + 1] - a[i]) * frac, b[i] + (b[i + 1] - b[i]) * frac,
+                c[i] + (c[i + 1] - c[i]) * frac, d[i] + (d[i + 1] - d[i]) * frac)
+
+    def lookup_int(self, r2):
+        """Integer r2, grid position by integer division"""
+        i, rem = divmod(r2 - self.lo, self.step)
+        frac = rem / self.step
+        a, b, c, d = self.columns
+        return (a[i] + (a[i + 1] - a[i]) * frac, b[i] + (b[i + 1] - b[i]) * frac,
+                c[i] + (c[i + 1] - c[i]) * frac, d[i] + (d[i + 1] - d[i]) * frac)
+
+
+def per_call_us(f, values):
+    t0 = time.perf_counter()
+    for v in values:
+        f(v)
+    return (time.perf_counter() - t0) / len(values) * 1e6
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    with open("config.json", "w") as f:
+        json.dump(COEFFICIENTS, f)
+    from vactrol import dualVactrol
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+
+    t0 = time.perf_counter()
+    table = FeedForwardTable(vac._feed_forward_row)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    rng = random.Random(1)
+    floats = [rng.uniform(R_MIN, R_MAX - 1) for _ in range(N)]
+    ints = [int(r) for r in floats]
+    # what the controller asks for with the rotor forced on or off
+    repeated = [19000.0, 10000.0] * (N // 2)
+
+    print(f"{'math':>16}: {per_call_us(vac._feed_forward_row, floats):5.2f} us/call")
+    print(f"{'cached':>16}: {per_call_us(vac.feed_forward, repeated):5.2f} us/call")
+    print(f"{'table (float)':>16}: {per_call_us(table.lookup, floats):5.2f} us/call")
+    print(f"{'table (int)':>16}: {per_call_us(table.lookup_int, ints):5.2f} us/call")
+    print(f"table: {table.n} rows, {table.n * 4 * 4} bytes, built in {build_ms:.1f} ms")
+
+    worst = [0.0] * 4
+    for r in floats:
+        for i, (a, b) in enumerate(zip(vac._feed_forward_row(r), table.lookup(r))):
+            worst[i] = max(worst[i], abs(a - b))
+    print(f"table error in log10: log_pwm {worst[0]:.1e}, LSR1 target {worst[1]:.1e}, "
+          f"tolerance bounds {max(worst[2:]):.1e} "
+          f"({(10 ** (worst[0] * abs(vac.k2)) - 1) * 100:.2f} % of r2)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Compare the asyncio MQTT client (src/mqtt_async.py) with mqtt_robust
+against the local stand-in broker, over a link with a round trip of --rtt.
+
+- QoS 1 throughput: mqtt_robust waits for every PUBACK, mqtt_async keeps up
+  to WINDOW publishes in flight.
+- Broker outage: publishes are in flight when the broker stops. mqtt_robust
+  blocks the event loop for DELAY on every failed reconnect, mqtt_async backs
+  off in its own task and sends the unacknowledged publishes again after
+  the reconnect.
+- Reconnects: how often the broker name is resolved (mDNS on the board,
+  emulated with a delay of --resolve seconds).
+
+Run from the repository root:
+    python host/bench/bench_mqtt_async.py
+    python host/bench/bench_mqtt_async.py --rtt 0.05 --messages 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+from sim.broker import Broker  # noqa: E402
+
+sim.install()
+
+import mqtt_async  # noqa: E402
+import mqtt_robust  # noqa: E402
+import usocket  # noqa: E402
+
+HOST = "homeassistant.local"
+
+
+class Resolver:
+    """usocket.getaddrinfo that counts its calls and takes `delay` seconds"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self._getaddrinfo = usocket.getaddrinfo
+
+    def __call__(self, *args):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self._getaddrinfo(*args)
+
+
+async def heartbeat(stalls, period=0.005):
+    """Record how late a task that wakes every period gets to run"""
+    while True:
+        t0 = time.monotonic()
+        await asyncio.sleep(period)
+        stalls.append(time.monotonic() - t0 - period)
+
+
+async def wait_until(condition, timeout=30):
+    t0 = time.monotonic()
+    while not condition():
+        if time.monotonic() - t0 > timeout:
+            raise TimeoutError("condition not met")
+        await asyncio.sleep(0.001)
+
+
+def payload(i):
+    return bytes(f"{i:05d}", "utf-8")
+
+
+def robust_throughput(broker, n):
+    mqtt = mqtt_robust.MQTTClient(b"RDKR_robust", HOST, broker.port, keepalive=600)
+    mqtt.connect(False)
+    t0 = time.monotonic()
+    for i in range(n):
+        assert mqtt.publish(b"bench/robust", payload(i), False, 1)
+    elapsed = time.monotonic() - t0
+    mqtt.disconnect()
+    return elapsed
+
+
+async def async_throughput(broker, n):
+    mqtt = mqtt_async.MQTTClient(b"RDKR_async", HOST, broker.port, keepalive=600)
+    task = asyncio.create_task(mqtt.run())
+    stalls = []
+    beat = asyncio.create_task(heartbeat(stalls))
+    await wait_until(lambda: mqtt.connected)
+    t0 = time.monotonic()
+    for i in range(n):
+        # window full: the caller would queue the message, here it waits
+        while not mqtt.publish(b"bench/async", payload(i), False, 1):
+            await asyncio.sleep(0.001)
+    await wait_until(lambda: not mqtt.inflight)
+    elapsed = time.monotonic() - t0
+    mqtt.disconnect()
+    task.cancel()
+    beat.cancel()
+    return elapsed, max(stalls)
+
+
+def robust_outage(broker):
+    """Time a single reconnect of mqtt_robust blocks while the broker is down"""
+    mqtt = mqtt_robust.MQTTClient(b"RDKR_robust", HOST, broker.port, keepalive=600)
+    mqtt.connect(False)
+    broker.stop()
+    t0 = time.monotonic()
+    mqtt.reconnect()
+    blocked = time.monotonic() - t0
+    broker.start()
+    return blocked
+
+
+async def async_outage(broker, outage_s):
+    mqtt = mqtt_async.MQTTClient(b"RDKR_outage", HOST, broker.port, keepalive=600)
+    mqtt.BACKOFF_MIN = 0.1
+    task = asyncio.create_task(mqtt.run())
+    await wait_until(lambda: mqtt.connected)
+    stalls = []
+    beat = asyncio.create_task(heartbeat(stalls))
+    before = len(broker.received("bench/outage"))
+    n = mqtt.WINDOW
+    for i in range(n):
+        assert mqtt.publish(b"bench/outage", payload(i), False, 1)
+    # the PUBACKs are still on their way when the broker goes down
+    await asyncio.sleep(0)
+    broker.stop()
+    attempts = mqtt.attempts
+    await asyncio.sleep(outage_s)
+    attempts = mqtt.attempts - attempts
+    broker.start()
+    t0 = time.monotonic()
+    await wait_until(lambda: mqtt.connected and not mqtt.inflight)
+    recovered = time.monotonic() - t0
+    received = [m.payload for m in broker.received("bench/outage")[before:]]
+    missing = n - len(set(received))
+    mqtt.disconnect()
+    task.cancel()
+    beat.cancel()
+    return dict(attempts=attempts, recovered=recovered, stall=max(stalls), missing=missing,
+                duplicates=len(received) - len(set(received)))
+
+
+def robust_reconnects(broker, resolver, drops):
+    mqtt = mqtt_robust.MQTTClient(b"RDKR_robust", HOST, broker.port, keepalive=600)
+    mqtt.connect(False)
+    calls = resolver.calls
+    for i in range(drops):
+        broker.stop()
+        broker.start()
+        assert mqtt.publish(b"bench/robust", payload(i), False, 1)
+    mqtt.disconnect()
+    return resolver.calls - calls
+
+
+async def async_reconnects(broker, resolver, drops):
+    mqtt = mqtt_async.MQTTClient(b"RDKR_async", HOST, broker.port, keepalive=600)
+    task = asyncio.create_task(mqtt.run())
+    await wait_until(lambda: mqtt.connected)
+    calls = resolver.calls
+    for i in range(drops):
+        attempts = mqtt.attempts
+        broker.stop()
+        broker.start()
+        await wait_until(lambda: mqtt.attempts > attempts and mqtt.connected)
+        assert mqtt.publish(b"bench/async", payload(i), False, 1)
+        await wait_until(lambda: not mqtt.inflight)
+    mqtt.disconnect()
+    task.cancel()
+    return resolver.calls - calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt", type=float, default=0.02, help="round trip time of the link in s")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--outage", type=float, default=3, help="broker outage in s")
+    parser.add_argument("--drops", type=int, default=5, help="connection drops")
+    parser.add_argument("--resolve", type=float, default=0.2, help="time to resolve the broker name in s")
+    args = parser.parse_args()
+
+    broker = Broker(delay=args.rtt)
+    usocket.HOSTS[HOST] = ("127.0.0.1", broker.start())
+    resolver = Resolver(args.resolve)
+    usocket.getaddrinfo = resolver
+    try:
+        n = args.messages
+        print(f"{n} QoS 1 publishes, {args.rtt * 1000:.0f} ms round trip")
+        elapsed = robust_throughput(broker, n)
+        print(f"{'mqtt_robust':>12}: {elapsed:6.2f} s, {n / elapsed:6.0f} msg/s, "
+              f"the event loop is blocked throughout")
+        elapsed, stall = asyncio.run(async_throughput(broker, n))
+        print(f"{'mqtt_async':>12}: {elapsed:6.2f} s, {n / elapsed:6.0f} msg/s, "
+              f"window {mqtt_async.MQTTClient.WINDOW}, longest event loop stall {stall * 1000:.0f} ms")
+
+        print(f"\nbroker outage of {args.outage:.0f} s")
+        blocked = robust_outage(broker)
+        print(f"{'mqtt_robust':>12}: every failed reconnect blocks the event loop for {blocked:.2f} s")
+        r = asyncio.run(async_outage(broker, args.outage))
+        print(f"{'mqtt_async':>12}: {r['attempts']} connect attempts with backoff, "
+              f"longest event loop stall {r['stall'] * 1000:.0f} ms, reconnected and acknowledged "
+              f"{r['recovered']:.2f} s after the broker returned, {r['missing']} lost, "
+              f"{r['duplicates']} sent twice")
+
+        print(f"\n{args.drops} connection drops, {args.resolve * 1000:.0f} ms per name resolution")
+        calls = robust_reconnects(broker, resolver, args.drops)
+        print(f"{'mqtt_robust':>12}: {calls} resolutions, {calls * args.resolve:.2f} s blocked")
+        calls = asyncio.run(async_reconnects(broker, resolver, args.drops))
+        print(f"{'mqtt_async':>12}: {calls} resolutions, {calls * args.resolve:.2f} s blocked")
+    finally:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
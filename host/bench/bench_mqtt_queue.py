@@ -0,0 +1,93 @@
+"""Check the offline publish queue against a local stand-in broker.
+
+Publishes states through mqtt_queue.StateQueue with the real mqtt_robust
+client, stops the broker for an outage, restarts it and checks that the
+backlog arrives on the history topic in order, without duplicates, and that
+only states beyond the queue bounds were evicted. Reports how long the
+replay took.
+
+Run from the repository root:
+    python host/bench/bench_mqtt_queue.py [outage states]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+from sim.broker import Broker  # noqa: E402
+
+sim.install()
+
+from ha_mqtt import EntityGroup  # noqa: E402
+from mqtt_queue import StateQueue  # noqa: E402
+from mqtt_robust import MQTTClient  # noqa: E402
+
+PUBLISH_INTERVAL_S = 120
+
+
+def state(i):
+    return dict(fresh_air_temp=str(round(5 + i * 0.01, 2)), rotor_state="on", n=str(i))
+
+
+def main():
+    outage = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    spill_path = os.path.join(workdir, "mqtt_queue.jsonl")
+
+    broker = Broker()
+    port = broker.start()
+    MQTTClient.DELAY = 0
+    mqtt = MQTTClient(b"RDKR_bench", "127.0.0.1", port, keepalive=600)
+    mqtt.connect()
+    group = EntityGroup(mqtt, b"RDKR_bench", extra_conf=dict())
+    queue = StateQueue(group, ram_size=16, spill_path=spill_path, spill_size=120, batch_size=8)
+
+    t = int(time.time()) - (outage + 10) * PUBLISH_INTERVAL_S
+    n = 0
+    for _ in range(5):
+        assert queue.publish_state(state(n), t)
+        n += 1
+        t += PUBLISH_INTERVAL_S
+
+    broker.stop()
+    first_queued = n
+    t0 = time.monotonic()
+    for _ in range(outage):
+        queue.publish_state(state(n), t)
+        n += 1
+        t += PUBLISH_INTERVAL_S
+    offline_ms = (time.monotonic() - t0) * 1000 / outage
+    depth = len(queue)
+    print(f"outage of {outage} states: queue depth {depth} "
+          f"({len(queue.ram)} in RAM, {queue.spilled} on flash), {queue.dropped} evicted, "
+          f"{offline_ms:.1f} ms per offline publish")
+
+    broker.start()
+    t0 = time.monotonic()
+    assert queue.publish_state(state(n), t)
+    replay_ms = (time.monotonic() - t0) * 1000
+    time.sleep(0.2)
+    broker.stop()
+
+    live = [json.loads(m.payload)["n"] for m in broker.received("homeassistant/sensor/RDKR_bench/state")]
+    batches = broker.received("homeassistant/sensor/RDKR_bench/state/history")
+    history = [s for m in batches for s in json.loads(m.payload)]
+    replayed = [int(s["n"]) for s in history]
+    timestamps = [s["ts"] for s in history]
+
+    assert live == [str(i) for i in range(first_queued)] + [str(n)], live
+    assert replayed == sorted(set(replayed)), "replay out of order or duplicated"
+    assert timestamps == sorted(timestamps)
+    # the newest states survive, eviction only takes the oldest ones
+    assert replayed == list(range(n - len(replayed), n)), replayed
+    assert len(replayed) + queue.dropped == outage
+    assert len(queue) == 0 and not os.path.exists(spill_path)
+    print(f"replayed {len(replayed)} states in {len(batches)} batches in {replay_ms:.0f} ms, "
+          f"{queue.dropped} evicted, {broker.connects} broker connects")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the power modes of the controller (src/power.py) in the simulator.
+
+Runs the whole controller (boot.py and main.py) for --days of simulated time
+without a power mode and with "modem" (Wi-Fi power save between the tasks),
+both with Wi-Fi, and with "light" (light sleep between the tasks) without
+Wi-Fi, for each wake latency of --wake. The controller with Wi-Fi does not
+light sleep, it would lose the link every time. Reported per run:
+
+- awake: share of the time the ESP32 is not in light sleep
+- sleeps: light sleeps, each one costs a wake latency
+- late: longest delay of a task start behind its schedule; raise
+  PowerManager.WAKE_MARGIN_MS when it grows with the wake latency
+- drops: Wi-Fi associations lost in light sleep, which must stay 0
+- current: rough mean supply current of the ESP32 from typical figures
+  (CURRENT_MA), to compare the modes rather than to size a supply
+- rotor on and the deviation from the aim temperature, which must not change
+
+Run from the repository root:
+    python host/bench/bench_power.py
+    python host/bench/bench_power.py --days 1 --wake 2 20 100 --margin 5
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+import power  # noqa: E402
+from sim.simulation import Simulation  # noqa: E402
+from sim.weather import SyntheticWeather  # noqa: E402
+
+# typical ESP32 supply current in mA while awake with Wi-Fi connected, by
+# WLAN power management mode, awake with Wi-Fi off, and in light sleep
+CURRENT_MA = dict(none=100, performance=40, powersave=25, wifi_off=20, light_sleep=1.5)
+
+
+def current(result, latency_ms, wifi=True):
+    """Mean supply current in mA of a simulation result"""
+    report = result.get("power")
+    if report is None:
+        # Wi-Fi in the firmware's default power management throughout
+        return CURRENT_MA["performance"]
+    if wifi:
+        total_s = result["days"] * 86400
+        save = min(report["wifi_power_save_s"] / total_s, 1.0)
+        awake_ma = save * CURRENT_MA["powersave"] + (1 - save) * CURRENT_MA["none"]
+    else:
+        awake_ma = CURRENT_MA["wifi_off"]
+    active = report["active_ms"] + report["sleeps"] * latency_ms
+    awake = min(active / max(report["active_ms"] + report["sleep_ms"], 1), 1.0)
+    return awake * awake_ma + (1 - awake) * CURRENT_MA["light_sleep"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=0.25)
+    parser.add_argument("--temp", type=float, default=5, help="mean outdoor temperature in C")
+    parser.add_argument("--wake", type=int, nargs="+", default=[2, 20, 100],
+                        help="light sleep wake latencies in ms")
+    parser.add_argument("--margin", type=int, default=power.PowerManager.WAKE_MARGIN_MS,
+                        help="PowerManager.WAKE_MARGIN_MS")
+    parser.add_argument("--broker", action="store_true", help="publish to the stand-in broker (slower)")
+    args = parser.parse_args()
+    power.PowerManager.WAKE_MARGIN_MS = args.margin
+
+    runs = [(None, 0), ("modem", 0)] + [("light", wake) for wake in args.wake]
+    print(f"{args.days} days at {args.temp} C, wake margin {args.margin} ms")
+    print(f"{'mode':>6} {'wake [ms]':>9} {'awake':>7} {'sleeps':>7} {'late [ms]':>9} {'drops':>6} "
+          f"{'current [mA]':>12} {'rotor on [h]':>12} {'deviation [Kh]':>14}")
+    for mode, wake in runs:
+        config = dict(power=mode) if mode else dict()
+        wifi = mode != "light"
+        if not wifi:
+            # no ssid, the controller runs without Wi-Fi and MQTT
+            config["ssid"] = None
+        result = Simulation(SyntheticWeather(mean_temp=args.temp), days=args.days, config=config,
+                            wifi=wifi, broker=args.broker and wifi, wake_latency_ms=wake).run()
+        report = result.get("power") or dict(awake_percent=100.0, sleeps=0, late_ms=0, wifi_drops=0)
+        print(f"{mode or 'off':>6} {wake if mode == 'light' else '-':>9} "
+              f"{report['awake_percent']:>6.1f}% {report['sleeps']:>7} {report['late_ms']:>9} "
+              f"{report['wifi_drops']:>6} "
+              f"{current(result, wake, wifi):>12.1f} {result['rotor_on_h']:>12.2f} "
+              f"{result['deviation_kh']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
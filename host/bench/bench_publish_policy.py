@@ -0,0 +1,134 @@
+"""Compare the MQTT traffic of full JSON states with the publish policy.
+
+Feeds a synthetic day of sensor values (daily temperature and humidity swing
+plus DHT22-like noise) through the Home Assistant entities of
+ha_mqtt.setup_mqtt with a client that only counts messages and bytes. The
+old behaviour, a JSON state every 120 s, is compared with the publish policy
+evaluated every 10 s. Also reports the largest difference between a value,
+sampled every 10 s, and the last published one, and the messages of the
+first connect (discovery configs and command subscriptions), which are the
+same for all of them.
+
+Run from the repository root:
+    python host/bench/bench_publish_policy.py
+"""
+import math
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+import time  # noqa: E402
+
+import ha_mqtt  # noqa: E402
+import mqtt_robust  # noqa: E402
+from publish_policy import PublishPolicy  # noqa: E402
+
+DAY_S = 86400
+# sensors are read every 10 s
+STEP_S = 10
+
+
+class CountingMQTT:
+    """Stands in for mqtt_robust.MQTTClient, counts what would be sent"""
+
+    on_connect = None
+    connected = True
+
+    def __init__(self, *args, **kwargs):
+        self.messages = 0
+        self.bytes = 0
+
+    def set_callback(self, f):
+        pass
+
+    def connect(self, clean_session=True):
+        if self.on_connect is not None:
+            self.on_connect(True)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self.messages += 1
+        # fixed header, topic length, packet id
+        self.bytes += 2 + 2 + len(topic) + len(msg) + (2 if qos else 0)
+        return True
+
+    def subscribe(self, topic, qos=0):
+        self.messages += 1
+        # fixed header, packet id, topic length, requested QoS
+        self.bytes += 2 + 2 + 2 + len(topic) + 1
+
+    def check_msg(self):
+        return None
+
+
+def payload(t, rng):
+    """Sensor payload as published by the controller at time t"""
+    day = math.sin(2 * math.pi * t / DAY_S)
+    values = dict()
+    for i, name in enumerate(("fresh_air", "supply_air", "return_air", "exhaust_air")):
+        base = 5 + 5 * i
+        values[f"{name}_temp"] = round(base + (6 - i) * day + rng.gauss(0, 0.05), 1)
+        values[f"{name}_hum"] = round(50 - 10 * day + rng.gauss(0, 0.3), 1)
+    values["r2"] = 10000 - 750 * (values["fresh_air_temp"] - 22) + rng.gauss(0, 30)
+    state = {k: str(v) for k, v in values.items()}
+    state.update(dict(stale="", rotor_state="on", strategy_state="rotor on", queue_depth="0"))
+    return state
+
+
+def run(publish_s, policy):
+    # a first boot, the discovery configs were never announced
+    if os.path.exists(ha_mqtt.DISCOVERY_HASH_PATH):
+        os.remove(ha_mqtt.DISCOVERY_HASH_PATH)
+    group = ha_mqtt.setup_mqtt(None, None, "http://192.168.1.2:8266")
+    mqtt = group.mqtt
+    connect = (mqtt.messages, mqtt.bytes)
+    mqtt.messages = mqtt.bytes = 0
+    rng = random.Random(1)
+    published = dict()
+    max_error = dict()
+    t = 0
+    while t < DAY_S:
+        state = payload(t, rng)
+        if policy is None:
+            if t % publish_s:
+                values = dict()
+            else:
+                values = state
+                mqtt.publish(group.state_topic, bytes(ha_mqtt.json.dumps(values), "utf-8"))
+        else:
+            now = time.ticks_ms()
+            values = policy.select(state, now)
+            if values:
+                group.publish_state(values, 1)
+                policy.sent(values, now)
+        published.update(values)
+        for key in ("fresh_air_temp", "return_air_hum", "r2"):
+            error = abs(float(state[key]) - float(published[key]))
+            max_error[key] = max(max_error.get(key, 0), error)
+        t += STEP_S
+        sim.clock.advance(STEP_S)
+    return mqtt.messages, mqtt.bytes, max_error, connect
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    mqtt_robust.MQTTClient = CountingMQTT
+    print(f"{'publishing':>28} {'messages/day':>13} {'kB/day':>8}   max error temp / hum / r2")
+    for name, publish_s, policy in (
+            ("JSON state every 120 s", 120, None),
+            ("JSON state every 10 s", 10, None),
+            ("publish policy every 10 s", 10, PublishPolicy())):
+        messages, nbytes, err, connect = run(publish_s, policy)
+        print(f"{name:>28} {messages:>13} {nbytes / 1000:>8.1f}   "
+              f"{err['fresh_air_temp']:.2f} C / {err['return_air_hum']:.1f} % / {err['r2']:.0f} Ohm")
+    print(f"first connect: {connect[0]} messages, {connect[1] / 1000:.1f} kB "
+          f"(discovery configs and command subscriptions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark resistance.ResistanceMeter against the single sample measure_res.
+
+Reports measurements per second, ADC samples per second, heap allocated per
+measurement and the remaining noise of the resistance for different burst
+sizes. Runs on CPython against the ADC stand-in with gaussian voltage noise,
+or on the board from the REPL (then allocations come from gc.mem_alloc):
+    python host/bench/bench_resistance.py
+    >>> import bench_resistance; bench_resistance.main()
+"""
+import gc
+import math
+import random
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == "micropython"
+if not MICROPYTHON:
+    import os
+    import tracemalloc
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    import sim
+    sim.install()
+
+from machine import ADC, Pin  # noqa: E402
+from resistance import ResistanceMeter  # noqa: E402
+from vactrol import measure_res  # noqa: E402
+
+R = 19000          # resistance for a 10 C fresh air temperature
+NOISE_UV = 1500    # ADC noise on the host
+N_MEASUREMENTS = 500
+
+
+def make_adc():
+    adc = ADC(Pin(32))
+    if not MICROPYTHON:
+        rnd = random.Random(1)
+
+        def noisy():
+            volts = adc.V0 * adc.R_REF / (adc.R_REF + R) + rnd.gauss(0, NOISE_UV / 1e6)
+            return adc.R_REF * (adc.V0 - volts) / volts
+        adc.resistance = noisy
+    return adc
+
+
+def allocated(fn, n):
+    """bytes allocated by n calls of fn"""
+    if MICROPYTHON:
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(n):
+            fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used
+    tracemalloc.start()
+    for _ in range(n):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench(name, fn, samples):
+    values = []
+    t0 = time.ticks_us()
+    for _ in range(N_MEASUREMENTS):
+        values.append(fn())
+    elapsed = time.ticks_diff(time.ticks_us(), t0) / 1e6
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+    alloc = allocated(fn, N_MEASUREMENTS) / N_MEASUREMENTS
+    rate = N_MEASUREMENTS / elapsed
+    print(f"{name:>18} {rate:>12.0f} {rate * samples:>12.0f} {alloc:>10.1f} {std / R:>9.2%}")
+
+
+def main():
+    adc = make_adc()
+    label = "gc.mem_alloc" if MICROPYTHON else "tracemalloc peak"
+    print(f"{'method':>18} {'meas/s':>12} {'samples/s':>12} {'B/meas':>10} {'noise':>9}   ({label})")
+    bench("measure_res", lambda: measure_res(adc), 1)
+    for method in ("median", "trimmed"):
+        for samples in (5, 9, 17):
+            meter = ResistanceMeter(adc, samples, method)
+            bench(f"{method} x{samples}", lambda: meter.read()[0], samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Check the timing of the asyncio controller on the host.
+
+Runs controller.Controller against the stand-ins in host/sim with short task
+periods and reports how often each task ran and how far its start times
+drifted from the configured period. Wi-Fi takes a while to come up to show
+that sensing and regulation keep running meanwhile.
+
+Run from the repository root:
+    python host/bench/bench_scheduler.py [seconds]
+"""
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install()
+
+import network  # noqa: E402
+from machine import Pin  # noqa: E402
+
+PERIODS = dict(sense=0.5, strategy=1, regulate=2, publish=1.5, keepalive=2, mqtt=1, wifi=1, log=1)
+COEFFICIENTS = dict(k1=-1.3, m1=5.2, k2=-1.25, m2=5.15)
+
+
+class FakeMQTT:
+    connected = True
+
+    def __init__(self):
+        self.pings = 0
+        self.published = []
+
+    def ping(self):
+        self.pings += 1
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self.published.append(topic)
+        return True
+
+    def check_msg(self):
+        return None
+
+    def reconnect(self):
+        pass
+
+
+class FakeGroup:
+    # Home Assistant never restarts here
+    rediscover = False
+
+    def __init__(self):
+        self.mqtt = FakeMQTT()
+        self.state_topic = b"homeassistant/sensor/RDKR_bench/state"
+        self.published = []
+
+    def publish_state(self, state, qos=0):
+        self.published.append(state)
+        return True
+
+    def update_discovery(self):
+        pass
+
+
+def make_controller():
+    from controller import Controller
+    from datalog import DataLog
+    from publish_policy import PublishPolicy
+    from rdkr import Rdkr
+    from vactrol import dualVactrol
+
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+
+    # static vactrol: log10(R) = m + k * log10(pwm %)
+    def ldr(k, m):
+        def resistance():
+            pwm = max(vac.led.duty_u16() / 65535 * 100, 0.01)
+            return 10 ** (m + k * math.log10(pwm))
+        return resistance
+
+    vac.lsr1.resistance = ldr(COEFFICIENTS["k1"], COEFFICIENTS["m1"])
+    vac.lsr2.resistance = ldr(COEFFICIENTS["k2"], COEFFICIENTS["m2"])
+
+    rdkr = Rdkr(vac, 22, 10000, -750, Pin(15), Pin(27), Pin(26), Pin(25))
+    rdkr.fresh_air_dht.temp = 26.0
+    rdkr.return_air_dht.temp = 23.5
+
+    wlan = network.WLAN(network.STA_IF)
+    wlan.CONNECT_DELAY = 2.5
+    wlan.active(True)
+    config = dict(ssid="ssid", password="pw", mqtt_user="u", mqtt_password="p")
+    return Controller(
+        rdkr, wlan, config, aim_temp=21, dew_point_margin=1, relaxing_temp=2.61,
+        setup_mqtt=lambda *args: FakeGroup(), periods=PERIODS, datalog=DataLog("datalog.bin"),
+        policy=PublishPolicy(min_interval_s=1, max_interval_s=3, full_interval_s=6))
+
+
+def instrument(controller, starts, failures):
+    """Record the start time of every task run and the errors of the tasks"""
+    for name, attr in (("sense", "sense"), ("strategy", "evaluate_strategy"),
+                       ("regulate", "regulate"), ("publish", "publish"),
+                       ("keepalive", "keepalive"), ("mqtt", "poll_mqtt"), ("wifi", "supervise_wifi"), ("log", "log")):
+        job = getattr(controller, attr)
+        starts[name] = []
+
+        async def timed(job=job, name=name):
+            starts[name].append(time.monotonic())
+            try:
+                await job()
+            except Exception as e:
+                failures.append(f"{name}: {e!r}")
+                raise
+        setattr(controller, attr, timed)
+
+
+async def run_for(controller, seconds):
+    try:
+        await asyncio.wait_for(controller.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(COEFFICIENTS, f)
+    os.chdir(workdir)
+
+    controller = make_controller()
+    starts = dict()
+    failures = []
+    instrument(controller, starts, failures)
+    t0 = time.monotonic()
+    asyncio.run(run_for(controller, seconds))
+
+    print(f"\n{'task':>10} {'period':>7} {'runs':>5} {'mean interval':>14} {'max drift':>10} {'last duration':>14}")
+    for name, times in starts.items():
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        mean = sum(intervals) / len(intervals) if intervals else float("nan")
+        drift = max((abs(i - PERIODS[name]) for i in intervals), default=float("nan"))
+        duration = controller.state.last_duration_ms.get(name, 0)
+        print(f"{name:>10} {PERIODS[name]:>6}s {len(times):>5} {mean:>13.3f}s {drift:>9.3f}s {duration:>12}ms")
+    first_sense = starts["sense"][0] - t0
+    group = controller.state.group
+    print(f"\nfirst sensor read after {first_sense * 1000:.0f} ms, "
+          f"Wi-Fi up after {controller.wlan.CONNECT_DELAY} s, "
+          f"{len(group.published) if group else 0} states published, "
+          f"{len(group.mqtt.published) if group else 0} backlog batches replayed, "
+          f"{len(controller.datalog)} records logged")
+    if failures:
+        # the numbers above leave out what the failed jobs did not do
+        sys.exit(f"{len(failures)} task runs failed, first: {failures[0]}")
+
+
+if __name__ == "__main__":
+    main()
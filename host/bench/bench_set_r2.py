@@ -0,0 +1,95 @@
+"""Benchmark dualVactrol.set_r2 against the old 0.1 % pwm stepping loop on the
+simulated vactrol (host/sim/vactrol_model.py), using simulated time.
+
+The calibration coefficients given to the controller are slightly off from
+the true LDR coefficients, like on a real board some time after calibration.
+
+Run from the repository root:
+    python host/bench/bench_set_r2.py
+"""
+import json
+import math
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import sim  # noqa: E402
+
+sim.install(virtual_time=True)
+
+from machine import Pin  # noqa: E402
+from sim.vactrol_model import VactrolModel  # noqa: E402
+
+TRUE = dict(k1=-1.30, m1=5.20, k2=-1.22, m2=5.10)
+CALIBRATED = dict(k1=-1.24, m1=5.10, k2=-1.28, m2=5.18)
+# r2 for 22 C (rotor off), 10 C (rotor on) and a cold mirrored thermistor
+SETPOINTS = [10000, 19000, 10000, 25000, 19000, 10000]
+SEEDS = range(5)
+
+
+def legacy_set_r2(vac, r2, max_steps=2000):
+    """The previous set_r2: feed-forward, then +-0.1 % pwm per 200 ms step.
+    (The old loop left early on negative errors; here it steps both ways.)"""
+    from vactrol import duty, measure_res
+    t0 = sim.monotonic()
+    log_r2 = math.log10(r2)
+    pwm = 10 ** ((log_r2 - vac.m2) / vac.k2)
+    r1_aim = 10 ** (log_r2 + (vac.m1 - vac.m2))
+    steps = 0
+    while steps < max_steps:
+        vac.led.duty_u16(duty(pwm))
+        sim.clock.sleep(0.2)
+        steps += 1
+        error = measure_res(vac.lsr1) - r1_aim
+        if abs(error) < 500:
+            break
+        pwm += 0.1 if error > 0 else -0.1
+    return dict(steps=steps, time_ms=(sim.monotonic() - t0) * 1000,
+                error=error, converged=abs(error) < 500)
+
+
+def new_set_r2(vac, r2):
+    vac.set_r2(r2)
+    return vac.regulation
+
+
+def run(method, seed):
+    from vactrol import dualVactrol
+    vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+    model = VactrolModel(vac, seed=seed, **TRUE)
+    model.settle()
+    results = []
+    for r2 in SETPOINTS:
+        result = method(vac, r2)
+        result["r2_error"] = abs(model.r2() - r2) / r2
+        results.append(result)
+    return results
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(CALIBRATED, f)
+    os.chdir(workdir)
+
+    print(f"{'method':>8} {'setpoint':>9} {'steps':>6} {'time [s]':>9} {'|r1 error| [Ohm]':>17} "
+          f"{'r2 error':>9} {'converged':>10}")
+    for name, method in (("legacy", legacy_set_r2), ("newton", new_set_r2)):
+        runs = [run(method, seed) for seed in SEEDS]
+        total = 0
+        for i, r2 in enumerate(SETPOINTS):
+            rows = [results[i] for results in runs]
+            steps = sum(r["steps"] for r in rows) / len(rows)
+            seconds = sum(r["time_ms"] for r in rows) / len(rows) / 1000
+            error = sum(abs(r["error"]) for r in rows) / len(rows)
+            r2_error = sum(r["r2_error"] for r in rows) / len(rows)
+            converged = sum(bool(r["converged"]) for r in rows)
+            total += seconds
+            print(f"{name:>8} {r2:>9} {steps:>6.1f} {seconds:>9.2f} {error:>17.0f} "
+                  f"{r2_error:>8.1%} {converged:>6}/{len(rows)}")
+        print(f"{name:>8} total {total:.1f} s for {len(SETPOINTS)} setpoint changes\n")
+
+
+if __name__ == "__main__":
+    main()
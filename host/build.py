@@ -0,0 +1,190 @@
+"""Build a deployable bundle of the controller from src/.
+
+The modules are cross-compiled to .mpy with mpy-cross, so the ESP32 loads
+bytecode instead of compiling the sources on every boot. boot.py and
+main.py stay source files (MicroPython only runs them as .py), config.json
+and webrepl_cfg.py are never part of a bundle, they hold the board's own
+settings.
+
+The bundle directory holds the files to copy to the board and manifest.json
+with their sizes and hashes. MicroPython imports foo.py before foo.mpy, so
+the manifest also lists the files of the other kind to remove from the
+board. --deploy does both with mpremote. Next to the bundle a freeze
+manifest (manifest.py) is written for building the modules into a custom
+firmware instead.
+
+Run from the repository root:
+    python host/build.py                          # build/bundle with .mpy files
+    python host/build.py --source                 # .py files, for development
+    python host/build.py --deploy /dev/ttyUSB0    # build and copy to the board
+    python host/build.py --report boot_py.txt boot_mpy.txt
+
+mpy-cross must match the firmware (MicroPython 1.22 reads .mpy version 6),
+e.g. pip install mpy-cross==1.22.2. --report compares the sizes of the
+sources and the .mpy files and, given serial logs of a boot with each
+bundle, the boot phases printed by boottime.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+SRC = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+BUILD = os.path.normpath(os.path.join(SRC, "..", "build"))
+# run as source by MicroPython
+SOURCE_ONLY = ("boot.py", "main.py")
+# settings of the board, never overwritten by a deployment
+EXCLUDED = ("config.json", "webrepl_cfg.py")
+# ESP32 (Xtensa with windowed registers), only matters for native code
+ARCH = "xtensawin"
+
+
+def modules():
+    """The .py files of src/ that go into a bundle"""
+    return sorted(name for name in os.listdir(SRC)
+                  if name.endswith(".py") and name not in EXCLUDED)
+
+
+def mpy_cross_version(mpy_cross):
+    try:
+        result = subprocess.run([mpy_cross, "--version"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        sys.exit(f"mpy-cross is not available ({e}), install it or build with --source")
+    return result.stdout.strip()
+
+
+def compile_module(mpy_cross, name, out_dir, opt):
+    target = os.path.join(out_dir, name[:-3] + ".mpy")
+    subprocess.run([mpy_cross, f"-march={ARCH}", f"-O{opt}", "-s", name,
+                    "-o", target, os.path.join(SRC, name)], check=True)
+    return target
+
+
+def file_entry(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return dict(size=len(data), sha256=hashlib.sha256(data).hexdigest())
+
+
+def build(out_dir, source=False, mpy_cross="mpy-cross", opt=0):
+    """Write the bundle to out_dir, returns the manifest"""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    manifest = dict(kind="source" if source else "mpy", files=dict(), remove=[])
+    if not source:
+        manifest["mpy_cross"] = mpy_cross_version(mpy_cross)
+        manifest["arch"] = ARCH
+        manifest["opt"] = opt
+
+    for name in modules():
+        if source or name in SOURCE_ONLY:
+            path = os.path.join(out_dir, name)
+            shutil.copyfile(os.path.join(SRC, name), path)
+            if name not in SOURCE_ONLY:
+                manifest["remove"].append(name[:-3] + ".mpy")
+        else:
+            path = compile_module(mpy_cross, name, out_dir, opt)
+            manifest["remove"].append(name)
+        entry = file_entry(path)
+        entry["source_size"] = os.path.getsize(os.path.join(SRC, name))
+        manifest["files"][os.path.basename(path)] = entry
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def write_freeze_manifest(path):
+    """Freeze manifest for a firmware build:
+    make BOARD=ESP32_GENERIC FROZEN_MANIFEST=<path>"""
+    lines = [
+        "# generated by host/build.py, modules of src/ frozen into the firmware",
+        'include("$(PORT_DIR)/boards/manifest.py")',
+    ]
+    for name in modules():
+        if name not in SOURCE_ONLY:
+            lines.append(f'module("{name}", base_path="{SRC}")')
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def deploy(out_dir, manifest, port):
+    """Copy the bundle with mpremote and remove the files it replaces"""
+    mpremote = ["mpremote", "connect", port]
+    for name in manifest["remove"]:
+        # fails harmlessly if the board does not have the file
+        subprocess.run(mpremote + ["rm", f":{name}"], capture_output=True)
+    files = [os.path.join(out_dir, name) for name in manifest["files"]]
+    subprocess.run(mpremote + ["cp"] + files + [":"], check=True)
+
+
+def boot_phases(path):
+    """phase -> ms since reset from the last 'boot: ...' line of a serial log"""
+    phases = None
+    with open(path) as f:
+        for line in f:
+            if line.startswith("boot: "):
+                phases = {m.group(1): int(m.group(2))
+                          for m in re.finditer(r"(\w[\w ]*?) -?\d+ ms \(at (\d+)\)", line)}
+    if phases is None:
+        sys.exit(f"no boot report in {path}")
+    return phases
+
+
+def report(compiled, boot_logs=None):
+    """Size per module and, with boot logs, the boot phases of both bundles"""
+    print(f"{'module':>18} {'source':>8} {'mpy':>8} {'ratio':>6}")
+    total = [0, 0]
+    for name, entry in compiled["files"].items():
+        if not name.endswith(".mpy"):
+            continue
+        print(f"{name[:-4]:>18} {entry['source_size']:>8} {entry['size']:>8} "
+              f"{entry['size'] / entry['source_size']:>6.0%}")
+        total[0] += entry["source_size"]
+        total[1] += entry["size"]
+    print(f"{'total':>18} {total[0]:>8} {total[1]:>8} {total[1] / max(total[0], 1):>6.0%}")
+
+    if boot_logs:
+        before, after = (boot_phases(path) for path in boot_logs)
+        print(f"\n{'boot phase [ms]':>18} {'source':>8} {'mpy':>8} {'change':>8}")
+        for phase in before:
+            if phase in after:
+                print(f"{phase:>18} {before[phase]:>8} {after[phase]:>8} "
+                      f"{after[phase] - before[phase]:>+8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", action="store_true", help="bundle the .py files, no compilation")
+    parser.add_argument("--out", default=os.path.join(BUILD, "bundle"))
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross executable")
+    parser.add_argument("-O", dest="opt", type=int, default=0,
+                        help="mpy-cross optimisation level, 1 and up drop asserts")
+    parser.add_argument("--deploy", metavar="PORT", help="copy the bundle to the board with mpremote")
+    parser.add_argument("--report", nargs="*", metavar="BOOT_LOG",
+                        help="compare sizes, and boot phases of two serial logs (source, mpy)")
+    args = parser.parse_args()
+
+    manifest = build(args.out, args.source, args.mpy_cross, args.opt)
+    write_freeze_manifest(os.path.join(os.path.dirname(args.out), "manifest.py"))
+    size = sum(entry["size"] for entry in manifest["files"].values())
+    print(f"{manifest['kind']} bundle: {len(manifest['files'])} files, {size} bytes in {args.out}")
+
+    if args.report is not None:
+        if len(args.report) not in (0, 2):
+            sys.exit("--report takes no boot logs or two (source, mpy)")
+        if args.source:
+            sys.exit("--report compares against the .mpy files, build without --source")
+        report(manifest, args.report)
+    if args.deploy:
+        deploy(args.out, manifest, args.deploy)
+        print(f"deployed to {args.deploy}, reset the board to boot the bundle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Read the controller's binary data log (src/datalog.py) on the host.
+
+The file is memory-mapped and decoded into columns (one list per field),
+oldest record first.
+
+    python host/datalog_reader.py datalog.bin               # summary
+    python host/datalog_reader.py datalog.bin --csv out.csv # export
+
+    from datalog_reader import read_columns
+    columns = read_columns("datalog.bin")
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import datalog  # noqa: E402
+
+COLUMNS = ("seq", "time") + datalog.DHT_KEYS + ("r1", "r2", "pwm", "strategy", "stale")
+STRATEGY_NAMES = {code: name for name, code in datalog.STRATEGY_CODES.items()}
+
+
+def read_columns(path):
+    """Decode a data log into a dict of column lists, oldest record first.
+
+    DHT values are in C / %RH (None if never read), pwm in % duty, strategy
+    is the action name and stale a comma separated list of sensors."""
+    columns = {name: [] for name in COLUMNS}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, size, capacity = struct.unpack_from(datalog.HEADER_FORMAT, mm, 0)
+        if magic != datalog.MAGIC or version != datalog.VERSION or size != datalog.RECORD_SIZE:
+            raise ValueError(f"{path} is not a compatible data log")
+        count = min((len(mm) - datalog.HEADER_SIZE) // size, capacity)
+        data = memoryview(mm)[datalog.HEADER_SIZE:datalog.HEADER_SIZE + count * size]
+        records = list(struct.iter_unpack(datalog.RECORD_FORMAT, data))
+        data.release()
+
+    records.sort(key=lambda r: r[0])
+    stale_bits = datalog.STALE_BITS.items()
+    for r in records:
+        columns["seq"].append(r[0])
+        columns["time"].append(r[1])
+        for i, key in enumerate(datalog.DHT_KEYS):
+            v = r[2 + i]
+            columns[key].append(None if v == datalog.MISSING else v / 10)
+        columns["r1"].append(r[10])
+        columns["r2"].append(r[11])
+        columns["pwm"].append(r[12] / 65535 * 100)
+        columns["strategy"].append(STRATEGY_NAMES.get(r[13], ""))
+        columns["stale"].append(",".join(name for name, bit in stale_bits if r[14] & bit))
+    return columns
+
+
+def write_csv(columns, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="data log copied from the board")
+    parser.add_argument("--csv", help="write the decoded records to this csv file")
+    args = parser.parse_args()
+
+    columns = read_columns(args.path)
+    n = len(columns["seq"])
+    print(f"{n} records")
+    if n:
+        print(f"seq {columns['seq'][0]} - {columns['seq'][-1]}, "
+              f"time {columns['time'][0]} - {columns['time'][-1]}")
+    if args.csv:
+        write_csv(columns, args.csv)
+        print(f"written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
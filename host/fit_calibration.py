@@ -0,0 +1,242 @@
+"""Fit the vactrol calibration (k1, m1, k2, m2) robustly from calibration sweeps.
+
+dualVactrol.calibrate fits each LDR by ordinary least squares after cutting
+a fixed number of points off the saturated ends of the sweep, so a single
+outlier, or an open circuit in the middle of the sweep (inf, logged as
+LOG_R_MAX), pulls the line off. Here each LDR of each sweep is fitted in two
+steps, vectorized over all sweeps with NumPy:
+
+1. linear range: RANSAC. Of the lines through random pairs of points, the
+   one with the most points within --tol marks the linear part of the sweep,
+   from its first to its last point within --tol. The saturated ends fall
+   outside.
+2. Huber regression of the points in the linear range (iteratively
+   reweighted least squares): points further than HUBER_C robust standard
+   deviations from the line get a weight falling with their residual.
+
+The sweeps are calibration.csv files written by calibrate(export_data=True),
+one log_pwm,log_r1,log_r2 line per point, or NumPy dumps (.npy) of the shape
+(sweeps, points, 3), padded with NaN, as written by --archive. The fit of
+each sweep, the difference of its two LDRs and the spread over all sweeps
+are printed, followed by the config.json entry of the newest sweep (the
+last one given) or the median of all (--use median). --save writes it to
+a config.json copied from the board.
+
+Run from the repository root:
+    python host/fit_calibration.py calibration.csv
+    python host/fit_calibration.py sweeps/*.csv --archive sweeps.npy
+    python host/fit_calibration.py sweeps.npy --use median --save config.json
+
+Needs NumPy (pip install numpy).
+"""
+import argparse
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+
+# log10 resistance logged for an open circuit (vactrol.LOG_R_MAX)
+LOG_R_MAX = 7
+# RANSAC: largest residual of a point on the line in log10(R), lines tried
+# per LDR, shortest log_pwm distance of the two points of a line
+TOL = 0.05
+TRIALS = 32
+MIN_SPAN = 0.1
+# Huber regression: threshold in robust standard deviations, iterations,
+# smallest standard deviation (ADC resolution)
+HUBER_C = 1.345
+ITERATIONS = 10
+MIN_SCALE = 0.002
+# sweeps fitted at once, bounds the (sweeps, TRIALS, points) RANSAC arrays
+BATCH = 1024
+COEFFICIENTS = ("k1", "m1", "k2", "m2")
+
+
+def read_sweep(path) -> np.ndarray:
+    """(points, 3) array of log_pwm, log_r1, log_r2 of a calibration.csv"""
+    return np.loadtxt(path, delimiter=",", usecols=(0, 1, 2), ndmin=2)
+
+
+def load(paths) -> np.ndarray:
+    """All sweeps of calibration.csv files and .npy dumps as one (sweeps,
+    points, 3) array, shorter sweeps padded with NaN"""
+    sweeps = []
+    for path in paths:
+        if path.endswith(".npy"):
+            sweeps.extend(np.load(path))
+        else:
+            sweeps.append(read_sweep(path))
+    points = max(len(sweep) for sweep in sweeps)
+    data = np.full((len(sweeps), points, 3), np.nan)
+    for i, sweep in enumerate(sweeps):
+        data[i, :len(sweep)] = sweep
+    return data
+
+
+def _line(x, y, w):
+    """Weighted least squares slope and intercept per row, rows of (x, y, w)"""
+    x = np.where(w > 0, x, 0.0)
+    y = np.where(w > 0, y, 0.0)
+    sw = w.sum(axis=1)
+    sx = (w * x).sum(axis=1)
+    sy = (w * y).sum(axis=1)
+    sxx = (w * x * x).sum(axis=1)
+    sxy = (w * x * y).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = (sw * sxy - sx * sy) / (sw * sxx - sx * sx)
+        m = (sy - k * sx) / sw
+    return k, m
+
+
+def linear_range(x, y, valid, tol=TOL, trials=TRIALS, rng=None):
+    """RANSAC per row: points on the line with the most points within tol,
+    and the first and last log_pwm of them"""
+    rng = rng if rng is not None else np.random.default_rng(1)
+    rows, n = x.shape
+    count = valid.sum(axis=1)
+    # positions of the valid points first
+    order = np.argsort(~valid, axis=1, kind="stable")
+    picks = np.minimum((rng.random((rows, 2 * trials)) * count[:, None]).astype(np.int64), n - 1)
+    picks = np.take_along_axis(order, picks, axis=1)
+    xp = np.take_along_axis(x, picks, axis=1).reshape(rows, trials, 2)
+    yp = np.take_along_axis(y, picks, axis=1).reshape(rows, trials, 2)
+    dx = xp[..., 1] - xp[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.where(np.abs(dx) >= MIN_SPAN, (yp[..., 1] - yp[..., 0]) / dx, np.nan)
+        m = yp[..., 0] - k * xp[..., 0]
+        near = np.abs(y[:, None, :] - (k[..., None] * x[:, None, :] + m[..., None])) <= tol
+    near &= valid[:, None, :]
+    best = near.sum(axis=2).argmax(axis=1)
+    on_line = near[np.arange(rows), best]
+    lo = np.where(on_line, x, np.inf).min(axis=1)
+    hi = np.where(on_line, x, -np.inf).max(axis=1)
+    return on_line, lo, hi
+
+
+def huber(x, y, mask, c=HUBER_C, iterations=ITERATIONS):
+    """Huber regression per row of the points in mask, returns slope,
+    intercept, robust standard deviation of the residuals and weights"""
+    w = mask.astype(np.float64)
+    for _ in range(iterations):
+        k, m = _line(x, y, w)
+        r = np.abs(np.where(mask, y - (k[:, None] * x + m[:, None]), np.nan))
+        with warnings.catch_warnings():
+            # rows without points
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scale = np.maximum(1.4826 * np.nanmedian(r, axis=1), MIN_SCALE)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = np.where(mask, np.minimum(1.0, c * scale[:, None] / r), 0.0)
+    return k, m, scale, w
+
+
+def fit_rows(x, y, tol=TOL, trials=TRIALS, rng=None) -> dict:
+    """Fit log10(R) = k * log_pwm + m to each row of x and y, NaN where a row
+    has too few valid points"""
+    rng = rng if rng is not None else np.random.default_rng(1)
+    with np.errstate(invalid="ignore"):
+        valid = np.isfinite(x) & np.isfinite(y) & (y < LOG_R_MAX)
+    columns = dict()
+    for start in range(0, len(x), BATCH):
+        xs = x[start:start + BATCH]
+        ys = y[start:start + BATCH]
+        vs = valid[start:start + BATCH]
+        _, lo, hi = linear_range(xs, ys, vs, tol, trials, rng)
+        with np.errstate(invalid="ignore"):
+            in_range = vs & (xs >= lo[:, None]) & (xs <= hi[:, None])
+        k, m, scale, w = huber(xs, ys, in_range)
+        few = in_range.sum(axis=1) < 3
+        batch = dict(k=k, m=m, lo=lo, hi=hi, points=in_range.sum(axis=1), scale=scale,
+                     # residuals over 3 standard deviations
+                     outliers=(in_range & (w < HUBER_C / 3)).sum(axis=1))
+        for key in ("k", "m", "lo", "hi", "scale"):
+            batch[key] = np.where(few, np.nan, batch[key])
+        for key, values in batch.items():
+            columns.setdefault(key, []).append(values)
+    return {key: np.concatenate(values) for key, values in columns.items()}
+
+
+def fit(data, tol=TOL, trials=TRIALS, seed=1) -> dict:
+    """Fit both LDRs of every sweep of a (sweeps, points, 3) array. Returns
+    columns per sweep: k1, m1, k2, m2 and lo, hi, points, scale, outliers
+    with the suffix 1 or 2 of the LDR"""
+    n = len(data)
+    x = np.concatenate((data[:, :, 0], data[:, :, 0]))
+    y = np.concatenate((data[:, :, 1], data[:, :, 2]))
+    rows = fit_rows(x, y, tol, trials, np.random.default_rng(seed))
+    columns = dict()
+    for key, values in rows.items():
+        columns[f"{key}1"] = values[:n]
+        columns[f"{key}2"] = values[n:]
+    return columns
+
+
+def config_entry(columns, use="last") -> dict:
+    """k1, m1, k2, m2 of the last sweep or the median of all sweeps"""
+    if use == "median":
+        values = {name: np.nanmedian(columns[name]) for name in COEFFICIENTS}
+    else:
+        values = {name: columns[name][-1] for name in COEFFICIENTS}
+    return {name: round(float(value), 4) for name, value in values.items()}
+
+
+def save(entry: dict, path: str):
+    """Write the coefficients to config.json like dualVactrol.save_calibration,
+    the vactrol drift starts over from them"""
+    with open(path, "r") as config_file:
+        config = json.load(config_file)
+    config.update(entry)
+    config["drift"] = 0.0
+    with open(path, "w") as config_file:
+        json.dump(config, config_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="calibration.csv files and .npy sweep dumps")
+    parser.add_argument("--tol", type=float, default=TOL, help="RANSAC tolerance in log10(R)")
+    parser.add_argument("--use", choices=("last", "median"), default="last",
+                        help="coefficients of the last sweep or the median of all")
+    parser.add_argument("--show", type=int, default=20, help="sweeps printed at most (the last ones)")
+    parser.add_argument("--archive", help="write all sweeps to this .npy file")
+    parser.add_argument("--save", help="config.json to write the coefficients to")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    data = load(args.paths)
+    t1 = time.perf_counter()
+    columns = fit(data, args.tol)
+    t2 = time.perf_counter()
+    n = len(data)
+    print(f"{n} sweeps of up to {data.shape[1]} points, read in {t1 - t0:.2f} s, fitted in {t2 - t1:.2f} s")
+    if args.archive:
+        np.save(args.archive, data)
+        print(f"sweeps written to {args.archive}")
+
+    print(f"{'sweep':>6} {'k1':>7} {'m1':>6} {'k2':>7} {'m2':>6} {'k1-k2':>6} {'m1-m2':>6} "
+          f"{'log_pwm range':>13} {'points':>7} {'outliers':>8} {'std':>11}")
+    for i in range(max(n - args.show, 0), n):
+        c = {key: values[i] for key, values in columns.items()}
+        print(f"{i:>6} {c['k1']:>7.3f} {c['m1']:>6.3f} {c['k2']:>7.3f} {c['m2']:>6.3f} "
+              f"{c['k1'] - c['k2']:>6.3f} {c['m1'] - c['m2']:>6.3f} "
+              f"{max(c['lo1'], c['lo2']):>6.2f}-{min(c['hi1'], c['hi2']):<6.2f} "
+              f"{c['points1']:>3}/{c['points2']:<3} {c['outliers1']:>3}/{c['outliers2']:<4} "
+              f"{c['scale1']:.3f}/{c['scale2']:.3f}")
+    if n > 1:
+        print("over all sweeps (median, interquartile range):")
+        for name in COEFFICIENTS:
+            q1, median, q3 = np.nanpercentile(columns[name], (25, 50, 75))
+            print(f"{name:>6} {median:>7.3f} {q3 - q1:>7.3f}")
+
+    entry = config_entry(columns, args.use)
+    if any(np.isnan(value) for value in entry.values()):
+        sys.exit("too few valid points to fit. Make sure the lsr measurements are connected to the vactrol")
+    print(json.dumps(entry))
+    if args.save:
+        save(entry, args.save)
+        print(f"written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
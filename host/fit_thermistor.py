@@ -0,0 +1,72 @@
+"""Fit the fresh air thermistor from the controller's data log.
+
+Every record holds the measured resistance of the fresh air thermistor (r2)
+and the fresh air DHT temperature. The linear, beta and Steinhart-Hart
+models of src/thermistor.py are fitted to these pairs and their errors
+printed, followed by the config.json entry of the chosen model.
+
+Run from the repository root:
+    python host/fit_thermistor.py datalog.bin
+    python host/fit_thermistor.py datalog.bin --model steinhart-hart
+"""
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from datalog_reader import read_columns  # noqa: E402
+import thermistor  # noqa: E402
+
+
+def pairs(columns):
+    """(r2, fresh air temperature) of the records with both measured"""
+    for r2, temp, stale in zip(columns["r2"], columns["fresh_air_temp"], columns["stale"]):
+        stale = stale.split(",")
+        if temp is None or math.isnan(r2) or "r2" in stale or "fresh_air" in stale:
+            continue
+        yield r2, temp
+
+
+def errors(model, data):
+    """(rms, max) temperature error in C"""
+    e = [model.temperature(r) - temp for r, temp in data]
+    return math.sqrt(sum(x * x for x in e) / len(e)), max(abs(x) for x in e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="data log copied from the board")
+    parser.add_argument("--model", choices=list(thermistor.MODELS), default="beta")
+    parser.add_argument("--T0", type=float, default=22, help="reference temperature of linear and beta")
+    args = parser.parse_args()
+
+    data = list(pairs(read_columns(args.path)))
+    if not data:
+        sys.exit("no records with both r2 and the fresh air temperature")
+    temps = [temp for _, temp in data]
+    print(f"{len(data)} pairs, fresh air {min(temps):.1f} - {max(temps):.1f} C")
+
+    fitted = {}
+    for name in thermistor.MODELS:
+        fit = thermistor.ThermistorFit(name, args.T0)
+        for r, temp in data:
+            fit.add(r, temp)
+        try:
+            fitted[name] = fit.solve()
+        except (ValueError, ZeroDivisionError) as e:
+            print(f"{name:>16}: {e}")
+            continue
+        rms, worst = errors(fitted[name], data)
+        print(f"{name:>16}: rms {rms:.2f} C, max {worst:.2f} C")
+
+    if args.model not in fitted:
+        sys.exit(f"{args.model} could not be fitted")
+    print(json.dumps({"thermistor": fitted[args.model].to_config()}))
+
+
+if __name__ == "__main__":
+    main()
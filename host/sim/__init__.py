@@ -0,0 +1,161 @@
+"""Run the controller code on CPython.
+
+install() puts host stand-ins for the MicroPython-only modules (machine, dht,
+network, webrepl, ujson, ...) and the controller sources on sys.path, and adds
+the MicroPython extensions of the time module (sleep_ms, ticks_ms, ...).
+
+    import sim
+    sim.install()
+    from vactrol import dualVactrol
+
+With virtual time, run() executes asyncio code on the simulation clock, so
+hours of controller operation take seconds:
+
+    sim.install(virtual_time=True)
+    sim.run(controller.run(), duration_s=86400)
+"""
+import asyncio
+import os
+import selectors
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = os.path.join(HERE, "modules")
+SRC = os.path.normpath(os.path.join(HERE, "..", "..", "src"))
+
+_TICKS_PERIOD = 1 << 30
+_real_sleep = time.sleep
+_real_time = time.time
+
+
+class RealClock:
+    """Wall clock time"""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        _real_sleep(seconds)
+
+
+class VirtualClock:
+    """Simulated time that only moves when something sleeps or advances it"""
+
+    def __init__(self, start=0.0):
+        self.t = start
+
+    def monotonic(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += max(seconds, 0)
+
+    advance = sleep
+
+
+clock = RealClock()
+
+
+def monotonic():
+    """Current time of the simulation clock in seconds"""
+    return clock.monotonic()
+
+
+def _ticks_ms():
+    return int(clock.monotonic() * 1000) & (_TICKS_PERIOD - 1)
+
+
+def _ticks_us():
+    return int(clock.monotonic() * 1000000) & (_TICKS_PERIOD - 1)
+
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) & (_TICKS_PERIOD - 1)
+
+
+def _ticks_diff(end, start):
+    diff = (end - start) & (_TICKS_PERIOD - 1)
+    if diff >= _TICKS_PERIOD // 2:
+        diff -= _TICKS_PERIOD
+    return diff
+
+
+def install(virtual_time=False):
+    """Make the controller sources importable on the host.
+
+    With virtual_time the MicroPython time functions (sleep_ms, ticks_ms, ...)
+    and time.sleep run on a VirtualClock instead of the wall clock."""
+    global clock
+    for path in (SRC, MODULES):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    if virtual_time:
+        clock = VirtualClock()
+        time.sleep = clock.sleep
+        # wall clock time moves with the simulation, starting now
+        epoch = _real_time()
+        time.time = lambda: epoch + clock.monotonic()
+    else:
+        clock = RealClock()
+        time.sleep = _real_sleep
+        time.time = _real_time
+    time.sleep_ms = lambda ms: clock.sleep(ms / 1000)
+    time.sleep_us = lambda us: clock.sleep(us / 1000000)
+    time.ticks_ms = _ticks_ms
+    time.ticks_us = _ticks_us
+    time.ticks_add = _ticks_add
+    time.ticks_diff = _ticks_diff
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    """Polls without blocking and advances the clock to the next timer instead.
+    While a socket is open (the loop's own wakeup socket is always there), a
+    thread like the stand-in broker gets SOCKET_WAIT_S of real time to answer
+    first, its round trips would take no simulated time otherwise."""
+
+    SOCKET_WAIT_S = 0.0005
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout != 0 and len(self.get_map()) > 1:
+            events = super().select(self.SOCKET_WAIT_S)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("simulation stalled: no task is scheduled")
+            clock.advance(timeout)
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop on the simulation clock. When all tasks sleep, time
+    jumps to the next timer instead of waiting for it."""
+
+    def __init__(self):
+        super().__init__(_VirtualSelector())
+
+    def time(self):
+        return clock.monotonic()
+
+
+def run(main, duration_s=None):
+    """Run a coroutine on a VirtualTimeLoop, for at most duration_s simulated
+    seconds. Needs install(virtual_time=True)."""
+    if not isinstance(clock, VirtualClock):
+        raise RuntimeError("sim.run needs install(virtual_time=True)")
+    loop = VirtualTimeLoop()
+    try:
+        if duration_s is None:
+            return loop.run_until_complete(main)
+        try:
+            return loop.run_until_complete(asyncio.wait_for(main, duration_s))
+        except asyncio.TimeoutError:
+            return None
+    finally:
+        # tasks started by main are still pending after a timeout
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
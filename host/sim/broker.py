@@ -0,0 +1,284 @@
+"""Minimal MQTT 3.1.1 broker for host tests of the controller's MQTT code.
+
+Supports CONNECT (with persistent sessions that keep the subscriptions),
+PUBLISH (QoS 0/1, retained messages), SUBSCRIBE with + and # wildcards,
+PINGREQ and DISCONNECT. Messages are delivered to subscribers with QoS 0. Every publish is recorded in `messages`, and `stop()`/`start()` on the
+same port emulate a broker outage. With delay set, everything the broker
+sends is held back that long, like the round trip of a Wi-Fi link.
+
+    broker = Broker()
+    port = broker.start()
+    ...
+    broker.stop()
+"""
+import queue
+import socket
+import struct
+import threading
+import time
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic filter matching with + and # wildcards"""
+    f_parts = topic_filter.split("/")
+    t_parts = topic.split("/")
+    for i, part in enumerate(f_parts):
+        if part == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if part != "+" and part != t_parts[i]:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+class Message:
+    def __init__(self, topic, payload, qos, retain, client_id):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.client_id = client_id
+        self.time = time.monotonic()
+
+    def __repr__(self):
+        return f"Message({self.topic!r}, {self.payload[:40]!r}, qos={self.qos}, retain={self.retain})"
+
+
+class _Client:
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.subscriptions = []
+        self.lock = threading.Lock()
+        self.outbox = None
+        if broker.delay:
+            self.outbox = queue.Queue()
+            threading.Thread(target=self._send_delayed, daemon=True).start()
+
+    def send(self, data):
+        if self.outbox is not None:
+            self.outbox.put((time.monotonic() + self.broker.delay, data))
+        else:
+            self._send(data)
+
+    def _send_delayed(self):
+        while True:
+            due, data = self.outbox.get()
+            if data is None:
+                return
+            time.sleep(max(due - time.monotonic(), 0))
+            self._send(data)
+
+    def _send(self, data):
+        with self.lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    def _read_exact(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def _read_packet(self):
+        header = self._read_exact(1)[0]
+        length = 0
+        shift = 0
+        while True:
+            b = self._read_exact(1)[0]
+            length |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        return header, self._read_exact(length) if length else b""
+
+    def serve(self):
+        try:
+            while True:
+                header, body = self._read_packet()
+                kind = header & 0xF0
+                if kind == 0x10:
+                    self._connect(body)
+                elif kind == 0x30:
+                    self._publish(header, body)
+                elif kind == 0x80:
+                    self._subscribe(body)
+                elif kind == 0xC0:
+                    self.broker.pings += 1
+                    self.send(b"\xd0\x00")
+                elif kind == 0xE0:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if self.outbox is not None:
+                self.outbox.put((0, None))
+            self.broker._remove(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _connect(self, body):
+        name_len = struct.unpack_from("!H", body, 0)[0]
+        clean_session = body[2 + name_len + 1] & 0x02
+        pos = 2 + name_len + 4  # protocol name, level, flags, keepalive
+        id_len = struct.unpack_from("!H", body, pos)[0]
+        self.client_id = body[pos + 2:pos + 2 + id_len]
+        self.broker.connects += 1
+        sessions = self.broker.sessions
+        if clean_session:
+            sessions.pop(self.client_id, None)
+            session_present = 0
+        else:
+            session_present = int(self.client_id in sessions)
+            self.subscriptions = sessions.setdefault(self.client_id, self.subscriptions)
+        self.send(b"\x20\x02" + bytes([session_present, 0]))
+
+    def _publish(self, header, body):
+        qos = (header >> 1) & 3
+        retain = bool(header & 1)
+        topic_len = struct.unpack_from("!H", body, 0)[0]
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        pid = None
+        if qos:
+            pid = struct.unpack_from("!H", body, pos)[0]
+            pos += 2
+        payload = bytes(body[pos:])
+        self.broker._handle_publish(Message(topic, payload, qos, retain, self.client_id))
+        if qos == 1:
+            self.send(b"\x40\x02" + struct.pack("!H", pid))
+
+    def _subscribe(self, body):
+        pid = struct.unpack_from("!H", body, 0)[0]
+        pos = 2
+        granted = b""
+        filters = []
+        while pos < len(body):
+            n = struct.unpack_from("!H", body, pos)[0]
+            topic_filter = body[pos + 2:pos + 2 + n].decode()
+            pos += 2 + n + 1
+            filters.append(topic_filter)
+            granted += b"\x00"
+        self.subscriptions.extend(filters)
+        self.send(b"\x90" + bytes([2 + len(granted)]) + struct.pack("!H", pid) + granted)
+        for topic_filter in filters:
+            for message in list(self.broker.retained.values()):
+                if topic_matches(topic_filter, message.topic):
+                    self.deliver(message)
+
+    def deliver(self, message):
+        topic = message.topic.encode()
+        body = struct.pack("!H", len(topic)) + topic + message.payload
+        header = bytes([0x30 | int(message.retain)])
+        length = len(body)
+        encoded = b""
+        while True:
+            b = length & 0x7F
+            length >>= 7
+            encoded += bytes([b | (0x80 if length else 0)])
+            if not length:
+                break
+        self.send(header + encoded + body)
+
+
+class Broker:
+    def __init__(self, host="127.0.0.1", delay=0.0):
+        """delay: seconds every packet to a client is held back"""
+        self.host = host
+        self.delay = delay
+        self.port = 0
+        self.messages = []
+        self.retained = {}
+        # client id -> subscriptions of persistent sessions
+        self.sessions = {}
+        self.connects = 0
+        self.pings = 0
+        self._clients = []
+        self._server = None
+        self._lock = threading.Lock()
+
+    def start(self, port=None):
+        """Start listening (on the previous port after a stop). Returns the port."""
+        if port is None:
+            port = self.port
+        self._server = socket.socket()
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, port))
+        self._server.listen(5)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, args=(self._server,), daemon=True).start()
+        return self.port
+
+    def stop(self):
+        """Close the listening socket and drop all clients"""
+        if self._server is not None:
+            # shutdown wakes the accept thread, close alone keeps listening on Linux
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            self._server = None
+        self.drop_clients()
+
+    def drop_clients(self):
+        """Close the connections of all clients, e.g. when their link is lost"""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.sock.close()
+
+    def _accept(self, server):
+        while True:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                return
+            # pipelined acknowledgements would wait for a delayed ACK otherwise
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(self, sock)
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=client.serve, daemon=True).start()
+
+    def _remove(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _handle_publish(self, message):
+        with self._lock:
+            self.messages.append(message)
+            if message.retain:
+                if message.payload:
+                    self.retained[message.topic] = message
+                else:
+                    self.retained.pop(message.topic, None)
+            clients = list(self._clients)
+        for client in clients:
+            if any(topic_matches(f, message.topic) for f in client.subscriptions):
+                client.deliver(message)
+
+    def publish(self, topic, payload, retain=False):
+        """Publish a message from the broker side (e.g. Home Assistant)"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self._handle_publish(Message(topic, payload, 0, retain, None))
+
+    def received(self, topic_filter="#"):
+        """Recorded messages matching a topic filter"""
+        with self._lock:
+            return [m for m in self.messages if topic_matches(topic_filter, m.topic)]
@@ -0,0 +1,30 @@
+"""Host stand-in for MicroPython's dht module."""
+
+# pin number -> function returning (temperature, humidity) of the air at that sensor
+SOURCES = dict()
+
+
+class DHT22:
+    def __init__(self, pin):
+        self.pin = pin
+        self.source = SOURCES.get(getattr(pin, "id", pin))
+        self.temp = 21.0
+        self.hum = 45.0
+        # set to an exception instance to emulate a failing sensor
+        self.fail = None
+        self._t = None
+        self._h = None
+
+    def measure(self):
+        if self.fail is not None:
+            raise self.fail
+        if self.source is not None:
+            self.temp, self.hum = self.source()
+        self._t = round(self.temp, 1)
+        self._h = round(self.hum, 1)
+
+    def temperature(self):
+        return self._t
+
+    def humidity(self):
+        return self._h
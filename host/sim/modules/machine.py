@@ -0,0 +1,122 @@
+"""Host stand-in for MicroPython's machine module.
+
+Simulation models wire themselves to pin numbers like the real board: an ADC
+created on a pin in WIRING measures that resistance, and every PWM is listed
+in PWMS by pin number so models can read the duty cycle.
+
+lightsleep() advances the time like a sleep plus LIGHTSLEEP_WAKE_MS of wake
+latency. PWMs created without lightsleep=True are off meanwhile, the models
+in SLEEP_HOOKS are brought up to date before and after. The radio is off as
+well: on the wake up LINK_HOOKS drop the links, the Wi-Fi station loses its
+association (network.WLAN) and the broker the MQTT connection."""
+import time
+
+# pin number -> resistance (number or function) measured by an ADC on that pin
+WIRING = dict()
+# pin number -> PWM driving that pin
+PWMS = dict()
+# functions called around a light sleep, e.g. VactrolModel.update
+SLEEP_HOOKS = []
+# functions called on a light sleep wake up that drop a radio link
+LINK_HOOKS = []
+# time from the wake up until code runs again
+LIGHTSLEEP_WAKE_MS = 2
+
+
+def pin_id(pin):
+    return getattr(pin, "id", pin)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty_u16=0, lightsleep=False):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+        self.lightsleep = lightsleep
+        self._sleeping = False
+        PWMS[pin_id(pin)] = self
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return 0 if self._sleeping else self._duty
+        self._duty = int(value)
+
+    def deinit(self):
+        self._duty = 0
+
+
+class ADC:
+    """ADC in front of the 1 kOhm / 5 V resistance measuring divider.
+
+    The measured resistance comes from the `resistance` attribute, either a
+    number or a function returning one."""
+
+    ATTN_0DB = 0
+    ATTN_11DB = 3
+
+    V0 = 5.0       # voltage over the divider
+    R_REF = 1000   # reference resistor
+    VMAX = 1.0     # input range, readings saturate above it
+
+    def __init__(self, pin, atten=None):
+        self.pin = pin
+        self.resistance = WIRING.get(pin_id(pin), 10000)
+
+    def _volts(self):
+        r = self.resistance() if callable(self.resistance) else self.resistance
+        return self.V0 * self.R_REF / (self.R_REF + r)
+
+    def read_uv(self):
+        return int(min(self._volts(), self.VMAX) * 1e6)
+
+    def read_u16(self):
+        return min(int(self._volts() / self.VMAX * 65535), 65535)
+
+
+def lightsleep(ms):
+    for hook in SLEEP_HOOKS:
+        hook()
+    stopped = [pwm for pwm in PWMS.values() if not pwm.lightsleep]
+    for pwm in stopped:
+        pwm._sleeping = True
+    time.sleep_ms(ms)
+    for hook in SLEEP_HOOKS:
+        hook()
+    for pwm in stopped:
+        pwm._sleeping = False
+    for hook in LINK_HOOKS:
+        hook()
+    time.sleep_ms(LIGHTSLEEP_WAKE_MS)
+
+
+def unique_id():
+    return b"\x24\x0a\xc4\x5e\xd1\x42"
+
+
+def freq(value=None):
+    return 240000000
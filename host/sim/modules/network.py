@@ -0,0 +1,71 @@
+"""Host stand-in for MicroPython's network module.
+
+A connected station loses its association in a light sleep (machine.lightsleep)
+and has to connect() again."""
+import time
+
+import machine
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    PM_NONE = 0
+    PM_PERFORMANCE = 1
+    PM_POWERSAVE = 2
+    # seconds from connect() until the station is connected
+    CONNECT_DELAY = 1.0
+
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._connect_at = None
+        # set to False to emulate an unreachable access point
+        self.reachable = True
+        self.pm = self.PM_PERFORMANCE
+        # seconds spent in each power management mode
+        self.pm_time = dict()
+        self._pm_since = time.ticks_ms()
+        # associations lost in light sleeps
+        self.drops = 0
+        machine.LINK_HOOKS.append(self._drop)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return getattr(self, args[0])
+        if "pm" in kwargs:
+            now = time.ticks_ms()
+            self.pm_time[self.pm] = self.pm_time.get(self.pm, 0) + time.ticks_diff(now, self._pm_since) / 1000
+            self._pm_since = now
+            self.pm = kwargs["pm"]
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if not value:
+            self._connect_at = None
+
+    def connect(self, ssid=None, password=None):
+        self._connect_at = time.ticks_add(time.ticks_ms(), int(self.CONNECT_DELAY * 1000))
+
+    def disconnect(self):
+        self._connect_at = None
+
+    def _drop(self):
+        if self._connect_at is not None:
+            self.drops += 1
+        self._connect_at = None
+
+    def isconnected(self):
+        return (
+            self.reachable
+            and self._connect_at is not None
+            and time.ticks_diff(time.ticks_ms(), self._connect_at) >= 0
+        )
+
+    def ifconfig(self):
+        if self.isconnected():
+            return ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+        return ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
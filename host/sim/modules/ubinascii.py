@@ -0,0 +1,2 @@
+"""Host stand-in for MicroPython's ubinascii module."""
+from binascii import *  # noqa: F401,F403
@@ -0,0 +1,20 @@
+"""Host stand-in for MicroPython's ujson module.
+
+MicroPython serializes bytes like str and does not escape non-ASCII
+characters, dumps does the same here."""
+import json as _json
+from json import load, loads  # noqa: F401
+
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    return _json.dumps(obj, default=_default, ensure_ascii=False)
+
+
+def dump(obj, stream):
+    stream.write(dumps(obj))
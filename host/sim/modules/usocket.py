@@ -0,0 +1,55 @@
+"""Host stand-in for MicroPython's usocket module.
+
+MicroPython sockets are streams with read/write, CPython sockets only have
+recv/send, so the socket class wraps a CPython socket."""
+import socket as _socket
+from socket import AF_INET, SOCK_STREAM  # noqa: F401
+
+# host name -> (address, port) overrides, e.g. to point homeassistant.local
+# at the stand-in broker
+HOSTS = dict()
+
+
+def getaddrinfo(host, port, *args):
+    if host in HOSTS:
+        host, port = HOSTS[host]
+    return _socket.getaddrinfo(host, port, *args)
+
+
+class socket:
+    def __init__(self, *args):
+        self._sock = _socket.socket(*args)
+        # MicroPython writes small packets in pieces, without this every
+        # QoS 1 round trip waits for a delayed ACK
+        self._sock.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1)
+
+    def connect(self, addr):
+        self._sock.connect(addr)
+
+    def settimeout(self, timeout):
+        self._sock.settimeout(timeout)
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+
+    def write(self, buf, n=None):
+        if n is not None:
+            buf = memoryview(buf)[:n]
+        self._sock.sendall(buf)
+        return len(buf)
+
+    def read(self, n):
+        """Read n bytes (fewer at end of stream), None if non-blocking and no data"""
+        data = b""
+        while len(data) < n:
+            try:
+                chunk = self._sock.recv(n - len(data))
+            except BlockingIOError:
+                return data or None
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def close(self):
+        self._sock.close()
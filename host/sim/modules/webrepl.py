@@ -0,0 +1,9 @@
+"""Host stand-in for MicroPython's webrepl module."""
+
+
+def start(port=8266, password=None):
+    pass
+
+
+def stop():
+    pass
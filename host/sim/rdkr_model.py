@@ -0,0 +1,212 @@
+"""Physical model of the RDKR ventilation unit and the house it ventilates.
+
+The RDKR reads its fresh air thermistor, which the controller replaces by
+LSR2 of the vactrol. It runs the rotor while the temperature it perceives is
+below its set point ("börvärde"). With the rotor running, the supply air
+recovers `efficiency` of the temperature difference to the return air. Units
+with a variable speed rotor (proportional_band) instead run it faster the
+further the perceived temperature is below the set point.
+
+The house is a single thermal mass with losses to the outdoor air,
+ventilation with the supply air, internal and solar gains and a heating
+system that keeps it above the heating set point. It has no cooling, which is
+where the rotor strategy matters in summer.
+
+The four DHT22 stand-ins on the given pins (fresh, supply, return and
+exhaust air) read the air temperatures of the model with some noise. As on
+the board, meter 2 of the vactrol (its LSR2 pin) measures the fresh air
+thermistor, whose resistance follows T0, R0 and TCR.
+
+    vactrol = VactrolModel(None, k1=-1.3, m1=5.2, k2=-1.25, m2=5.15, pins=(21, 32, 33))
+    rdkr = RdkrModel(vactrol, SyntheticWeather(mean_temp=20))
+"""
+import math
+import random
+
+import dht
+import machine
+import sim
+from sim.weather import DAY_S, absolute_humidity, relative_humidity
+
+AIR_HEAT_CAPACITY = 1.2 * 1005  # J/(m3 K)
+
+
+class House:
+    def __init__(self, temp=21.0, capacity=20e6, ua=150, internal_gain=400,
+                 solar_peak=1500, heating_setpoint=20.5, moisture_gain=0.05):
+        """
+        capacity: heat capacity of the building in J/K
+        ua: heat loss to the outdoor air in W/K
+        internal_gain: heat from people and appliances in W
+        solar_peak: solar gain at noon in W
+        heating_setpoint: the heating system keeps the indoor temperature above this
+        moisture_gain: water vapour from people and activities in g/s
+        """
+        self.temp = temp
+        self.capacity = capacity
+        self.ua = ua
+        self.internal_gain = internal_gain
+        self.solar_peak = solar_peak
+        self.heating_setpoint = heating_setpoint
+        self.moisture_gain = moisture_gain
+
+    def solar_gain(self, t):
+        hour = t % DAY_S / 3600
+        return self.solar_peak * max(math.sin(2 * math.pi * (hour - 6) / 24), 0)
+
+    def advance(self, t, dt, outdoor_temp, supply_temp, airflow):
+        """Advance dt seconds, returns the heating power used in W"""
+        ventilation = airflow * AIR_HEAT_CAPACITY
+        power = (self.ua * (outdoor_temp - self.temp)
+                 + ventilation * (supply_temp - self.temp)
+                 + self.internal_gain + self.solar_gain(t))
+        temp = self.temp + power * dt / self.capacity
+        heating = 0.0
+        if temp < self.heating_setpoint:
+            heating = (self.heating_setpoint - temp) * self.capacity / dt
+            temp = self.heating_setpoint
+        self.temp = temp
+        return heating
+
+
+class RdkrModel:
+    def __init__(self, vactrol, weather, house=None, airflow=0.05, efficiency=0.8,
+                 setpoint=16, hysteresis=1.0, fan_heat=0.5, T0=22, R0=10000, TCR=-750,
+                 pins=(15, 27, 26, 25), noise=0.1, seed=2, step_s=60, comfort_max=24.0,
+                 trace_interval_s=600, aim_temp=21.0, proportional_band=None):
+        """
+        vactrol: VactrolModel whose LSR2 replaces the fresh air thermistor
+        weather: function of time in s returning the outdoor (temperature, humidity)
+        airflow: ventilation airflow in m3/s
+        efficiency: temperature efficiency of the rotor
+        setpoint: the rotor runs below this perceived fresh air temperature
+        T0, R0, TCR: the linear thermistor characteristic the RDKR expects
+        pins: DHT22 pins of fresh, supply, return and exhaust air
+        comfort_max: indoor temperature above which overheating is counted
+        trace_interval_s: interval of the samples in trace
+        aim_temp: indoor temperature the deviation is counted from (AIM_TEMP of main.py)
+        proportional_band: for a variable speed rotor, the perceived temperature
+            range in which the speed goes from 0 to 100 % (ending at the set
+            point), None for an on/off rotor with hysteresis
+        """
+        self.vactrol = vactrol
+        self.weather = weather
+        self.house = house if house is not None else House()
+        self.airflow = airflow
+        self.efficiency = efficiency
+        self.setpoint = setpoint
+        self.hysteresis = hysteresis
+        self.fan_heat = fan_heat
+        self.T0 = T0
+        self.R0 = R0
+        self.TCR = TCR
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.step_s = step_s
+        self.comfort_max = comfort_max
+        self.aim_temp = aim_temp
+        self.proportional_band = proportional_band
+
+        self.rotor = False
+        self.speed = 0.0
+        self.outdoor = weather(0)
+        self._t = sim.monotonic()
+        # totals
+        self.rotor_on_s = 0.0      # at full speed
+        self.rotor_starts = 0
+        self.full_speed_starts = 0
+        self.heating_j = 0.0
+        self.overheat_kh = 0.0     # degree hours above comfort_max
+        self.deviation_kh = 0.0    # degree hours from aim_temp
+        self.max_indoor = self.house.temp
+        # samples of the model state every trace_interval_s
+        self.trace = []
+        self.trace_interval_s = trace_interval_s
+        self._next_trace = self._t
+
+        for name, pin in zip(("fresh_air", "supply_air", "return_air", "exhaust_air"), pins):
+            dht.SOURCES[pin] = lambda name=name: self.read(name)
+        if vactrol.pins is not None:
+            machine.WIRING[vactrol.pins[2]] = self.thermistor
+
+    def perceived_temp(self):
+        """Fresh air temperature the RDKR reads from LSR2"""
+        return self.T0 + (self.vactrol.r2() - self.R0) / self.TCR
+
+    def thermistor(self):
+        """Resistance of the fresh air thermistor"""
+        self.update()
+        temp = self.outdoor[0] + self.random.gauss(0, self.noise)
+        return self.R0 + self.TCR * (temp - self.T0)
+
+    def update(self):
+        """Advance the model to the current simulation time"""
+        now = sim.monotonic()
+        perceived = self.perceived_temp()
+        was_running = self.rotor
+        if self.proportional_band:
+            speed = (self.setpoint - perceived) / self.proportional_band
+            self.speed = min(max(speed, 0.0), 1.0)
+            self.rotor = self.speed > 0
+        elif self.rotor and perceived > self.setpoint + self.hysteresis / 2:
+            self.rotor = False
+        elif not self.rotor and perceived < self.setpoint - self.hysteresis / 2:
+            self.rotor = True
+        if not self.proportional_band:
+            self.speed = 1.0 if self.rotor else 0.0
+        if self.rotor and not was_running:
+            self.rotor_starts += 1
+            if self.speed >= 1:
+                self.full_speed_starts += 1
+        while self._t < now:
+            dt = min(self.step_s, now - self._t)
+            self.outdoor = self.weather(self._t)
+            supply, _ = self.air("supply_air")
+            self.heating_j += self.house.advance(self._t, dt, self.outdoor[0], supply, self.airflow) * dt
+            self.rotor_on_s += self.speed * dt
+            indoor = self.house.temp
+            self.max_indoor = max(self.max_indoor, indoor)
+            self.overheat_kh += max(indoor - self.comfort_max, 0) * dt / 3600
+            self.deviation_kh += abs(indoor - self.aim_temp) * dt / 3600
+            self._t += dt
+            if self.trace_interval_s and self._t >= self._next_trace:
+                self._next_trace += self.trace_interval_s
+                self.trace.append(dict(
+                    t=round(self._t), outdoor=round(self.outdoor[0], 2), indoor=round(indoor, 2),
+                    supply=round(supply, 2), rotor=round(self.speed, 2), perceived=round(perceived, 2),
+                    heating_w=round(self.heating_j / max(self._t, 1))))
+
+    def air(self, name):
+        """(temperature, humidity) of the air at one of the four sensors"""
+        fresh_temp, fresh_rh = self.outdoor
+        indoor = self.house.temp
+        recovered = self.efficiency * self.speed * (indoor - fresh_temp)
+        fresh_ah = absolute_humidity(fresh_temp, fresh_rh)
+        indoor_ah = fresh_ah + self.house.moisture_gain / self.airflow
+        if name == "fresh_air":
+            return fresh_temp, fresh_rh
+        if name == "supply_air":
+            temp = fresh_temp + recovered + self.fan_heat
+            return temp, relative_humidity(temp, fresh_ah)
+        if name == "return_air":
+            return indoor, relative_humidity(indoor, indoor_ah)
+        temp = indoor - recovered
+        return temp, relative_humidity(temp, indoor_ah)
+
+    def read(self, name):
+        self.update()
+        temp, rh = self.air(name)
+        return (temp + self.random.gauss(0, self.noise),
+                min(max(rh + self.random.gauss(0, 5 * self.noise), 0), 100))
+
+    def summary(self):
+        return dict(
+            rotor_on_h=round(self.rotor_on_s / 3600, 2),
+            rotor_starts=self.rotor_starts,
+            full_speed_starts=self.full_speed_starts,
+            heating_kwh=round(self.heating_j / 3.6e6, 2),
+            overheat_kh=round(self.overheat_kh, 2),
+            deviation_kh=round(self.deviation_kh, 2),
+            max_indoor=round(self.max_indoor, 2),
+            indoor=round(self.house.temp, 2),
+        )
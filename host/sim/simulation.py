@@ -0,0 +1,158 @@
+"""Run the unmodified boot.py and main.py against the physical models.
+
+The controller runs on the VirtualTimeLoop, the DHT22, ADC and PWM stand-ins
+are wired to a VactrolModel and an RdkrModel, so days of operation take
+seconds:
+
+    import sim
+    sim.install(virtual_time=True)
+    from sim.simulation import Simulation
+    from sim.weather import SyntheticWeather
+
+    result = Simulation(SyntheticWeather(mean_temp=20), days=3).run()
+
+Wi-Fi is unreachable by default, the controller then keeps its states in the
+offline queue. With broker=True it connects to the stand-in broker instead,
+which is slower since MQTT round trips take real time.
+
+With config=dict(power="light", ssid=None) the controller runs without
+Wi-Fi and light sleeps between its tasks, every wake up takes
+wake_latency_ms of simulated time. A light sleep drops the Wi-Fi
+association and the connection to the broker, like on the ESP32.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import runpy
+import tempfile
+import time
+
+import sim
+
+# true LDR coefficients of the simulated vactrol and what config.json says
+COEFFICIENTS = dict(k1=-1.3, m1=5.2, k2=-1.25, m2=5.15)
+
+
+class Simulation:
+    def __init__(self, weather, days=1.0, house=None, coefficients=None, config=None,
+                 wifi=False, broker=False, workdir=None, seed=1, verbose=False, wake_latency_ms=2,
+                 **rdkr_options):
+        """
+        weather: function of time in s returning the outdoor (temperature, humidity)
+        days: simulated duration
+        house: rdkr_model.House, defaults to House()
+        coefficients: k1, m1, k2, m2 of the vactrol, defaults to COEFFICIENTS
+        config: further config.json entries, e.g. dict(strategy="predictive")
+        wifi: whether the access point is reachable
+        broker: connect to a stand-in broker (implies wifi)
+        workdir: directory for config.json, the data log and the queue,
+            defaults to a new temporary directory
+        verbose: show the controller output
+        wake_latency_ms: time from a light sleep wake up until the code runs
+        rdkr_options: passed on to RdkrModel
+        """
+        self.weather = weather
+        self.duration_s = days * 86400
+        self.house = house
+        self.coefficients = dict(COEFFICIENTS)
+        if coefficients:
+            self.coefficients.update(coefficients)
+        self.config = config or dict()
+        self.wifi = wifi or broker
+        self.use_broker = broker
+        self.workdir = workdir or tempfile.mkdtemp(prefix="rdkr-sim-")
+        self.seed = seed
+        self.verbose = verbose
+        self.wake_latency_ms = wake_latency_ms
+        self.rdkr_options = rdkr_options
+        self.output = io.StringIO()
+        self.broker = None
+        self.controller = None
+        self.vactrol = None
+        self.rdkr = None
+
+    def _write_config(self):
+        config = dict(ssid="sim", password="sim", mqtt_user=None, mqtt_password=None)
+        config.update(self.coefficients)
+        config.update(self.config)
+        with open(os.path.join(self.workdir, "config.json"), "w") as f:
+            json.dump(config, f)
+
+    def _start_broker(self):
+        import usocket
+        from sim.broker import Broker
+        self.broker = Broker()
+        usocket.HOSTS["homeassistant.local"] = ("127.0.0.1", self.broker.start())
+
+    def run(self):
+        """Run boot.py and main.py for the simulated duration, returns a summary"""
+        sim.install(virtual_time=True)
+        import machine
+        from sim.rdkr_model import RdkrModel
+        from sim.vactrol_model import VactrolModel
+        # models of earlier runs
+        machine.SLEEP_HOOKS.clear()
+        machine.LINK_HOOKS.clear()
+        machine.LIGHTSLEEP_WAKE_MS = self.wake_latency_ms
+
+        c = self.coefficients
+        self.vactrol = VactrolModel(
+            None, c["k1"], c["m1"], c["k2"], c["m2"], seed=self.seed, pins=(21, 32, 33))
+        self.rdkr = RdkrModel(self.vactrol, self.weather, self.house, seed=self.seed,
+                              **self.rdkr_options)
+        self._write_config()
+        if self.use_broker:
+            self._start_broker()
+            machine.LINK_HOOKS.append(self.broker.drop_clients)
+        import boottime
+        boottime.PHASES.clear()
+
+        def run_controller(main):
+            # main.py calls asyncio.run(controller.run())
+            self.controller = main.cr_frame.f_locals["self"]
+            return sim.run(main, self.duration_s)
+
+        cwd = os.getcwd()
+        real_run = asyncio.run
+        out = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(self.output)
+        t0 = time.perf_counter()
+        try:
+            os.chdir(self.workdir)
+            asyncio.run = run_controller
+            with out:
+                boot = runpy.run_path(os.path.join(sim.SRC, "boot.py"))
+                boot["wlan"].reachable = self.wifi
+                runpy.run_path(os.path.join(sim.SRC, "main.py"), init_globals=boot)
+        finally:
+            asyncio.run = real_run
+            os.chdir(cwd)
+            if self.broker is not None:
+                self.broker.stop()
+        wall_s = time.perf_counter() - t0
+        return self.summary(wall_s)
+
+    def summary(self, wall_s):
+        state = self.controller.state
+        result = dict(
+            days=round(self.duration_s / 86400, 2),
+            wall_s=round(wall_s, 2),
+            speedup=round(self.duration_s / max(wall_s, 1e-9)),
+        )
+        result.update(self.rdkr.summary())
+        result["controller_runs"] = dict(state.runs)
+        result["queued"] = len(self.controller.queue)
+        import boottime
+        # end of each boot phase in simulated ms
+        result["boot_ms"] = dict(boottime.PHASES)
+        if self.broker is not None:
+            result["mqtt_messages"] = len(self.broker.messages)
+        power = self.controller.power
+        if power is not None:
+            result["power"] = power.report()
+            wlan = self.controller.wlan
+            wlan.config(pm=wlan.pm)
+            result["power"]["wifi_power_save_s"] = round(wlan.pm_time.get(wlan.PM_POWERSAVE, 0))
+            result["power"]["wifi_drops"] = wlan.drops
+        return result
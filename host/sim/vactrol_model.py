@@ -0,0 +1,116 @@
+"""Physical model of the dual vactrol (one LED, two LDRs).
+
+Each LDR follows log10(R) = m + k * log10(pwm %) at steady state, saturating
+at the dark resistance. The resistance approaches that value with a first
+order lag whose time constant grows with resistance (LDRs are slow in the dark)
+and is longer when the light decreases than when it increases. The ADC
+readings get gaussian voltage noise.
+"""
+import math
+import random
+
+import machine
+import sim
+
+LOG_R_DARK = 6.3      # ~2 MOhm dark resistance
+LOG_R_MIN = 2.0       # 100 Ohm fully lit
+
+
+class LDR:
+    def __init__(self, k, m, tau_ms=60, decay_factor=3.0):
+        """k, m: true coefficients of the LDR
+        tau_ms: time constant at 10 kOhm when the light increases
+        decay_factor: how much slower the LDR is when the light decreases"""
+        self.k = k
+        self.m = m
+        self.tau_ms = tau_ms
+        self.decay_factor = decay_factor
+        self.log_r = LOG_R_DARK
+
+    def steady_state(self, pwm):
+        if pwm <= 0:
+            return LOG_R_DARK
+        return min(max(self.m + self.k * math.log10(pwm), LOG_R_MIN), LOG_R_DARK)
+
+    def advance(self, pwm, dt_ms):
+        target = self.steady_state(pwm)
+        tau = self.tau_ms * 10 ** (0.5 * (self.log_r - 4))
+        if target > self.log_r:
+            tau *= self.decay_factor
+        self.log_r = target + (self.log_r - target) * math.exp(-dt_ms / tau)
+
+
+class VactrolModel:
+    """Drives the resistance seen by the ADC stand-ins of a dualVactrol.
+
+        model = VactrolModel(vac, k1=-1.3, m1=5.2, k2=-1.25, m2=5.15)
+
+    Without vac the model is wired to the pins (LED, LSR1, LSR2) instead, so
+    a dualVactrol created later on these pins sees it:
+
+        model = VactrolModel(None, k1=-1.3, m1=5.2, k2=-1.25, m2=5.15, pins=(21, 32, 33))
+    """
+
+    def __init__(self, vac, k1, m1, k2, m2, noise_uv=1500, seed=1, tau_ms=60, pins=None):
+        self.vac = vac
+        self.pins = pins
+        self.ldr1 = LDR(k1, m1, tau_ms)
+        self.ldr2 = LDR(k2, m2, tau_ms)
+        self.noise_uv = noise_uv
+        self.random = random.Random(seed)
+        self._t = sim.monotonic()
+        # the LED may go dark in light sleep
+        machine.SLEEP_HOOKS.append(self.update)
+        read1 = lambda: self._read(self.ldr1)  # noqa: E731
+        read2 = lambda: self._read(self.ldr2)  # noqa: E731
+        if vac is not None:
+            vac.lsr1.resistance = read1
+            vac.lsr2.resistance = read2
+        else:
+            machine.WIRING[pins[1]] = read1
+            machine.WIRING[pins[2]] = read2
+
+    @property
+    def pwm(self):
+        if self.vac is not None:
+            led = self.vac.led
+        else:
+            led = machine.PWMS.get(self.pins[0])
+            if led is None:
+                return 0
+        return led.duty_u16() / 65535 * 100
+
+    def update(self):
+        """Advance both LDRs to the current simulation time"""
+        now = sim.monotonic()
+        dt_ms = (now - self._t) * 1000
+        self._t = now
+        if dt_ms > 0:
+            pwm = self.pwm
+            self.ldr1.advance(pwm, dt_ms)
+            self.ldr2.advance(pwm, dt_ms)
+
+    def settle(self):
+        """Jump both LDRs to their steady state"""
+        self.update()
+        for ldr in (self.ldr1, self.ldr2):
+            ldr.log_r = ldr.steady_state(self.pwm)
+
+    def r1(self):
+        self.update()
+        return 10 ** self.ldr1.log_r
+
+    def r2(self):
+        self.update()
+        return 10 ** self.ldr2.log_r
+
+    def _read(self, ldr):
+        """Resistance as seen through the noisy ADC"""
+        self.update()
+        adc = machine.ADC
+        r = 10 ** ldr.log_r
+        volts = adc.V0 * adc.R_REF / (adc.R_REF + r)
+        volts += self.random.gauss(0, self.noise_uv / 1e6)
+        volts = min(max(volts, 1e-6), adc.V0 - 1e-6)
+        # resistance that gives this voltage over the reference resistor
+        return adc.R_REF * (adc.V0 - volts) / volts
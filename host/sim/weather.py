@@ -0,0 +1,109 @@
+"""Outdoor temperature and humidity traces for the simulation.
+
+A trace is a function of the simulation time in seconds returning
+(temperature in C, relative humidity in %). SyntheticWeather produces a daily
+cycle with slow weather changes, CsvWeather replays recorded data.
+"""
+import csv
+import math
+
+DAY_S = 86400
+
+
+def saturation_vapour_density(temp):
+    """Water vapour density at saturation in g/m3 (Magnus formula)"""
+    pressure = 6.112 * math.exp(17.62 * temp / (243.12 + temp))  # hPa
+    return 216.7 * pressure / (273.15 + temp)
+
+
+def absolute_humidity(temp, rh):
+    return saturation_vapour_density(temp) * rh / 100
+
+
+def relative_humidity(temp, ah):
+    """Relative humidity of air with absolute humidity ah, condensing at 100 %"""
+    return min(100 * ah / saturation_vapour_density(temp), 100.0)
+
+
+class SyntheticWeather:
+    """Daily temperature cycle (coldest at 5, warmest at 15) on top of slow
+    weather changes over a few days. The absolute humidity follows the daily
+    mean temperature, so the relative humidity peaks at night like outdoors.
+
+        weather = SyntheticWeather(mean_temp=20, daily_amplitude=7)
+        temp, rh = weather(3600)
+    """
+
+    def __init__(self, mean_temp=15.0, daily_amplitude=6.0, weather_amplitude=3.0,
+                 mean_rh=70.0, seed=1):
+        self.mean_temp = mean_temp
+        self.daily_amplitude = daily_amplitude
+        self.weather_amplitude = weather_amplitude
+        self.mean_rh = mean_rh
+        # seed picks the phases of the weather changes
+        self.phase1 = (seed * 0.618) % 1 * 2 * math.pi
+        self.phase2 = (seed * 0.382) % 1 * 2 * math.pi
+
+    def daily_mean(self, t):
+        days = t / DAY_S
+        return self.mean_temp + self.weather_amplitude * (
+            0.7 * math.sin(2 * math.pi * days / 3.7 + self.phase1)
+            + 0.3 * math.sin(2 * math.pi * days / 1.9 + self.phase2))
+
+    def __call__(self, t):
+        hour = t % DAY_S / 3600
+        mean = self.daily_mean(t)
+        temp = mean + self.daily_amplitude * math.sin(2 * math.pi * (hour - 9) / 24)
+        ah = absolute_humidity(mean, self.mean_rh)
+        return temp, relative_humidity(temp, ah)
+
+
+PRESETS = dict(
+    summer=dict(mean_temp=19, daily_amplitude=7, mean_rh=65),
+    heatwave=dict(mean_temp=25, daily_amplitude=8, mean_rh=55),
+    spring=dict(mean_temp=8, daily_amplitude=6, mean_rh=75),
+    winter=dict(mean_temp=-2, daily_amplitude=3, mean_rh=85),
+)
+
+
+class CsvWeather:
+    """Recorded weather, linearly interpolated. The CSV file has the columns
+    seconds, temperature and humidity (header row optional). The trace repeats
+    after its last row.
+
+        weather = CsvWeather("stockholm_july.csv")
+    """
+
+    def __init__(self, path):
+        self.rows = []
+        with open(path, newline="") as f:
+            for row in csv.reader(f):
+                try:
+                    self.rows.append(tuple(float(v) for v in row[:3]))
+                except ValueError:
+                    continue  # header
+        if len(self.rows) < 2:
+            raise ValueError(f"{path} needs at least two rows")
+        self.rows.sort()
+        self.period = self.rows[-1][0] - self.rows[0][0]
+
+    def __call__(self, t):
+        rows = self.rows
+        t = rows[0][0] + (t - rows[0][0]) % self.period
+        lo, hi = 0, len(rows) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if rows[mid][0] <= t:
+                lo = mid
+            else:
+                hi = mid
+        (t0, temp0, rh0), (t1, temp1, rh1) = rows[lo], rows[hi]
+        f = (t - t0) / (t1 - t0) if t1 > t0 else 0
+        return temp0 + f * (temp1 - temp0), rh0 + f * (rh1 - rh0)
+
+
+def get(name_or_path, seed=1):
+    """A preset name (summer, heatwave, spring, winter) or a CSV file"""
+    if name_or_path in PRESETS:
+        return SyntheticWeather(seed=seed, **PRESETS[name_or_path])
+    return CsvWeather(name_or_path)
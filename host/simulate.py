@@ -0,0 +1,57 @@
+"""Replay days of controller operation against the simulated RDKR and house.
+
+Runs the unmodified src/boot.py and src/main.py in virtual time with the
+physical models in host/sim and prints rotor hours, heating energy and
+overheating of the house.
+
+Run from the repository root:
+    python host/simulate.py --days 7 --weather heatwave
+    python host/simulate.py --days 2 --weather recorded.csv --trace trace.csv
+    python host/simulate.py --days 0.1 --broker --verbose
+
+--weather is a preset (summer, heatwave, spring, winter) or a CSV file with
+the columns seconds, temperature and humidity.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sim  # noqa: E402
+from sim import weather  # noqa: E402
+from sim.simulation import Simulation  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=1.0)
+    parser.add_argument("--weather", default="summer", help="preset name or CSV file")
+    parser.add_argument("--strategy", default="rules", choices=("rules", "predictive", "modulating"))
+    parser.add_argument("--band", type=float,
+                        help="proportional band in C of a variable speed rotor, default on/off")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--broker", action="store_true", help="connect to a stand-in MQTT broker")
+    parser.add_argument("--trace", help="write the model state every 10 minutes to this CSV file")
+    parser.add_argument("--verbose", action="store_true", help="show the controller output")
+    args = parser.parse_args()
+
+    sim.install(virtual_time=True)
+    simulation = Simulation(weather.get(args.weather, args.seed), days=args.days,
+                            config=dict(strategy=args.strategy), broker=args.broker,
+                            seed=args.seed, verbose=args.verbose, proportional_band=args.band)
+    result = simulation.run()
+    print(json.dumps(result, indent=2))
+
+    if args.trace:
+        trace = simulation.rdkr.trace
+        with open(args.trace, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(trace[0]))
+            writer.writeheader()
+            writer.writerows(trace)
+        print(f"{len(trace)} samples written to {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
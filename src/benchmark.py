@@ -0,0 +1,151 @@
+import gc
+import json
+import sys
+import time
+from sensors import DHT_MIN_INTERVAL_MS
+from strategy import calculate_dew_point, rule_strategy
+
+try:
+    import tracemalloc  # CPython
+except ImportError:
+    tracemalloc = None
+
+# bump when the stages or the file layout change, results are only comparable
+# within the same version
+VERSION = 1
+STAGES = ("read_sensors", "dew_point", "strategy", "set_r2", "publish")
+
+
+class CycleBenchmark:
+    """Times the stages of the control cycle: reading the sensors, the dew
+    point, the strategy, set_r2 and the MQTT publish.
+
+    Each stage records its time in us and the heap it allocates: bytes
+    allocated with the garbage collector disabled on MicroPython
+    (gc.mem_alloc), the peak heap growth on CPython (tracemalloc). set_r2
+    alternates between the rotor on and off resistances, so every cycle
+    regulates, and its steps and settle time are recorded as well.
+
+    Example usage (stop main.py with Ctrl-C first):
+        import benchmark
+        benchmark.run(rdkr, cycles=10, label="v1.3")
+    """
+
+    def __init__(
+        self,
+        rdkr: "Rdkr",
+        group: "EntityGroup" = None,
+        aim_temp: float = 21,
+        relaxing_temp: float = 2.6,
+        dew_point_margin: float = 1,
+        clock_us=None):
+        """group: publish the state with this EntityGroup, None to skip publish
+        clock_us: function returning microsecond ticks, defaults to time.ticks_us"""
+        self.rdkr = rdkr
+        self.group = group
+        self.aim_temp = aim_temp
+        self.relaxing_temp = relaxing_temp
+        self.dew_point_margin = dew_point_margin
+        self.clock_us = clock_us if clock_us is not None else time.ticks_us
+        self.targets = (rdkr.calculate_resistance(rdkr.ROTOR_ON_TEMP),
+                        rdkr.calculate_resistance(rdkr.ROTOR_OFF_TEMP))
+        self.reset()
+
+    def reset(self):
+        self.samples = dict()   # stage -> list of (us, bytes)
+        self.cycle_us = []
+        self.regulation = []    # (steps, time_ms, converged) per set_r2
+
+    def _measure(self, stage: str, f, *args):
+        gc.collect()
+        if tracemalloc is not None:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+        else:
+            gc.disable()
+            before = gc.mem_alloc()
+        t0 = self.clock_us()
+        try:
+            result = f(*args)
+        finally:
+            us = time.ticks_diff(self.clock_us(), t0)
+            if tracemalloc is not None:
+                allocated = tracemalloc.get_traced_memory()[1] - before
+                tracemalloc.stop()
+            else:
+                allocated = gc.mem_alloc() - before
+                gc.enable()
+        self.samples.setdefault(stage, []).append((us, allocated))
+        self._cycle_us += us
+        return result
+
+    def cycle(self, i: int = 0):
+        """One control cycle, i picks the set_r2 target"""
+        rdkr = self.rdkr
+        # sum of the stage times, without the gc.collect between the stages
+        self._cycle_us = 0
+        s = self._measure("read_sensors", rdkr.read_sensors).values
+        dew_point = self._measure("dew_point", calculate_dew_point, s["return_air_temp"], s["return_air_hum"])
+        action, rotor_state, strategy_state = self._measure(
+            "strategy", rule_strategy, s, dew_point, self.aim_temp,
+            self.relaxing_temp, self.dew_point_margin)
+        self._measure("set_r2", rdkr.vac.set_r2, self.targets[i % 2])
+        regulation = rdkr.vac.regulation
+        self.regulation.append((regulation["steps"], regulation["time_ms"], regulation["converged"]))
+        if self.group is not None:
+            payload = rdkr.snapshot.payload()
+            payload.update(dict(rotor_state=rotor_state, strategy_state=strategy_state))
+            self._measure("publish", self.group.publish_state, payload)
+        self.cycle_us.append(self._cycle_us)
+
+    def run(self, cycles: int = 10):
+        for i in range(cycles):
+            t0 = time.ticks_ms()
+            self.cycle(i)
+            # the DHT22s are only measured again after DHT_MIN_INTERVAL_MS
+            wait = DHT_MIN_INTERVAL_MS - time.ticks_diff(time.ticks_ms(), t0)
+            if wait > 0 and i < cycles - 1:
+                time.sleep_ms(wait)
+
+    def results(self, label: str = "") -> dict:
+        stages = dict()
+        for stage in STAGES:
+            if stage in self.samples:
+                samples = self.samples[stage]
+                stages[stage] = dict(
+                    us=_stats([s[0] for s in samples]),
+                    bytes=_stats([s[1] for s in samples]))
+        return dict(
+            version=VERSION,
+            label=label,
+            platform=sys.platform,
+            implementation=sys.implementation.name,
+            cycles=len(self.cycle_us),
+            cycle_us=_stats(self.cycle_us),
+            stages=stages,
+            set_r2=dict(
+                steps=_stats([r[0] for r in self.regulation]),
+                time_ms=_stats([r[1] for r in self.regulation]),
+                converged=sum(1 for r in self.regulation if r[2])),
+        )
+
+
+def _stats(values: list) -> dict:
+    if not values:
+        return dict()
+    values = sorted(values)
+    return dict(min=values[0], median=values[len(values) // 2], max=values[-1])
+
+
+def run(rdkr, group=None, cycles: int = 10, path: str = "benchmark.json", label: str = "", **kwargs) -> dict:
+    """Benchmark cycles control cycles, print the results and write them to path"""
+    bench = CycleBenchmark(rdkr, group, **kwargs)
+    bench.run(cycles)
+    results = bench.results(label)
+    for stage, r in results["stages"].items():
+        print(f"{stage:>12}: {r['us']['median']:>8} us {r['bytes']['median']:>7} bytes")
+    print(f"{'cycle':>12}: {results['cycle_us']['median']:>8} us, set_r2 {results['set_r2']['steps']['median']} steps")
+    if path:
+        with open(path, "w") as f:
+            json.dump(results, f)
+    return results
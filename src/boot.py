@@ -1,23 +1,24 @@
 import network
 import json
-import time
-import webrepl
+import boottime
 
-# Read configuration from config.json
+# Read configuration from config.json, once. main.py shares these globals
+# and passes the config on.
 try:
     with open('config.json', 'r') as config_file:
         config = json.load(config_file)
-        ssid = config.get('ssid')
-        password = config.get('password')
-        mqtt_user = config.get('mqtt_user')
-        mqtt_password = config.get('mqtt_password')
 except OSError as e:
     print(f"Could not find config.json: {e}")
-    
-# Set up Wi-Fi
+    config = dict()
+ssid = config.get('ssid')
+password = config.get('password')
+mqtt_user = config.get('mqtt_user')
+mqtt_password = config.get('mqtt_password')
+boottime.mark("config")
+
+# Wi-Fi is brought up by the controller in the background, after the first
+# rotor decision
 wlan = network.WLAN(network.STA_IF)
-wlan.active(False)
-wlan.active(True)
 
 
 # Add your application-specific logic in main.py
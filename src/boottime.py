@@ -0,0 +1,25 @@
+import time
+
+# (phase, ticks_ms at its end), ticks_ms counts from the reset
+PHASES = []
+
+
+def mark(phase: str) -> bool:
+    """Record the end of a boot phase, False if it was recorded before
+    (Wi-Fi reconnects)"""
+    for name, _ in PHASES:
+        if name == phase:
+            return False
+    PHASES.append((phase, time.ticks_ms()))
+    return True
+
+
+def report() -> str:
+    """The boot phases with their duration and end time in ms since the reset.
+    Phases running in the background (wifi, mqtt) overlap the others."""
+    parts = []
+    previous = 0
+    for phase, end in PHASES:
+        parts.append(f"{phase} {time.ticks_diff(end, previous)} ms (at {end})")
+        previous = end
+    return "boot: " + ", ".join(parts)
@@ -0,0 +1,531 @@
+import asyncio
+import time
+import boottime
+from mqtt_queue import StateQueue
+from publish_policy import PublishPolicy
+from strategy import calculate_dew_point, rule_strategy
+
+# Default task periods in seconds
+PERIODS = dict(
+    sense=10,        # read the DHT sensors (DHT22 needs at least 2 s between reads)
+    strategy=30,     # evaluate the rotor strategy
+    regulate=60,     # re-apply the vactrol setpoint (also runs when the target changes)
+    publish=10,      # publish changed values to MQTT (rate limited by the publish policy)
+    keepalive=240,   # MQTT ping, must be shorter than the broker keepalive (600 s)
+    mqtt=5,          # handle incoming MQTT messages (Home Assistant restarts, settings)
+    wifi=10,         # Wi-Fi and MQTT supervision
+    log=120,         # append a record to the data log on flash
+)
+
+WIFI_TIMEOUT_MS = 30000
+# incoming MQTT messages handled per poll
+MAX_MESSAGES = 4
+# how often the idle task checks for a chance to light sleep while tasks run
+IDLE_POLL_S = 0.05
+# settings that Home Assistant can change while running, as number entities
+# (min, max, step) or select entities (options), saved to config.json
+SETTINGS = dict(
+    aim_temp=dict(min=15, max=28, step=0.5, unit="°C"),
+    dew_point_margin=dict(min=-5, max=5, step=0.5, unit="°C"),
+    relaxing_temp=dict(min=0, max=10, step=0.1, unit="°C"),
+    strategy=dict(options=("rules", "predictive", "modulating")),
+)
+# statistics of the sensor history (history.History) published as sensors:
+# key, resolution and statistic of the ring, unit of the sensor
+STATISTICS = dict(
+    fresh_air_temp_min=dict(key="fresh_air_temp", resolution="15min", stat="min", unit="°C"),   # last 24 h
+    fresh_air_temp_max=dict(key="fresh_air_temp", resolution="15min", stat="max", unit="°C"),
+    return_air_temp_mean=dict(key="return_air_temp", resolution="15min", stat="mean", unit="°C"),
+    fresh_air_temp_trend=dict(key="fresh_air_temp", resolution="raw", stat="slope", unit="°C/h"),  # last 30 min
+    return_air_temp_trend=dict(key="return_air_temp", resolution="raw", stat="slope", unit="°C/h"),
+)
+
+
+def save_settings(values: dict, path: str = "config.json"):
+    """Saves changed settings to config.json, used from the next boot"""
+    import json
+
+    with open(path, "r") as config_file:
+        config = json.load(config_file)
+
+    config.update(values)
+
+    with open(path, "w") as config_file:
+        json.dump(config, config_file)
+
+
+class State:
+    """State shared between the controller tasks"""
+
+    def __init__(self):
+        # latest sensor snapshot and its values
+        self.snapshot = None
+        self.sensors = None
+        self.dew_point = None
+        # strategy output
+        self.action = None
+        self.r2_target = None
+        self.rotor_state = "on"
+        self.strategy_state = "strategy"
+        # connectivity
+        self.wifi_connected = False
+        self.group = None
+        # set by the strategy task when the vactrol setpoint changes
+        self.target_changed = asyncio.Event()
+        # set when a setting changed, the strategy is evaluated right away
+        self.settings_changed = asyncio.Event()
+        # telemetry of the last vactrol regulation (steps, time_ms, error, ...)
+        self.regulation = None
+        # scheduler statistics per task
+        self.runs = dict()
+        self.last_run_ms = dict()
+        self.last_duration_ms = dict()
+        # ticks_ms each task is due next, and the tasks running their job now
+        self.next_run_ms = dict()
+        self.running = set()
+
+
+class Controller:
+    """Asyncio based controller running sensing, strategy, vactrol regulation,
+    MQTT publishing and Wi-Fi supervision as independent periodic tasks.
+    Without an ssid in the config it runs standalone, without the Wi-Fi and
+    MQTT tasks."""
+
+    def __init__(
+        self,
+        rdkr,
+        wlan,
+        config: dict,
+        aim_temp: float,
+        dew_point_margin: float,
+        relaxing_temp: float,
+        webrepl=None,
+        setup_mqtt=None,
+        periods: dict = None,
+        datalog=None,
+        queue=None,
+        policy=None,
+        strategy=None,
+        power=None,
+        create_strategy=None,
+        history=None):
+        """Instantiate the controller.
+
+        config: parsed config.json (ssid, password, mqtt_user, mqtt_password)
+        webrepl: webrepl module, or True to import it, started once Wi-Fi is connected
+        setup_mqtt: function returning an EntityGroup, defaults to ha_mqtt.setup_mqtt
+            with the asynchronous client (imported once Wi-Fi is connected)
+        periods: overrides of the default task periods (seconds)
+        datalog: optional datalog.DataLog to record the controller history in
+        queue: mqtt_queue.StateQueue holding states while MQTT is unreachable
+        policy: publish_policy.PublishPolicy deciding which values are published
+        strategy: function deciding the rotor action, defaults to strategy.rule_strategy
+        power: power.PowerManager for Wi-Fi power save, and light sleep between
+            the tasks of a standalone controller
+        create_strategy: function returning the strategy for one of the options of
+            SETTINGS["strategy"], so that it can be switched from Home Assistant
+        history: history.History the sensor values are added to. Strategies with a
+            history attribute get it, and STATISTICS are published as sensors.
+        """
+        self.rdkr = rdkr
+        self.wlan = wlan
+        self.config = config
+        self.aim_temp = aim_temp
+        self.dew_point_margin = dew_point_margin
+        self.relaxing_temp = relaxing_temp
+        self.webrepl = webrepl
+        self._webrepl_started = False
+        self._wifi_started = False
+        self.setup_mqtt = setup_mqtt
+        self._mqtt_task = None
+        self.datalog = datalog
+        self.queue = queue if queue is not None else StateQueue()
+        self.policy = policy if policy is not None else PublishPolicy()
+        self.strategy = strategy if strategy is not None else rule_strategy
+        self.power = power
+        self.create_strategy = create_strategy
+        self.history = history
+        self.statistics = STATISTICS if history is not None else dict()
+        self._give_history(self.strategy)
+        # the strategy can only be switched with create_strategy
+        self.settings = {key: spec for key, spec in SETTINGS.items()
+                         if key != "strategy" or create_strategy is not None}
+        self.periods = dict(PERIODS)
+        if periods:
+            self.periods.update(periods)
+        self.state = State()
+
+    def _give_history(self, strategy):
+        """Let a strategy query the sensor history"""
+        if self.history is not None and hasattr(strategy, "history"):
+            strategy.history = self.history
+
+    async def _every(self, name: str, job, wake=None):
+        """Run job every period seconds. If wake (an Event) is set, the job
+        runs right away instead of waiting for the rest of the period."""
+        state = self.state
+        power = self.power
+        while True:
+            t0 = time.ticks_ms()
+            state.running.add(name)
+            if power is not None:
+                due = state.next_run_ms.get(name, t0)
+                power.started(name, time.ticks_diff(t0, due))
+            try:
+                await job()
+            except Exception as e:
+                print(f"{name} task failed: {e}")
+            state.running.discard(name)
+            if power is not None:
+                power.finished(name)
+            elapsed = time.ticks_diff(time.ticks_ms(), t0)
+            state.runs[name] = state.runs.get(name, 0) + 1
+            state.last_run_ms[name] = t0
+            state.last_duration_ms[name] = elapsed
+
+            period_ms = int(self.periods[name] * 1000)
+            state.next_run_ms[name] = time.ticks_add(t0, max(period_ms, elapsed))
+            remaining = max(period_ms - elapsed, 0) / 1000
+            if wake is None:
+                await asyncio.sleep(remaining)
+            else:
+                try:
+                    await asyncio.wait_for(wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+
+    async def sense(self):
+        """Read all sensors into the shared state"""
+        if self.power is not None:
+            self.power.cycle()
+        snapshot = await self.rdkr.sensors.read_async()
+        self.rdkr.snapshot = snapshot
+        self.state.snapshot = snapshot
+        self.state.sensors = snapshot.values
+        if self.history is not None:
+            self.history.add(snapshot)
+
+    async def evaluate_strategy(self):
+        """Decide the rotor action and the resulting vactrol setpoint"""
+        state = self.state
+        snapshot = state.snapshot
+        if snapshot is None:
+            return
+        if snapshot.is_stale("fresh_air", "return_air"):
+            # keep the current setpoint rather than deciding on old values
+            state.strategy_state = "sensor data is stale, keeping current rotor setting"
+            print(f"{state.strategy_state}: {snapshot.stale}")
+            return
+        s = snapshot.values
+        if snapshot.is_stale("supply_air"):
+            # stale values are kept in the snapshot, the strategies get None
+            s = dict(s, supply_air_temp=None)
+
+        dew_point = calculate_dew_point(s["return_air_temp"], s["return_air_hum"])
+        state.dew_point = dew_point
+        print(f"dew point is: {dew_point}, given temperature {s['return_air_temp']} and humidity {s['return_air_hum']}")
+
+        prepare = getattr(self.strategy, "prepare", None)
+        if prepare is not None:
+            # slow preparations, e.g. a replay of the data log, yield to the other tasks
+            await prepare()
+        action, rotor_state, strategy_state = self.strategy(
+            s, dew_point, self.aim_temp, self.relaxing_temp, self.dew_point_margin)
+
+        rdkr = self.rdkr
+        if action == "on":
+            r2_target = rdkr.calculate_resistance(rdkr.ROTOR_ON_TEMP)
+        elif action == "off":
+            r2_target = rdkr.calculate_resistance(rdkr.ROTOR_OFF_TEMP)
+        elif action == "modulate":
+            if snapshot.is_stale("supply_air"):
+                # modulation follows the supply air, never on an old value
+                print("supply air data is stale, keeping current rotor setting")
+                return
+            # emulated fresh air temperature chosen by the strategy
+            r2_target = rdkr.calculate_resistance(self.strategy.out_temp)
+        else:
+            if snapshot.is_stale("r2"):
+                print("r2 measurement is not valid, keeping current rotor setting")
+                return
+            # Set r2 to the resistance measured of the termisor
+            r2_target = s["r2"]
+
+        if strategy_state != state.strategy_state:
+            print(strategy_state)
+        state.rotor_state = rotor_state
+        state.strategy_state = strategy_state
+        if action != state.action or r2_target != state.r2_target:
+            state.action = action
+            state.r2_target = r2_target
+            state.target_changed.set()
+
+    async def regulate(self):
+        """Drive the vactrol to the current r2 target"""
+        if self.state.r2_target is None:
+            return
+        await self.rdkr.vac.set_r2_async(self.state.r2_target)
+        self.state.regulation = self.rdkr.vac.regulation
+
+    async def publish(self):
+        """Publish changed sensor values and strategy state to MQTT, queue the
+        state while offline"""
+        state = self.state
+        if state.snapshot is None:
+            return
+        payload = dict()
+        payload.update(state.snapshot.payload())
+        payload.update(dict(
+            rotor_state = state.rotor_state,
+            strategy_state = state.strategy_state
+            ))
+        drift = self.rdkr.vac.drift
+        if drift is not None:
+            payload["vactrol_drift"] = f"{drift.percent():.1f}"
+        for key in self.settings:
+            payload[key] = str(self.setting(key))
+        for key, spec in self.statistics.items():
+            value = self.history.stat(spec["key"], spec["resolution"], spec["stat"])
+            if value is not None:
+                payload[key] = f"{value:.2f}" if spec["stat"] == "slope" else f"{value:.1f}"
+        now = time.ticks_ms()
+        values = self.policy.select(payload, now)
+        if not values:
+            return
+        # goes along with other values, it would trigger itself while offline
+        payload["queue_depth"] = values["queue_depth"] = str(len(self.queue))
+        print(values)
+        backlog = len(self.queue)
+        if state.group is None or not state.wifi_connected:
+            self.queue.put(payload)
+        else:
+            sent = self.queue.publish_state(payload, values=values)
+            if sent and backlog:
+                # back online, bring all entities up to date next time
+                self.policy.reset()
+                return
+            if sent is None:
+                # the publish window was full, the rest goes out next time
+                for key in state.group.unsent:
+                    values.pop(key, None)
+                    self.policy.forget(key)
+        # queued values count as published, the queue replays them
+        self.policy.sent(values, now)
+
+    async def keepalive(self):
+        """Ping the broker so the connection survives quiet periods"""
+        group = self.state.group
+        if group is None:
+            return
+        try:
+            group.mqtt.ping()
+        except OSError:
+            group.mqtt.reconnect()
+        # replay states queued during an outage without waiting for the next publish
+        if len(self.queue) and group.mqtt.connected:
+            self.queue.flush()
+
+    async def poll_mqtt(self):
+        """Handle incoming MQTT messages and republish the discovery configs if needed"""
+        group = self.state.group
+        if group is None or not group.mqtt.connected:
+            return
+        if boottime.mark("mqtt"):
+            print(boottime.report())
+        for _ in range(MAX_MESSAGES):
+            group.mqtt.check_msg()
+        if hasattr(group, "take_commands"):
+            for key, msg in group.take_commands().items():
+                self.apply_setting(key, msg)
+        if group.rediscover:
+            # Home Assistant restarted and lost the entity states
+            self.policy.reset()
+        group.update_discovery()
+
+    def setting(self, key: str):
+        """Current value of a setting"""
+        if key == "strategy":
+            return self.config.get("strategy", "rules")
+        return getattr(self, key)
+
+    def apply_setting(self, key: str, msg: bytes) -> bool:
+        """Validate a value received for a setting, apply it and save it to
+        config.json. Returns False if it was rejected."""
+        spec = self.settings.get(key)
+        if spec is None:
+            return False
+        try:
+            value = str(msg, "utf-8").strip()
+            if "options" in spec:
+                if value not in spec["options"]:
+                    raise ValueError(f"not one of {spec['options']}")
+            else:
+                value = float(value)
+                if not spec["min"] <= value <= spec["max"]:
+                    raise ValueError(f"not within {spec['min']} to {spec['max']}")
+                # on the step grid of the entity
+                value = round(round(value / spec["step"]) * spec["step"], 3)
+        except (UnicodeError, ValueError) as e:
+            print(f"rejected {key} {msg}: {e}")
+            # publish the current value again, Home Assistant shows the rejected one
+            self.policy.forget(key)
+            return False
+        if value == self.setting(key):
+            self.policy.forget(key)
+            return True
+        if key == "strategy":
+            self.strategy = self.create_strategy(value)
+            self._give_history(self.strategy)
+        else:
+            setattr(self, key, value)
+        self.config[key] = value
+        try:
+            save_settings({key: value})
+        except OSError as e:
+            print(f"could not save {key}: {e}")
+        print(f"{key} set to {value}")
+        self.policy.forget(key)
+        # decide with the new setting before the next sensor read
+        self.state.settings_changed.set()
+        return True
+
+    async def log(self):
+        """Append the current state to the data log"""
+        state = self.state
+        if self.datalog is None or state.snapshot is None:
+            return
+        vac = self.rdkr.vac
+        self.datalog.append(
+            state.snapshot.values, vac.meter1.value, vac.led.duty_u16(),
+            state.action, state.snapshot.stale)
+
+    async def supervise_wifi(self):
+        """Reconnect Wi-Fi without blocking the other tasks and set up MQTT once connected"""
+        state = self.state
+        wlan = self.wlan
+        if not self._wifi_started:
+            # restart the interface, it may hold a connection from before a soft reboot
+            wlan.active(False)
+            wlan.active(True)
+            self._wifi_started = True
+        if not wlan.isconnected():
+            state.wifi_connected = False
+            try:
+                wlan.connect(self.config.get("ssid"), self.config.get("password"))
+            except OSError as e:
+                print(f"Wi-Fi connect failed: {e}")
+                return
+            t0 = time.ticks_ms()
+            while not wlan.isconnected():
+                if time.ticks_diff(time.ticks_ms(), t0) > WIFI_TIMEOUT_MS:
+                    print("Wi-Fi connection failed within the timeout.")
+                    return
+                await asyncio.sleep(0.5)
+
+        configuration_url = wlan.ifconfig()[0]
+        if not state.wifi_connected:
+            state.wifi_connected = True
+            print("Wi-Fi connected:", configuration_url)
+            boottime.mark("wifi")
+            if self.webrepl is not None and not self._webrepl_started:
+                webrepl = self.webrepl
+                if webrepl is True:
+                    import webrepl
+                webrepl.start()
+                self._webrepl_started = True
+            # the data log needs the real time
+            try:
+                import ntptime
+                ntptime.settime()
+            except (ImportError, OSError) as e:
+                print(f"could not set the time: {e}")
+
+        if state.group is None:
+            if self.setup_mqtt is None:
+                from ha_mqtt import setup_mqtt
+                self.setup_mqtt = lambda *args: setup_mqtt(
+                    *args, asynchronous=True, settings=self.settings, statistics=self.statistics)
+            state.group = self.setup_mqtt(
+                self.config.get("mqtt_user"),
+                self.config.get("mqtt_password"),
+                f"http://{configuration_url}:8266")
+            self.queue.group = state.group
+            if hasattr(state.group.mqtt, "run"):
+                # the asynchronous client connects and receives in a task of its own
+                self._mqtt_task = asyncio.create_task(state.group.mqtt.run())
+            if state.group.mqtt.connected and boottime.mark("mqtt"):
+                print(boottime.report())
+
+    def _idle_ms(self) -> int:
+        """Time until the next task is due, 0 while a task runs its job or
+        MQTT waits for an acknowledgement"""
+        state = self.state
+        if state.running or not state.next_run_ms:
+            return 0
+        if state.group is not None and getattr(state.group.mqtt, "waiting", False):
+            return 0
+        now = time.ticks_ms()
+        return min(time.ticks_diff(due, now) for due in state.next_run_ms.values())
+
+    async def idle(self):
+        """Light sleep between the tasks, woken shortly before the next one is
+        due (sensor reads, regulation, data log)"""
+        power = self.power
+        while True:
+            ms = self._idle_ms()
+            if ms > power.MIN_SLEEP_MS:
+                power.sleep(ms - power.WAKE_MARGIN_MS)
+                # let the tasks that are due now run first
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(IDLE_POLL_S)
+
+    async def start(self):
+        """First rotor decision from the local sensors, before Wi-Fi and MQTT"""
+        state = self.state
+        rdkr = self.rdkr
+        # guarded like the tasks in _every, a failure must not stop the boot
+        for name, job in (("sense", self.sense), ("strategy", self.evaluate_strategy)):
+            try:
+                await job()
+            except Exception as e:
+                print(f"first {name} failed: {e}")
+        if state.r2_target is None:
+            # no valid sensor values yet, keep the rotor off until there are
+            state.r2_target = rdkr.calculate_resistance(rdkr.ROTOR_OFF_TEMP)
+        try:
+            await self.regulate()
+        except Exception as e:
+            # the regulate task tries again
+            print(f"first regulate failed: {e}")
+        boottime.mark("first decision")
+        print(boottime.report())
+
+    async def run(self):
+        """Make the first rotor decision, then start all tasks and run forever"""
+        state = self.state
+        await self.start()
+        online = bool(self.config.get("ssid"))
+        tasks = [
+            asyncio.create_task(self._every("sense", self.sense)),
+            asyncio.create_task(self._every("strategy", self.evaluate_strategy, wake=state.settings_changed)),
+            asyncio.create_task(self._every("regulate", self.regulate, wake=state.target_changed)),
+            asyncio.create_task(self._every("log", self.log)),
+        ]
+        if online:
+            tasks += [
+                asyncio.create_task(self._every("wifi", self.supervise_wifi)),
+                asyncio.create_task(self._every("publish", self.publish)),
+                asyncio.create_task(self._every("keepalive", self.keepalive)),
+                asyncio.create_task(self._every("mqtt", self.poll_mqtt)),
+            ]
+        if self.power is not None and self.power.light_sleep:
+            if online:
+                # the radio is off in light sleep, the access point drops the
+                # station and the broker the MQTT session every time
+                print("light sleep would drop the Wi-Fi link, using Wi-Fi power save only")
+            else:
+                # created last, all tasks have a schedule when it first runs
+                tasks.append(asyncio.create_task(self.idle()))
+        await asyncio.gather(*tasks)
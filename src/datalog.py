@@ -0,0 +1,121 @@
+import os
+import struct
+import time
+
+# file header: magic, version, record size, capacity
+HEADER_FORMAT = "<4sBxHI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"RDKL"
+VERSION = 1
+
+# record: sequence number, unix time, 8 DHT values (x10, temperatures first,
+# in SENSOR_NAMES order), r1, r2, LED duty (u16), strategy code, stale flags
+RECORD_FORMAT = "<II8hffHBB"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+DHT_KEYS = (
+    "fresh_air_temp", "supply_air_temp", "return_air_temp", "exhaust_air_temp",
+    "fresh_air_hum", "supply_air_hum", "return_air_hum", "exhaust_air_hum",
+)
+# DHT value that was never read
+MISSING = -32768
+
+STRATEGY_CODES = dict(on=1, off=2, mirror=3, modulate=4)
+# stale flag bits
+STALE_BITS = dict(fresh_air=1, supply_air=2, return_air=4, exhaust_air=8, r2=16)
+
+# MicroPython on the ESP32 counts seconds from 2000, store unix time
+UNIX_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+class DataLog:
+    """Ring buffer of fixed size binary records in a file on flash.
+
+    The file holds at most `capacity` records of RECORD_SIZE bytes, after that
+    the oldest record is overwritten. Each record carries a sequence number,
+    so the newest record is found again after a reboot without rewriting a
+    header on every append.
+
+    Example usage:
+        log = DataLog("datalog.bin")
+        log.append(snapshot.values, r1, duty, "on", snapshot.stale)
+    """
+
+    def __init__(self, path: str = "datalog.bin", capacity: int = 8192):
+        self.path = path
+        self.buf = bytearray(RECORD_SIZE)
+        try:
+            self.file = open(path, "r+b")
+            header = self.file.read(HEADER_SIZE)
+            magic, version, size, capacity_on_file = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC or version != VERSION or size != RECORD_SIZE:
+                raise ValueError("incompatible log file")
+            self.capacity = capacity_on_file
+        except (OSError, ValueError) as e:
+            print(f"creating new log {path}: {e}")
+            self.file = open(path, "w+b")
+            self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE, capacity))
+            self.file.flush()
+            self.capacity = capacity
+        self.count = min((os.stat(path)[6] - HEADER_SIZE) // RECORD_SIZE, self.capacity)
+        self.next_seq = self._find_next_seq()
+
+    def _seq(self, slot: int) -> int:
+        self.file.seek(HEADER_SIZE + slot * RECORD_SIZE)
+        self.file.readinto(self.buf)
+        return struct.unpack_from("<I", self.buf, 0)[0]
+
+    def _find_next_seq(self) -> int:
+        """Binary search for the newest record.
+        Slots up to the newest one hold seq(0) + slot, later slots are older."""
+        if self.count == 0:
+            return 0
+        first = self._seq(0)
+        lo = 0
+        hi = self.count - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._seq(mid) == first + mid:
+                lo = mid
+            else:
+                hi = mid - 1
+        return first + lo + 1
+
+    def __len__(self):
+        return self.count
+
+    def append(self, sensors: dict, r1: float, pwm: int, action: str = None, stale=(), timestamp: int = None):
+        """Append one record. sensors holds the DHT values and r2 (Snapshot.values)."""
+        if timestamp is None:
+            timestamp = time.time() + UNIX_OFFSET
+        flags = 0
+        for name in stale:
+            flags |= STALE_BITS.get(name, 0)
+        buf = self.buf
+        struct.pack_into("<II", buf, 0, self.next_seq, int(timestamp))
+        for i, key in enumerate(DHT_KEYS):
+            v = sensors.get(key)
+            struct.pack_into("<h", buf, 8 + 2 * i, MISSING if v is None else int(round(v * 10)))
+        r2 = sensors.get("r2")
+        struct.pack_into(
+            "<ffHBB", buf, 24,
+            r1 if r1 is not None else float("nan"),
+            r2 if r2 is not None else float("nan"),
+            pwm, STRATEGY_CODES.get(action, 0), flags)
+
+        slot = self.next_seq % self.capacity
+        self.file.seek(HEADER_SIZE + slot * RECORD_SIZE)
+        self.file.write(buf)
+        self.file.flush()
+        self.next_seq += 1
+        self.count = min(self.count + 1, self.capacity)
+
+    def read(self, i: int) -> tuple:
+        """Record i, counted from the oldest one, as unpacked RECORD_FORMAT fields"""
+        if not 0 <= i < self.count:
+            raise IndexError("record index out of range")
+        first = self.next_seq - self.count
+        self._seq((first + i) % self.capacity)
+        return struct.unpack(RECORD_FORMAT, self.buf)
+
+    def close(self):
+        self.file.close()
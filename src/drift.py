@@ -0,0 +1,179 @@
+import math
+import time
+
+
+class LineTracker:
+    """Tracks log10 R = m + k * log_pwm of one LDR with a Kalman filter,
+    starting from calibrated coefficients.
+
+    m and k are modelled as random walks that move by about walk (standard
+    deviation per observation), seen through measurements with noise
+    standard deviation noise. Unlike recursive least squares with a
+    forgetting factor, the covariance stays bounded while the observations
+    stay at the same few light levels (rotor on/off targets).
+    """
+
+    def __init__(self, k: float, m: float, noise: float = 0.005, walk: tuple = (1e-4, 1e-5),
+                 p0: tuple = (1e-4, 1e-4)):
+        """noise: of a settled log10 R reading
+        walk: change of m and k per observation
+        p0: variance of the starting m and k"""
+        self.r = noise * noise
+        self.q = (walk[0] * walk[0], walk[1] * walk[1])
+        self.p0 = p0
+        self.reset(k, m)
+
+    def reset(self, k: float, m: float):
+        self.theta = [m, k]
+        self.P = [[self.p0[0], 0.0], [0.0, self.p0[1]]]
+        self.n = 0
+
+    @property
+    def k(self) -> float:
+        return self.theta[1]
+
+    @property
+    def m(self) -> float:
+        return self.theta[0]
+
+    def predict(self, x: float) -> float:
+        return self.theta[0] + self.theta[1] * x
+
+    def update(self, x: float, y: float) -> float:
+        """Add one observation, returns the prediction error before the update"""
+        P = self.P
+        P[0][0] += self.q[0]
+        P[1][1] += self.q[1]
+        error = y - self.predict(x)
+        Px = (P[0][0] + P[0][1] * x, P[1][0] + P[1][1] * x)
+        denom = self.r + Px[0] + Px[1] * x
+        self.theta[0] += Px[0] / denom * error
+        self.theta[1] += Px[1] / denom * error
+        for i in range(2):
+            for j in range(2):
+                P[i][j] -= Px[i] * Px[j] / denom
+        self.n += 1
+        return error
+
+
+class VactrolDrift:
+    """Follows the drift of a dualVactrol's calibration during normal use.
+
+    Every settled LSR1 measurement of set_r2 is a (log_pwm, log10 r1) point
+    on the LSR1 line, which a LineTracker follows. In normal use meter 2
+    measures the RDKR thermistor, not LSR2, so the LSR2 line is shifted by
+    the same change of light as LSR1 (LED ageing and temperature act on both
+    LDRs). That keeps the LSR1 to LSR2 relation of the last calibration and
+    moves the feed-forward of set_r2 with the LED. With lsr2=True meter 2 is
+    wired to LSR2 (as during calibration), and its readings in set_r2 and
+    get_lsr2_res track k2 and m2 directly.
+
+    drift is the change of light at the usual operating point since the
+    last calibration, in log10 (percent() for %). The coefficients are
+    saved to config.json with save_calibration when the drift moved more
+    than SAVE_THRESHOLD, but at most every SAVE_INTERVAL_S, to spare the
+    flash.
+
+    Example usage:
+        drift = VactrolDrift(vac, offset=config.get("drift", 0))
+        vac.set_r2(10000)   # feeds the tracker
+        print(drift.percent())
+    """
+
+    SAVE_THRESHOLD = 0.02           # log10 light change before saving (4.7 %)
+    SAVE_INTERVAL_S = 24 * 3600     # shortest time between saves
+    APPLY_THRESHOLD = 0.002         # log10 r change before the vactrol gets new coefficients
+    OUTLIER = 0.3                   # log10 prediction error of an unsettled or saturated reading
+    AVERAGING = 0.005               # weight of a new observation in the mean log_pwm and error
+
+    def __init__(self, vac: "dualVactrol", offset: float = 0.0, lsr2: bool = False):
+        """offset: drift at the saved coefficients (config.json "drift")
+        lsr2: meter 2 is connected to LSR2"""
+        self.vac = vac
+        self.lsr2 = lsr2
+        vac.drift = self
+        self.reset(offset)
+        self._saved_s = time.time()
+
+    def reset(self, offset: float = 0.0):
+        """Start from the current coefficients of the vactrol, e.g. after calibrate()"""
+        vac = self.vac
+        self.base = (vac.k1, vac.m1, vac.k2, vac.m2)
+        self.offset = offset
+        self.saved = offset
+        self.lsr1 = LineTracker(vac.k1, vac.m1)
+        self.lsr2_line = LineTracker(vac.k2, vac.m2)
+        # weighted mean log_pwm of the observations, where the drift is measured
+        self.x = None
+        # mean squared prediction error (log10)
+        self.mse = 0.0
+        self.rejected = 0
+
+    @property
+    def drift(self) -> float:
+        """log10 change of light since the last calibration"""
+        return self.offset + self._shift()
+
+    def percent(self) -> float:
+        return (10**self.drift - 1) * 100
+
+    def rms(self) -> float:
+        """rms error of the LSR1 prediction in %"""
+        return (10**math.sqrt(self.mse) - 1) * 100
+
+    def _shift(self) -> float:
+        if self.x is None:
+            return 0.0
+        k1, m1 = self.base[:2]
+        return (self.lsr1.predict(self.x) - (m1 + k1 * self.x)) / k1
+
+    def observe(self, log_pwm: float, log_r1: float, log_r2: float = None):
+        """Add settled log10 readings of LSR1 (and LSR2) at log_pwm"""
+        error = log_r1 - self.lsr1.predict(log_pwm)
+        if abs(error) > self.OUTLIER:
+            self.rejected += 1
+            return
+        self.lsr1.update(log_pwm, log_r1)
+        self.mse += self.AVERAGING * (error * error - self.mse)
+        self.x = log_pwm if self.x is None else self.x + self.AVERAGING * (log_pwm - self.x)
+        if log_r2 is not None:
+            self._observe_lsr2(log_pwm, log_r2)
+        self.apply()
+
+    def observe_lsr2(self, log_pwm: float, log_r2: float):
+        """Add a settled log10 reading of LSR2, ignored unless lsr2=True"""
+        self._observe_lsr2(log_pwm, log_r2)
+        self.apply()
+
+    def _observe_lsr2(self, log_pwm: float, log_r2: float):
+        if self.lsr2 and abs(log_r2 - self.lsr2_line.predict(log_pwm)) <= self.OUTLIER:
+            self.lsr2_line.update(log_pwm, log_r2)
+
+    def coefficients(self) -> tuple:
+        """Tracked k1, m1, k2, m2"""
+        if self.lsr2_line.n:
+            k2, m2 = self.lsr2_line.k, self.lsr2_line.m
+        else:
+            k2, m2 = self.base[2], self.base[3] + self.base[2] * self._shift()
+        return self.lsr1.k, self.lsr1.m, k2, m2
+
+    def apply(self):
+        """Hand the tracked coefficients to the vactrol when they moved enough
+        to matter (new coefficients drop the set_r2 feed-forward cache) and
+        save them when due"""
+        vac = self.vac
+        k1, m1, k2, m2 = self.coefficients()
+        x = self.x if self.x is not None else 0.0
+        if (abs(m1 + k1 * x - vac.m1 - vac.k1 * x) > self.APPLY_THRESHOLD
+                or abs(m2 + k2 * x - vac.m2 - vac.k2 * x) > self.APPLY_THRESHOLD):
+            vac.k1, vac.m1, vac.k2, vac.m2 = k1, m1, k2, m2
+        if (abs(self.drift - self.saved) > self.SAVE_THRESHOLD
+                and time.time() - self._saved_s >= self.SAVE_INTERVAL_S):
+            self.save()
+
+    def save(self):
+        """Save the coefficients the vactrol uses and the drift to config.json"""
+        self.vac.save_calibration()
+        self.saved = self.drift
+        self._saved_s = time.time()
+        print(f"vactrol drift {self.percent():.1f} %, coefficients saved")
@@ -2,9 +2,13 @@
 
 import ujson as json
 
+# hash of the last announced discovery configs, survives reboots
+DISCOVERY_HASH_PATH = "discovery.hash"
+
 class BaseEntity(object):
 
-    def __init__(self, mqtt, name, component, object_id, node_id, discovery_prefix, extra_conf):
+    def __init__(self, mqtt, name, component, object_id, node_id, discovery_prefix, extra_conf, publish=True,
+            command=False):
         self.mqtt = mqtt
 
         base_topic = discovery_prefix + b'/' + component + b'/'
@@ -16,9 +20,19 @@ class BaseEntity(object):
         self.state_topic = base_topic + b'state'
 
         self.config = {"name": name, "state_topic": self.state_topic}
+        if command:
+            # Home Assistant publishes the values set by the user here
+            self.command_topic = base_topic + b'set'
+            self.config["command_topic"] = self.command_topic
         if extra_conf:
             self.config.update(extra_conf)
-        self.mqtt.publish(self.config_topic, bytes(json.dumps(self.config), 'utf-8'), True, 1)
+        # serialized once, republished as is
+        self.config_payload = bytes(json.dumps(self.config), 'utf-8')
+        if publish:
+            self.publish_config()
+
+    def publish_config(self):
+        return self.mqtt.publish(self.config_topic, self.config_payload, True, 1)
 
     def remove_entity(self):
         self.mqtt.publish(self.config_topic, b'', 1)
@@ -29,10 +43,10 @@ class BaseEntity(object):
 class BinarySensor(BaseEntity):
 
     def __init__(self, mqtt, name, object_id, node_id=None,
-            discovery_prefix=b'homeassistant', extra_conf=None):
+            discovery_prefix=b'homeassistant', extra_conf=None, publish=True):
 
         super().__init__(mqtt, name, b'binary_sensor', object_id, node_id,
-                discovery_prefix, extra_conf)
+                discovery_prefix, extra_conf, publish)
 
     def publish_state(self, state):
         self.mqtt.publish(self.state_topic, b'ON' if state else b'OFF')
@@ -46,17 +60,31 @@ class BinarySensor(BaseEntity):
 class Sensor(BaseEntity):
 
     def __init__(self, mqtt, name, object_id, node_id=None,
-            discovery_prefix=b'homeassistant', extra_conf=None):
+            discovery_prefix=b'homeassistant', extra_conf=None, publish=True):
 
         super().__init__(mqtt, name, b'sensor', object_id, node_id,
-                discovery_prefix, extra_conf)
+                discovery_prefix, extra_conf, publish)
 
 class Text(BaseEntity):
     def __init__(self, mqtt, name, object_id, node_id=None,
-            discovery_prefix=b'homeassistant', extra_conf=None):
+            discovery_prefix=b'homeassistant', extra_conf=None, publish=True):
 
         super().__init__(mqtt, name, b'text', object_id, node_id,
-                discovery_prefix, extra_conf)
+                discovery_prefix, extra_conf, publish)
+
+class Number(BaseEntity):
+    def __init__(self, mqtt, name, object_id, node_id=None,
+            discovery_prefix=b'homeassistant', extra_conf=None, publish=True):
+
+        super().__init__(mqtt, name, b'number', object_id, node_id,
+                discovery_prefix, extra_conf, publish, command=True)
+
+class Select(BaseEntity):
+    def __init__(self, mqtt, name, object_id, node_id=None,
+            discovery_prefix=b'homeassistant', extra_conf=None, publish=True):
+
+        super().__init__(mqtt, name, b'select', object_id, node_id,
+                discovery_prefix, extra_conf, publish, command=True)
 
 class EntityGroup(object):
 
@@ -74,62 +102,235 @@ class EntityGroup(object):
             self.state_topic = discovery_prefix + b'/sensor/' + node_id + b'/state'
             extra_conf["state_topic"] = self.state_topic
         self.entities = []
-
-    def _update_extra_conf(self, extra_conf):
+        # state key -> state topic of entities with their own topic
+        self.topics = {}
+        # incoming topic -> function(msg), subscribed on every new session
+        self.handlers = {discovery_prefix + b'/status': self._on_status}
+        # state key -> last value received on the command topic of its
+        # number or select entity, collected by take_commands
+        self.commands = {}
+        self._subscribed = False
+        # set on connect, the discovery configs are checked by update_discovery
+        self.check_discovery = False
+        # set when Home Assistant restarted and needs the discovery configs again
+        self.rediscover = False
+        self._discovery_hash = None
+        self._announced_hash = None
+        # state keys the last publish_state did not send
+        self.unsent = []
+        # entity to continue an announce with that a full publish window stopped
+        self._next_config = 0
+        # packet ids of the config publishes the asynchronous client has
+        # not had acknowledged yet
+        self._config_pids = []
+        mqtt.set_callback(self._on_message)
+        mqtt.on_connect = self._on_connect
+
+    def _update_extra_conf(self, extra_conf, key=None):
+        if key is not None:
+            # the entity keeps its own state topic and gets the plain value of key
+            extra_conf.update(self.extra_conf)
+            del extra_conf["state_topic"]
+            return
         if "value_template" not in extra_conf:
             raise Exception("Groupped sensors need value_template to be set.")
         extra_conf.update(self.extra_conf)
 
-    def create_binary_sensor(self, name, object_id, extra_conf):
-        self._update_extra_conf(extra_conf)
+    def _add(self, entity, key):
+        self.entities.append(entity)
+        if key is not None:
+            self.topics[key] = entity.state_topic
+        return entity
+
+    def create_binary_sensor(self, name, object_id, extra_conf, key=None):
+        self._update_extra_conf(extra_conf, key)
         bs = BinarySensor(self.mqtt, name, object_id, self.node_id,
-                self.discovery_prefix, extra_conf)
-        self.entities.append(bs)
-        return bs
+                self.discovery_prefix, extra_conf, publish=False)
+        return self._add(bs, key)
 
-    def create_sensor(self, name, object_id, extra_conf):
-        self._update_extra_conf(extra_conf)
+    def create_sensor(self, name, object_id, extra_conf, key=None):
+        self._update_extra_conf(extra_conf, key)
         s = Sensor(self.mqtt, name, object_id, self.node_id,
-                self.discovery_prefix, extra_conf)
-        self.entities.append(s)
-        return s
+                self.discovery_prefix, extra_conf, publish=False)
+        return self._add(s, key)
 
-    def create_text(self, name, object_id, extra_conf):
-        self._update_extra_conf(extra_conf)
+    def create_text(self, name, object_id, extra_conf, key=None):
+        self._update_extra_conf(extra_conf, key)
         t = Text(self.mqtt, name, object_id, self.node_id,
-                self.discovery_prefix, extra_conf)
-        self.entities.append(t)
-        return t
+                self.discovery_prefix, extra_conf, publish=False)
+        return self._add(t, key)
+
+    def create_number(self, name, object_id, extra_conf, key):
+        """Number entity set from Home Assistant, the values received for
+        it are returned by take_commands under key"""
+        self._update_extra_conf(extra_conf, key)
+        n = Number(self.mqtt, name, object_id, self.node_id,
+                self.discovery_prefix, extra_conf, publish=False)
+        return self._add_command(n, key)
+
+    def create_select(self, name, object_id, extra_conf, key):
+        """Select entity (extra_conf needs "options"), commands as for create_number"""
+        self._update_extra_conf(extra_conf, key)
+        s = Select(self.mqtt, name, object_id, self.node_id,
+                self.discovery_prefix, extra_conf, publish=False)
+        return self._add_command(s, key)
+
+    def _add_command(self, entity, key):
+        self.handlers[entity.command_topic] = lambda msg: self._on_command(key, msg)
+        return self._add(entity, key)
+
+    def take_commands(self) -> dict:
+        """key -> payload of the commands received since the last call"""
+        commands = self.commands
+        self.commands = {}
+        return commands
     
-    def publish_state(self, state):
-        self.mqtt.publish(self.state_topic, bytes(json.dumps(state), 'utf-8'))
+    def publish_state(self, state, qos=0):
+        """Publish the values of state to the topics of their entities (created
+        with a key), or state as JSON to the group state topic otherwise.
+        Returns True if everything was sent, False when offline and None when
+        the publish window of the asynchronous client was full. The keys not
+        sent are listed in unsent, to be published again later."""
+        if not self.topics:
+            sent = self.mqtt.publish(self.state_topic, bytes(json.dumps(state), 'utf-8'), False, qos)
+            self.unsent = [] if sent else list(state)
+            return sent
+        sent = True
+        unsent = []
+        for key, value in state.items():
+            topic = self.topics.get(key)
+            if topic is None:
+                continue
+            if sent:
+                sent = self.mqtt.publish(topic, bytes(str(value), 'utf-8'), False, qos)
+            if not sent:
+                unsent.append(key)
+        self.unsent = unsent
+        return sent
 
     def remove_group(self):
         for e in self.entities:
             e.remove_entity()
+
+    def discovery_hash(self):
+        """sha256 over all discovery topics and payloads"""
+        if self._discovery_hash is None:
+            import hashlib
+            import binascii
+            h = hashlib.sha256()
+            for e in self.entities:
+                h.update(e.config_topic)
+                h.update(e.config_payload)
+            self._discovery_hash = binascii.hexlify(h.digest())
+        return self._discovery_hash
+
+    def announce(self, force=False):
+        """Publish the discovery configs if they changed since they were last
+        announced, or if forced (Home Assistant restarted).
+        Returns True if the broker has the current configs, the hash is only
+        stored once every config publish is acknowledged."""
+        digest = self.discovery_hash()
+        if self._announced_hash is None:
+            try:
+                with open(DISCOVERY_HASH_PATH, "rb") as f:
+                    self._announced_hash = f.read()
+            except OSError:
+                self._announced_hash = b''
+        if digest == self._announced_hash and not force and not self._next_config:
+            return True
+        if not self._next_config:
+            print("publishing discovery configs")
+        # the asynchronous client takes a limited number of unacknowledged
+        # publishes, the next attempt continues where this one stopped
+        inflight = getattr(self.mqtt, "inflight", None)
+        for e in self.entities[self._next_config:]:
+            if not e.publish_config():
+                return False
+            self._next_config += 1
+            if inflight is not None:
+                self._config_pids.append(self.mqtt.pid)
+        if inflight is not None:
+            # the synchronous client returns after the PUBACK, the
+            # asynchronous one keeps the publish in flight until it arrives
+            self._config_pids = [pid for pid in self._config_pids if any(entry[0] == pid for entry in inflight)]
+            if self._config_pids:
+                return False
+        self._next_config = 0
+        self._announced_hash = digest
+        with open(DISCOVERY_HASH_PATH, "wb") as f:
+            f.write(digest)
+        return True
+
+    def update_discovery(self):
+        """Announce after a connect or a Home Assistant restart. Call this
+        regularly outside of the MQTT client callbacks."""
+        if self.rediscover or self.check_discovery:
+            if self.announce(force=self.rediscover):
+                self.rediscover = False
+                self.check_discovery = False
+
+    def _on_connect(self, session_present):
+        # the broker keeps the subscriptions of a persistent session, once
+        # per boot they are renewed in case entities were added
+        if not session_present or not self._subscribed:
+            for topic in self.handlers:
+                self.mqtt.subscribe(topic)
+            self._subscribed = True
+        # publishing here could reconnect from within connect
+        self.check_discovery = True
+
+    def _on_message(self, topic, msg):
+        handler = self.handlers.get(topic)
+        if handler is not None:
+            handler(msg)
+
+    def _on_command(self, key, msg):
+        # only kept here, this runs inside the MQTT client
+        self.commands[key] = msg
+
+    def _on_status(self, msg):
+        # Home Assistant publishes "online" on its status topic when it starts.
+        # Only flag it here, this runs inside the MQTT client.
+        if msg == b'online':
+            self.rediscover = True
+            self._next_config = 0
+            self._config_pids = []
             
 
 
 # Added locig for connecting and returning a mqtt group
-def setup_mqtt(username: str, password: str, configuration_url: str) -> EntityGroup:
+def setup_mqtt(username: str, password: str, configuration_url: str,
+        server: str = "homeassistant.local", port: int = 0, asynchronous: bool = False,
+        settings: dict = None, statistics: dict = None) -> EntityGroup:
     """Sets up the device and add all sensors.
-    Return the EntityObject that is used to update sensor readings."""
+    Return the EntityObject that is used to update sensor readings.
+
+    Every entity has its own state topic, so single values can be published
+    when they change. The discovery configs are only published when they
+    changed since the last announce (see EntityGroup.announce) or when Home
+    Assistant restarts.
+
+    With asynchronous=True the client is an mqtt_async.MQTTClient, which is
+    not connected yet on return: run group.mqtt.run() as a task and call
+    group.update_discovery() regularly.
+
+    settings (key -> dict(min, max, step, unit) or dict(options)) adds a
+    number or select entity per key, whose commands are collected with
+    group.take_commands() (see controller.SETTINGS).
+
+    statistics (key -> dict(unit)) adds a sensor per key for the statistics
+    of the sensor history (see controller.STATISTICS)."""
     
-    from mqtt_robust import MQTTClient
+    if asynchronous:
+        from mqtt_async import MQTTClient
+    else:
+        from mqtt_robust import MQTTClient
     import binascii
     from machine import unique_id
     serial_number = str(binascii.hexlify(unique_id()), "utf-8")
     client_id = "RDKR_" + serial_number[-5:]
 
-    mqtt = MQTTClient(bytes(client_id, "utf-8"), "homeassistant.local", user=username, password=password, keepalive=600)
-
-    print(f"connecting to mqtt with client id {client_id}")
-    try:
-        mqtt.connect()
-        print("connection successful")
-    except Exception as e:
-        print(f"Failed to connect to MQTT: {e}")
-    
+    mqtt = MQTTClient(bytes(client_id, "utf-8"), server, port, user=username, password=password, keepalive=600)
 
     device_config = dict(
         identifiers = [client_id],
@@ -151,50 +352,108 @@ def setup_mqtt(username: str, password: str, configuration_url: str) -> EntityGr
         temperature_config = {
             "unit_of_measurement": "°C",
             "device_class": "Temperature",
-            "value_template": "{{ " + f"value_json.{sensor}_temp" + "}}",
             "unique_id": f"{client_id}_{sensor}_temp",
             "state_class": "measurement"
             }
-        group.create_sensor(bytes(f"{sensor}_temp", "utf-8"), bytes(f"{sensor}_temp_id", "utf-8"), extra_conf=temperature_config)
+        group.create_sensor(bytes(f"{sensor}_temp", "utf-8"), bytes(f"{sensor}_temp_id", "utf-8"), extra_conf=temperature_config, key=f"{sensor}_temp")
         
         humidity_config = {
             "unit_of_measurement": "%",
             "device_class": "Humidity",    
-            "value_template": "{{ " + f"value_json.{sensor}_hum" + "}}",
             "unique_id": f"{client_id}_{sensor}_hum",
             "state_class": "measurement"
         }
-        group.create_sensor(bytes(f"{sensor}_hum", "utf-8"), bytes(f"{sensor}_hum_id", "utf-8"), extra_conf=humidity_config)
+        group.create_sensor(bytes(f"{sensor}_hum", "utf-8"), bytes(f"{sensor}_hum_id", "utf-8"), extra_conf=humidity_config, key=f"{sensor}_hum")
     
     # resistor sensor
     sensor = "r2"
     resistance_config = {
         "unit_of_measurement": "Ohm",
         "device_class": "Voltage",
-        "value_template": "{{ " + f"value_json.r2" + "}}",
         "unique_id": f"{client_id}_{sensor}_res",
         "state_class": "measurement"
         }
-    group.create_sensor(bytes("r2", "utf-8"), bytes("r2_id", "utf-8"), extra_conf=resistance_config)
+    group.create_sensor(bytes("r2", "utf-8"), bytes("r2_id", "utf-8"), extra_conf=resistance_config, key="r2")
     
     # rotor state
     rotor_state_config = {
     "payload_on": "on",  # Payload value indicating the motor is running
     "payload_off": "off",  # Payload value indicating the motor is stopped
     "device_class": "running",  # Set the device class to "motor"
-    "value_template": "{{ " + f"value_json.rotor_state" + "}}",
     "unique_id": f"{client_id}_rotor_state",  # Unique ID for the sensor
     #"state_class": "measurement",  # Set the state class to "measurement"
     }
-    group.create_binary_sensor(bytes("rotor_state", "utf-8"), bytes("rotor_state_id", "utf-8"), extra_conf=rotor_state_config)
+    group.create_binary_sensor(bytes("rotor_state", "utf-8"), bytes("rotor_state_id", "utf-8"), extra_conf=rotor_state_config, key="rotor_state")
     
     
     # strategy state
     strategy_state_config = {
-    "value_template": "{{ " + f"value_json.strategy_state" + "}}",
     "unique_id": f"{client_id}_strategy_state",  # Unique ID for the sensor
     }
-    group.create_sensor(bytes("strategy_state", "utf-8"), bytes("strategy_state_id", "utf-8"), extra_conf=strategy_state_config)
+    group.create_sensor(bytes("strategy_state", "utf-8"), bytes("strategy_state_id", "utf-8"), extra_conf=strategy_state_config, key="strategy_state")
     
+    # DHT sensors without recent valid readings
+    stale_config = {
+    "unique_id": f"{client_id}_stale",
+    "entity_category": "diagnostic",
+    }
+    group.create_sensor(bytes("stale_sensors", "utf-8"), bytes("stale_id", "utf-8"), extra_conf=stale_config, key="stale")
+    
+    # states waiting in the offline publish queue
+    queue_config = {
+    "unique_id": f"{client_id}_queue_depth",
+    "entity_category": "diagnostic",
+    "state_class": "measurement",
+    }
+    group.create_sensor(bytes("queue_depth", "utf-8"), bytes("queue_depth_id", "utf-8"), extra_conf=queue_config, key="queue_depth")
+
+    # change of the vactrol LED light since the last calibration sweep
+    drift_config = {
+    "unique_id": f"{client_id}_vactrol_drift",
+    "unit_of_measurement": "%",
+    "entity_category": "diagnostic",
+    "state_class": "measurement",
+    }
+    group.create_sensor(bytes("vactrol_drift", "utf-8"), bytes("vactrol_drift_id", "utf-8"), extra_conf=drift_config, key="vactrol_drift")
+
+    # statistics of the sensor history, e.g. the lowest fresh air temperature of the day
+    for key, spec in (statistics or {}).items():
+        statistic_config = {
+        "unique_id": f"{client_id}_{key}",
+        "unit_of_measurement": spec["unit"],
+        "state_class": "measurement",
+        }
+        if spec["unit"] == "°C":
+            statistic_config["device_class"] = "Temperature"
+        group.create_sensor(bytes(key, "utf-8"), bytes(f"{key}_id", "utf-8"), extra_conf=statistic_config, key=key)
+
+    # settings changed from Home Assistant
+    for key, spec in (settings or {}).items():
+        setting_config = {
+        "unique_id": f"{client_id}_{key}",
+        "entity_category": "config",
+        }
+        if "options" in spec:
+            setting_config["options"] = list(spec["options"])
+            group.create_select(bytes(key, "utf-8"), bytes(f"{key}_id", "utf-8"), extra_conf=setting_config, key=key)
+            continue
+        setting_config.update(min=spec["min"], max=spec["max"], step=spec["step"], mode="box")
+        if "unit" in spec:
+            setting_config["unit_of_measurement"] = spec["unit"]
+        group.create_number(bytes(key, "utf-8"), bytes(f"{key}_id", "utf-8"), extra_conf=setting_config, key=key)
+
+    # connect once the group exists, it subscribes on connect.
+    # A persistent session keeps the subscriptions over reconnects.
+    print(f"connecting to mqtt with client id {client_id}")
+    if asynchronous:
+        # mqtt.run() connects
+        return group
+    try:
+        mqtt.connect(False)
+        print("connection successful")
+        group.update_discovery()
+    except Exception as e:
+        print(f"Failed to connect to MQTT: {e}")
+
     return group
 
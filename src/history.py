@@ -0,0 +1,256 @@
+import time
+from array import array
+
+# sensor values kept, with the DHT sensor each belongs to (for the stale list)
+KEYS = (
+    "fresh_air_temp", "supply_air_temp", "return_air_temp", "exhaust_air_temp",
+    "fresh_air_hum", "supply_air_hum", "return_air_hum", "exhaust_air_hum",
+    "r2",
+)
+# stored as int16: value * scale, tenths by default, r2 in steps of 10 Ohm
+SCALES = dict(r2=0.1)
+DEFAULT_SCALE = 10
+# resolutions: name, seconds per sample (None: every sensor read), samples kept
+RESOLUTIONS = (
+    ("raw", None, 180),     # 30 min of sensor reads every 10 s
+    ("15min", 900, 96),     # 24 h
+    ("1h", 3600, 168),      # 7 days
+)
+# share of a ring that has to be filled before it has a slope
+SLOPE_MIN_FILL = 0.25
+
+
+class Ring:
+    """Fixed size ring buffer of int16 samples with rolling statistics.
+
+    The sum and the index weighted sum of the samples (for the least squares
+    slope) are updated in O(1) per sample, the minimum and the maximum in
+    amortized O(1) with monotonic queues of buffer positions. add() only does
+    integer arithmetic on preallocated arrays, so it allocates nothing; the
+    statistics are converted back with scale when they are queried.
+
+    A coarser resolution accumulates samples with accumulate() and adds
+    their mean with close() at the end of each of its periods.
+
+    The slope assumes evenly spaced samples: a missed one (skip()) leaves a
+    gap that would shorten the time axis, so there is no slope until the gap
+    left the ring, nor before SLOPE_MIN_FILL of it is filled.
+
+    Example usage:
+        ring = Ring(96, scale=10, period_s=900)
+        ring.add(215)  # 21.5 C
+        ring.mean(), ring.min(), ring.max(), ring.slope()
+    """
+
+    def __init__(self, size: int, scale: float = DEFAULT_SCALE, period_s: float = None):
+        """size: samples kept, at most 255 (the queues hold byte positions)
+        scale: stored value per unit, e.g. 10 for tenths
+        period_s: time between samples, for the slope per hour"""
+        if not 2 <= size <= 255:
+            raise ValueError("ring size must be 2 to 255")
+        self.size = size
+        self.scale = scale
+        self.period_s = period_s
+        self.values = array("h", bytes(2 * size))
+        # positions of the ascending (min) and descending (max) samples
+        self._min = array("B", bytes(size))
+        self._max = array("B", bytes(size))
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.pos = 0            # slot of the next sample, the oldest one when full
+        self.sum = 0
+        self.wsum = 0           # sum of i * sample, i = 0 for the oldest
+        self.since_gap = 0      # samples added since the last skip(), at most size
+        self._min_head = self._min_len = 0
+        self._max_head = self._max_len = 0
+        # sum and count of the samples of the open period
+        self.acc = 0
+        self.acc_n = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, y: int):
+        size = self.size
+        pos = self.pos
+        values = self.values
+        if self.count == size:
+            old = values[pos]
+            # the oldest sample leaves, all others move one index down
+            self.wsum += (size - 1) * y - self.sum + old
+            self.sum += y - old
+            if self._min_len and self._min[self._min_head] == pos:
+                self._min_head = self._min_head + 1 if self._min_head + 1 < size else 0
+                self._min_len -= 1
+            if self._max_len and self._max[self._max_head] == pos:
+                self._max_head = self._max_head + 1 if self._max_head + 1 < size else 0
+                self._max_len -= 1
+        else:
+            self.wsum += self.count * y
+            self.sum += y
+            self.count += 1
+        values[pos] = y
+        if self.since_gap < size:
+            self.since_gap += 1
+
+        queue = self._min
+        n = self._min_len
+        while n and values[queue[(self._min_head + n - 1) % size]] >= y:
+            n -= 1
+        queue[(self._min_head + n) % size] = pos
+        self._min_len = n + 1
+        queue = self._max
+        n = self._max_len
+        while n and values[queue[(self._max_head + n - 1) % size]] <= y:
+            n -= 1
+        queue[(self._max_head + n) % size] = pos
+        self._max_len = n + 1
+
+        self.pos = pos + 1 if pos + 1 < size else 0
+
+    def skip(self):
+        """A sample is missing, e.g. the sensor was stale"""
+        self.since_gap = 0
+
+    def accumulate(self, y: int):
+        """Add a sample to the open period"""
+        self.acc += y
+        self.acc_n += 1
+
+    def close(self):
+        """End the open period, its mean becomes a sample (a gap if it was empty)"""
+        n = self.acc_n
+        if n:
+            self.add((2 * self.acc + n) // (2 * n))
+        else:
+            self.skip()
+        self.acc = 0
+        self.acc_n = 0
+
+    def last(self):
+        if not self.count:
+            return None
+        return self.values[self.pos - 1] / self.scale
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.sum / self.count / self.scale
+
+    def min(self):
+        if not self.count:
+            return None
+        return self.values[self._min[self._min_head]] / self.scale
+
+    def max(self):
+        if not self.count:
+            return None
+        return self.values[self._max[self._max_head]] / self.scale
+
+    def slope(self):
+        """Least squares slope over the buffer, per hour (per sample without
+        period_s). None until SLOPE_MIN_FILL of the ring (at least 2
+        samples) is filled, and while a gap is in it"""
+        n = self.count
+        if n < 2 or n < self.size * SLOPE_MIN_FILL or self.since_gap < n:
+            return None
+        sx = n * (n - 1) // 2
+        sxx = (n - 1) * n * (2 * n - 1) // 6
+        slope = (n * self.wsum - sx * self.sum) / (n * sxx - sx * sx) / self.scale
+        if self.period_s:
+            slope *= 3600 / self.period_s
+        return slope
+
+    def samples(self) -> list:
+        """All samples, oldest first, e.g. for a chart"""
+        start = self.pos if self.count == self.size else 0
+        return [self.values[(start + i) % self.size] / self.scale for i in range(self.count)]
+
+
+class History:
+    """Recent sensor values at several resolutions, kept in RAM.
+
+    Every sensor read is added to the raw Ring of each key and accumulated in
+    the coarser ones, which take the mean of each of their periods. Values of
+    stale sensors are left out, as gaps in the raw rings. About 16 kB with the
+    default keys and RESOLUTIONS, and nothing is allocated per sample apart
+    from scaling the float readings.
+
+    Example usage:
+        history = History(sample_s=10)
+        history.add(snapshot)
+        history.get("return_air_temp", "15min").slope()  # C/h over 24 h
+        history.stat("fresh_air_temp", "15min", "min")
+    """
+
+    def __init__(self, keys=KEYS, sample_s: float = 10, resolutions=RESOLUTIONS):
+        """sample_s: time between sensor reads (controller.PERIODS["sense"])"""
+        self.keys = tuple(keys)
+        self.resolutions = tuple(name for name, _, _ in resolutions)
+        # e.g. "fresh_air" for "fresh_air_temp", "r2" for "r2"
+        self._sensors = tuple(key[:key.rfind("_")] if "_" in key else key for key in self.keys)
+        self._scales = tuple(SCALES.get(key, DEFAULT_SCALE) for key in self.keys)
+        self.rings = dict()
+        for key, scale in zip(self.keys, self._scales):
+            self.rings[key] = tuple(Ring(size, scale, period_s or sample_s) for _, period_s, size in resolutions)
+        self._rings = tuple(self.rings[key] for key in self.keys)
+        # period of each coarse resolution in ms and the ticks_ms it started
+        self._period_ms = tuple(int(period_s * 1000) if period_s else 0 for _, period_s, _ in resolutions)
+        self._start_ms = [None] * len(resolutions)
+
+    def get(self, key: str, resolution: str = "raw") -> Ring:
+        return self.rings[key][self.resolutions.index(resolution)]
+
+    def stat(self, key: str, resolution: str, stat: str):
+        """Statistic of a ring: "last", "mean", "min", "max" or "slope",
+        None while it is empty"""
+        return getattr(self.get(key, resolution), stat)()
+
+    def add(self, snapshot):
+        """Add the values of a sensors.Snapshot"""
+        self.add_values(snapshot.values, snapshot.stale, snapshot.ms)
+
+    def add_values(self, values: dict, stale=(), now: int = None):
+        if now is None:
+            now = time.ticks_ms()
+        rings = self._rings
+        # periods that ended, before this sample starts the next one
+        for level in range(len(self._period_ms)):
+            period_ms = self._period_ms[level]
+            if not period_ms:
+                continue
+            start = self._start_ms[level]
+            if start is None:
+                self._start_ms[level] = now
+                continue
+            if time.ticks_diff(now, start) < period_ms:
+                continue
+            for key_rings in rings:
+                key_rings[level].close()
+            start = time.ticks_add(start, period_ms)
+            if time.ticks_diff(now, start) < period_ms:
+                self._start_ms[level] = start
+            else:
+                # after a gap start over instead of closing empty periods
+                self._start_ms[level] = now
+                for key_rings in rings:
+                    key_rings[level].skip()
+
+        for i in range(len(rings)):
+            v = values.get(self.keys[i])
+            if v is None or self._sensors[i] in stale:
+                # a gap in the raw rings, the coarser ones average what they got
+                for level in range(len(self._period_ms)):
+                    if not self._period_ms[level]:
+                        rings[i][level].skip()
+                continue
+            y = int(round(v * self._scales[i]))
+            y = -32767 if y < -32767 else 32767 if y > 32767 else y
+            key_rings = rings[i]
+            for level in range(len(key_rings)):
+                if self._period_ms[level]:
+                    key_rings[level].accumulate(y)
+                else:
+                    key_rings[level].add(y)
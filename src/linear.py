@@ -1,34 +1,200 @@
+import math
+
+
+class linearAccumulator:
+    """
+    Streaming accumulator for a 1-D least-squares fit y = k * x + m.
+
+    Keeps running means and centered sums (Welford style) so the fit is
+    exact, numerically stable and uses constant memory, no matter how many
+    points are added.
+
+    Example usage:
+        acc = linearAccumulator()
+        for x, y in zip(log_pwm, log_r):
+            acc.add(x, y)
+        k, m = acc.solve()
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget all added points."""
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.syy = 0.0
+
+    def add(self, x: float, y: float):
+        """Add one (x, y) point to the running sums."""
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        # use the updated mean for the second factor (Welford)
+        self.sxx += dx * (x - self.mean_x)
+        self.sxy += dx * (y - self.mean_y)
+        self.syy += dy * (y - self.mean_y)
+
+    def solve(self):
+        """Return the least-squares coefficients.
+
+        returns: k, m"""
+        if self.n < 2 or self.sxx == 0:
+            raise ValueError("too few distinct datapoints to fit a line")
+        k = self.sxy / self.sxx
+        m = self.mean_y - k * self.mean_x
+        return k, m
+
+    def ss_res(self) -> float:
+        """Sum of squared residuals of the current fit."""
+        k, _ = self.solve()
+        # clamp tiny negative values caused by rounding
+        return max(self.syy - k * self.sxy, 0.0)
+
+    def r_squared(self) -> float:
+        """Coefficient of determination of the current fit."""
+        if self.syy == 0:
+            return 1.0
+        return 1 - self.ss_res() / self.syy
+
+    def residual_std(self) -> float:
+        """Standard deviation of the residuals (n - 2 degrees of freedom)."""
+        if self.n < 3:
+            return 0.0
+        return math.sqrt(self.ss_res() / (self.n - 2))
+
+    def slope_std_err(self) -> float:
+        """Standard error of the fitted slope k."""
+        if self.n < 3:
+            return float("inf")
+        return self.residual_std() / math.sqrt(self.sxx)
+
+
+class gramAccumulator:
+    """
+    Streaming accumulator for a multi-feature least-squares fit.
+
+    Builds the (p + 1) x (p + 1) Gram matrix X'X, the vector X'y and y'y in a
+    single pass, where the first column of X is the intercept term. Memory
+    only depends on the number of features.
+    """
+
+    def __init__(self, n_features: int):
+        self.p = n_features + 1
+        self.reset()
+
+    def reset(self):
+        """Forget all added points."""
+        p = self.p
+        self.n = 0
+        self.xtx = [[0.0] * p for _ in range(p)]
+        self.xty = [0.0] * p
+        self.yty = 0.0
+        self.sum_y = 0.0
+
+    def add(self, row: list, y: float):
+        """Add one row of features and its target value."""
+        self.n += 1
+        xtx = self.xtx
+        xty = self.xty
+        p = self.p
+        for i in range(p):
+            xi = row[i - 1] if i else 1.0
+            xty[i] += xi * y
+            xtx_i = xtx[i]
+            # the Gram matrix is symmetric, fill the upper triangle only
+            for j in range(i, p):
+                xtx_i[j] += xi * (row[j - 1] if j else 1.0)
+        self.yty += y * y
+        self.sum_y += y
+
+    def solve(self, tol: float = 0.0) -> list:
+        """Solve the normal equations with Gaussian elimination.
+
+        tol: pivots up to this size count as zero (too few distinct points)
+        returns: coefficients, intercept first"""
+        p = self.p
+        if self.n < p:
+            raise ValueError("too few datapoints to fit the model")
+        # augmented copy of the normal equations, mirroring the upper triangle
+        a = [
+            [self.xtx[min(i, j)][max(i, j)] for j in range(p)] + [self.xty[i]]
+            for i in range(p)
+        ]
+        for col in range(p):
+            pivot = max(range(col, p), key=lambda r: abs(a[r][col]))
+            if abs(a[pivot][col]) <= tol:
+                raise ValueError("features are linearly dependent")
+            a[col], a[pivot] = a[pivot], a[col]
+            for r in range(col + 1, p):
+                f = a[r][col] / a[col][col]
+                for c in range(col, p + 1):
+                    a[r][c] -= f * a[col][c]
+        coef = [0.0] * p
+        for r in range(p - 1, -1, -1):
+            s = a[r][p] - sum(a[r][c] * coef[c] for c in range(r + 1, p))
+            coef[r] = s / a[r][r]
+        return coef
+
+    def ss_res(self, coef: list) -> float:
+        """Sum of squared residuals for the given coefficients."""
+        return max(self.yty - sum(c * v for c, v in zip(coef, self.xty)), 0.0)
+
+    def ss_tot(self) -> float:
+        """Total sum of squares around the mean of y."""
+        return self.yty - self.sum_y * self.sum_y / self.n
+
+
 class linearRegressor:
     """
-    Linear regression model using gradient descent.
+    Linear regression model.
 
     Parameters:
         max_iter (int, optional): Maximum number of iterations for gradient descent. Default is 1000.
         lr (float, optional): Learning rate (step size) for coefficient updates. Default is 0.01.
+        solver (str, optional): "lstsq" solves the normal equations in one pass,
+            "gd" runs the gradient descent loop. Default is "lstsq".
 
     Attributes:
         coeficients (list): Coefficients (weights) for the linear regression model.
+        r_squared (float): Coefficient of determination of the fit.
+        mse (float): Mean squared error of the fit.
+        residual_std (float): Standard deviation of the residuals.
+        n (int): Number of datapoints used in the fit.
 
     Methods:
         fit(X, y):
             Fits the linear regression model to the given data.
 
         Example usage:
-            model = linearRegressor(max_iter=1000, lr=0.01)
+            model = linearRegressor()
             model.fit(X, y)
     """
 
-    def __init__(self, max_iter: int = 1000, lr: float = 0.01):
+    def __init__(self, max_iter: int = 1000, lr: float = 0.01, solver: str = "lstsq"):
         """
         Initialize the linear regression model.
 
         Args:
             max_iter (int, optional): Maximum number of iterations for gradient descent. Default is 1000.
             lr (float, optional): Learning rate (step size) for coefficient updates. Default is 0.01.
+            solver (str, optional): "lstsq" or "gd". Default is "lstsq".
         """
+        if solver not in ("lstsq", "gd"):
+            raise ValueError(f"unknown solver: {solver}")
         self.coeficients: list = None
         self.max_iter = max_iter
         self.lr = lr
+        self.solver = solver
+        self.r_squared: float = None
+        self.mse: float = None
+        self.residual_std: float = None
+        self.n: int = 0
 
     def fit(self, X: list[list], y: list):
         """
@@ -41,6 +207,38 @@ class linearRegressor:
         Returns:
             None
         """
+        if self.solver == "gd":
+            self._fit_gd(X, y)
+        else:
+            self._fit_lstsq(X, y)
+
+    def _fit_lstsq(self, X, y):
+        """Exact least-squares fit in a single pass over the data."""
+        if isinstance(X[0], list):
+            acc = gramAccumulator(len(X[0]))
+            for row, target in zip(X, y):
+                acc.add(row, target)
+            self.coeficients = acc.solve()
+            ss_res = acc.ss_res(self.coeficients)
+            ss_tot = acc.ss_tot()
+            dof = acc.n - acc.p
+        else:
+            acc = linearAccumulator()
+            for x, target in zip(X, y):
+                acc.add(x, target)
+            k, m = acc.solve()
+            self.coeficients = [m, k]
+            ss_res = acc.ss_res()
+            ss_tot = acc.syy
+            dof = acc.n - 2
+
+        self.n = acc.n
+        self.mse = ss_res / acc.n
+        self.r_squared = 1 - ss_res / ss_tot if ss_tot else 1.0
+        self.residual_std = math.sqrt(ss_res / dof) if dof > 0 else 0.0
+
+    def _fit_gd(self, X, y):
+        """Stochastic gradient descent fit (kept for comparison)."""
         # Check if X is list
         if not isinstance(X[0], list):
             X = [[x] for x in X]
@@ -104,3 +302,9 @@ class linearRegressor:
                     f"Found optimal coefficients, delta mse is 0. R squared is: {r_squared:.3f}"
                 )
                 break
+
+        self.n = len(X)
+        self.mse = mse
+        self.r_squared = r_squared
+        dof = len(X) - len(X[0])
+        self.residual_std = math.sqrt(ss_res / dof) if dof > 0 else 0.0
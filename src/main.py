@@ -1,27 +1,44 @@
-from machine import Pin, PWM, ADC, unique_id
-import math
-import utime
-import dht
+from machine import Pin
 import asyncio
 from vactrol import dualVactrol
+from drift import VactrolDrift
 from rdkr import Rdkr
-import json
-from ha_mqtt import setup_mqtt
-import time
+from controller import Controller
+from datalog import DataLog
+from history import History
+import thermistor
+from strategy import calculate_dew_point, rule_strategy  # available in the REPL
+import boottime
+boottime.mark("imports")
 
 # Configuration
+# The first three can also be changed from Home Assistant while running
+# (number entities), which saves them to config.json.
 # Set aim temperature to match the
 # heating/cooling system of your house
-AIM_TEMP = 21
+AIM_TEMP = config.get("aim_temp", 21)
 # Set dew point margin to negative to allow
 #some extra cooling during night.
 # Warning: can case condensation and halso halt
 # the RDKR.
-DEW_POINT_MARGIN = 1
+DEW_POINT_MARGIN = config.get("dew_point_margin", 1)
 # heating/cooling cost similar to rotor energy draw (14watts)
 # 14 watts can heat 50l/s air aproximaty 0.875C
 # If you use a heatpump with high efficiency, you can increase the relax temp 3-5x
-RELAXING_TEMP = 0.87 * 3
+RELAXING_TEMP = config.get("relaxing_temp", 0.87 * 3)
+# Rotor strategy, set "strategy" in config.json or from Home Assistant:
+# "rules" switches the rotor by fixed rules (strategy.py),
+# "predictive" learns how the house responds and plans ahead (predictive.py),
+# "modulating" varies the rotor speed for the supply air temperature
+# (modulation.py, for RDKR units with a variable speed rotor)
+STRATEGY = config.get("strategy", "rules")
+# Power mode, set "power" in config.json:
+# "modem" lets Wi-Fi sleep between the access point's beacons, except while
+# publishing, "light" puts the ESP32 in light sleep between the tasks of a
+# controller without Wi-Fi (no "ssid"), light sleep drops the Wi-Fi link.
+# Light sleep needs MicroPython 1.25 or later, whose PWM keeps the vactrol
+# LED lit
+POWER = config.get("power")
 
 
 
@@ -30,130 +47,60 @@ RELAXING_TEMP = 0.87 * 3
 T0 = 22 # 22C
 R0 = 10000 # 10kOhms at 22 C
 TCR = -750 #Ohms/C
+# The linear model above is only accurate close to T0. Fit a Beta or
+# Steinhart-Hart model to the data log in the REPL and save it to config.json:
+#   thermistor.save(thermistor.fit_log(DataLog("datalog.bin"), "beta"))
+# or set it by hand, e.g. "thermistor": {"model": "beta", "beta": 3950, "R0": 10000, "T0": 25}
+THERMISTOR = thermistor.from_config(config.get("thermistor"))
 #-----------------------------------------------------
 
-# create a vactrol object
-vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17)
+# create a vactrol object, with the coeficients of the config read by boot.py
+vac = dualVactrol(Pin(21), Pin(32), Pin(33), 17, config=config)
+# follow LED and LDR drift during use instead of regular calibration sweeps
+drift = VactrolDrift(vac, offset=config.get("drift", 0.0))
 # create the rdkr object
-rdkr = Rdkr(vac, T0, R0, TCR, Pin(15), Pin(27), Pin(26), Pin(25))
-# start with rotor off
-rdkr.rotor_off()
-
-def calculate_dew_point(T, H):
-    """
-    Calculates the dew point in Celsius.
-    """
-    a = 17.27
-    b = 237.7
-    alpha = ((a * T) / (b + T)) + math.log(H / 100.0)
-    dew_point = (b * alpha) / (a - alpha)
-    
-    return dew_point
+rdkr = Rdkr(vac, T0, R0, TCR, Pin(15), Pin(27), Pin(26), Pin(25), thermistor=THERMISTOR)
+# the controller makes the first rotor decision from the sensors right away
+boottime.mark("hardware")
 
 def main():
-    while True:
-        # Attempt to connect with a timeout if wifi is lost
-        timeout_seconds = 30
-        start_time = time.time()
-        while not wlan.isconnected() and time.time() - start_time < timeout_seconds:
-            try:
-                wlan.connect(ssid, password)
-                # Connect to MQTT
-                configuration_url = wlan.ifconfig()[0]
-                group = setup_mqtt(mqtt_user, mqtt_password, f"http://{configuration_url}:8266")
-
-            except: "trying again"
-            time.sleep(1)  # Wait for connection
-
-        if wlan.isconnected():
-            print("Wi-Fi connected:", wlan.ifconfig()[0])
-            webrepl.start()
-        else:
-            # Create MQTT group with a configuration URL (it will reconnect automatically)
-            configuration_url = wlan.ifconfig()[0]
-            group = setup_mqtt(mqtt_user, mqtt_password, f"http://{configuration_url}:8266")
-
-            print("Wi-Fi connection failed within the timeout.")
+    # wlan and config are set up by boot.py
+    datalog = DataLog("datalog.bin")
 
-        # Load all sensors
-        rdkr.read_sensors()
-        s = rdkr.extract_sensor_values()       
-        
-        dew_point = calculate_dew_point(s["return_air_temp"], s["return_air_hum"])
-        print(f"dew point is: {dew_point}, given temperature {s["return_air_temp"]} and humidity {s["return_air_hum"]}")
-        
-        # Find the current heating/cooling need
-        if s["return_air_temp"] > AIM_TEMP+RELAXING_TEMP:
-            need = "cooling"
-        elif s["return_air_temp"] < AIM_TEMP-RELAXING_TEMP:
-            need = "heating"
-        else:
-            need = "no_need"
-        
-        # find rotor comparable effect
-        if s["return_air_temp"] > s["fresh_air_temp"]:
-            rotor = "heats"
-        else:
-            rotor = "cools"
-        
-        # find air closest to aim
-        return_to_aim = s["return_air_temp"] - AIM_TEMP
-        fresh_to_aim = s["fresh_air_temp"] - AIM_TEMP
-        
-        strategy_state = "strategy"
-        rotor_state = "on"  # Rotor is always off when temperature is low
-        if s["fresh_air_temp"] < 10:
-            # Set r2 to the resistance measured of the termisor
-            r2 = s["r2"]
-            rdkr.vac.set_r2(r2)
-            strategy_state ="fresh air temperature is below 10C. Letting RDKR decide"
-        else:
-            # If fresh air is lower than dew point, rotor on
-            if s["fresh_air_temp"] < dew_point+DEW_POINT_MARGIN: 
-                # Set r2 to the resistance measured of the termisor
-                rdkr.rotor_on()
-                strategy_state ="fresh air temperature is below dew point. turning rotor on"
-            elif need == "cooling":
-                if rotor == "heats":
-                    rdkr.rotor_off()
-                    rotor_state = "off"
-                    strategy_state ="Cooling needed, turning rotor off"
-                else:
-                    rdkr.rotor_on()
-                    strategy_state ="Cooling needed, turning rotor on"
-            elif need == "heating":
-                if rotor == "heats":
-                    rdkr.rotor_on()
-                    strategy_state ="Heating needed, turning rotor on"
-                else:
-                    rdkr.rotor_off()
-                    rotor_state = "off"
-                    strategy_state ="Heating needed, turning rotor off"
-            else: #no need
-                if abs(return_to_aim) < abs(fresh_to_aim):
-                    rdkr.rotor_on()
-                    strategy_state ="no heating or cooling needed, turning rotor on"
-                else:
-                    rdkr.rotor_off()
-                    rotor_state = "off"
-                    strategy_state ="no heating or cooling needed, turning rotor off"
-        
-        
-        sensor_payload = rdkr.extract_sensor_payload()
-        extra_payload = dict(
-            rotor_state = rotor_state,
-            strategy_state = strategy_state
-            )
-        
-        # Generate MQTT payload
-        payload = dict()
+    def create_strategy(name):
+        if name == "predictive":
+            from predictive import PredictiveStrategy
+            # start from the history on flash rather than from scratch, fitted
+            # on its second call
+            return PredictiveStrategy(log=datalog)
+        if name == "modulating":
+            from modulation import ModulatingStrategy
+            return ModulatingStrategy(Rdkr.ROTOR_ON_TEMP, Rdkr.ROTOR_OFF_TEMP)
+        return rule_strategy
 
-        payload.update(sensor_payload)
-        payload.update(extra_payload)
-        print(payload)
-        group.publish_state(payload)
-        
-        # Sleep for 2 minutes
-        time.sleep(120)
+    strategy = create_strategy(STRATEGY)
+    power = None
+    if POWER is not None:
+        from power import PowerManager
+        light_sleep = POWER == "light" and vac.led_retained
+        if POWER == "light" and not light_sleep:
+            print("the PWM of this firmware stops in light sleep, using Wi-Fi power save only")
+        power = PowerManager(wlan, light_sleep=light_sleep)
+    controller = Controller(
+        rdkr,
+        wlan,
+        config,
+        aim_temp=AIM_TEMP,
+        dew_point_margin=DEW_POINT_MARGIN,
+        relaxing_temp=RELAXING_TEMP,
+        webrepl=True,
+        datalog=datalog,
+        strategy=strategy,
+        power=power,
+        create_strategy=create_strategy,
+        # the last 30 min, 24 h and 7 days of sensor values in RAM
+        history=History())
+    boottime.mark("setup")
+    asyncio.run(controller.run())
 
 main()
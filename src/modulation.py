@@ -0,0 +1,111 @@
+import time
+from strategy import rule_strategy
+
+
+class ModulatingStrategy:
+    """Modulates the rotor with a PI controller on the supply air temperature.
+
+    Instead of forcing the rotor on (ROTOR_ON_TEMP) or off (ROTOR_OFF_TEMP),
+    the emulated fresh air temperature (out_temp) is moved continuously
+    between them, so an RDKR with a variable speed rotor runs it at partial
+    speed. The controller output is the rotor demand from 0 (out_temp at
+    max_temp) to 1 (out_temp at min_temp). The supply air error is divided by
+    the return to fresh air difference, which is how much the rotor can move
+    the supply air and tells whether it heats or cools.
+
+    The supply air set point is the aim temperature, shifted by return_gain
+    times the deviation of the return air from the aim, so a warm house gets
+    cooler supply air. The integral only runs while the demand is not
+    saturated or moves out of saturation (anti-windup). out_temp changes by at
+    most max_rate C per minute and only when it moved more than min_change,
+    so the vactrol is not regulated for every small correction.
+
+    Below 10 C, near the dew point and without a supply air value the rules
+    of rule_strategy apply.
+
+    Has the signature of strategy.rule_strategy, the controller applies
+    out_temp for the "modulate" action:
+        strategy = ModulatingStrategy(Rdkr.ROTOR_ON_TEMP, Rdkr.ROTOR_OFF_TEMP)
+        action, rotor_state, strategy_state = strategy(s, dew_point, aim_temp, relaxing_temp, margin)
+    """
+
+    def __init__(
+        self,
+        min_temp: float,
+        max_temp: float,
+        kp: float = 0.5,
+        ti_s: float = 900,
+        return_gain: float = 2.0,
+        max_rate: float = 1.0,
+        min_change: float = 0.2):
+        """
+        min_temp, max_temp: out_temp range, rotor at full speed and stopped
+        kp: rotor demand per unit of normalised supply air error
+        ti_s: integral time in s
+        return_gain: supply set point change per C of return air above the aim
+        max_rate: largest out_temp change in C per minute
+        min_change: smallest out_temp change in C that is applied
+        """
+        self.min_temp = min_temp
+        self.max_temp = max_temp
+        self.kp = kp
+        self.ti_s = ti_s
+        self.return_gain = return_gain
+        self.max_rate = max_rate
+        self.min_change = min_change
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.demand = 0.0
+        self.out_temp = self.max_temp
+        self.setpoint = None
+        self._ms = None
+
+    def update(self, supply: float, fresh: float, ret: float, aim_temp: float, dt_s: float) -> float:
+        """One PI step, returns the new out_temp"""
+        setpoint = aim_temp - self.return_gain * (ret - aim_temp)
+        # the supply air stays between fresh (rotor stopped) and return air
+        self.setpoint = setpoint = min(max(setpoint, min(fresh, ret)), max(fresh, ret))
+        span = ret - fresh
+        if abs(span) < 0.5:
+            # the rotor makes no difference
+            return self.out_temp
+        error = (setpoint - supply) / span
+
+        integral = self.integral + self.kp * error * dt_s / self.ti_s
+        demand = self.kp * error + integral
+        # anti-windup: only integrate while not pushing further into saturation
+        if 0 <= demand <= 1 or (demand > 1 and error < 0) or (demand < 0 and error > 0):
+            self.integral = integral
+        demand = min(max(self.kp * error + self.integral, 0.0), 1.0)
+
+        target = self.max_temp - demand * (self.max_temp - self.min_temp)
+        step = self.max_rate * dt_s / 60
+        target = min(max(target, self.out_temp - step), self.out_temp + step)
+        if abs(target - self.out_temp) >= self.min_change or target in (self.min_temp, self.max_temp):
+            self.out_temp = target
+        self.demand = (self.max_temp - self.out_temp) / (self.max_temp - self.min_temp)
+        return self.out_temp
+
+    def __call__(self, s: dict, dew_point: float, aim_temp: float, relaxing_temp: float,
+                 dew_point_margin: float):
+        now = time.ticks_ms()
+        dt_s = 0 if self._ms is None else time.ticks_diff(now, self._ms) / 1000
+        self._ms = now
+        result = rule_strategy(s, dew_point, aim_temp, relaxing_temp, dew_point_margin)
+        supply = s.get("supply_air_temp")
+        if supply is None or result[0] == "mirror" or s["fresh_air_temp"] < dew_point + dew_point_margin:
+            # the rules decide, also without a supply air value (None while
+            # its sensor is stale). Continue from the rules' setting when
+            # modulation takes over again (a mirrored r2 stays where it was)
+            if result[0] == "on":
+                self.out_temp = self.min_temp
+            elif result[0] == "off":
+                self.out_temp = self.max_temp
+            self.demand = self.integral = (self.max_temp - self.out_temp) / (self.max_temp - self.min_temp)
+            return result
+
+        self.update(supply, s["fresh_air_temp"], s["return_air_temp"], aim_temp, dt_s)
+        rotor_state = "on" if self.out_temp < self.max_temp else "off"
+        return "modulate", rotor_state, "Modulating rotor speed for the supply air temperature"
@@ -0,0 +1,306 @@
+import asyncio
+import time
+import ustruct as struct
+import mqtt_simple
+from mqtt_simple import MQTTException, socket
+
+
+def _str(s) -> bytes:
+    """Length prefixed string of an MQTT packet"""
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def _packet(first: int, body: bytes) -> bytearray:
+    """Fixed header (packet type, flags, remaining length) followed by body"""
+    pkt = bytearray(5)
+    pkt[0] = first
+    sz = len(body)
+    assert sz < 2097152
+    i = 1
+    while sz > 0x7f:
+        pkt[i] = (sz & 0x7f) | 0x80
+        sz >>= 7
+        i += 1
+    pkt[i] = sz
+    return pkt[:i + 1] + body
+
+
+class MQTTClient(mqtt_simple.MQTTClient):
+    """MQTT client for asyncio, with the interface of mqtt_robust.MQTTClient.
+
+    The connection is an asyncio stream handled by the run() task: it
+    connects, receives (PUBACKs, PINGRESPs and subscribed messages) and
+    reconnects with exponential backoff between failed attempts. publish()
+    only writes the packet and returns, QoS 1 publishes stay in flight until
+    their PUBACK arrives, up to WINDOW of them. After a reconnect the ones
+    still in flight are sent again with the DUP flag (at least once delivery).
+
+    The broker address is resolved (mDNS for homeassistant.local, which
+    blocks) at most every ADDRESS_TTL seconds, or again after RESOLVE_AFTER
+    failed connects in a row, in case the broker moved.
+
+    Example usage:
+        mqtt = MQTTClient(b"RDKR_12345", "homeassistant.local", keepalive=600)
+        asyncio.create_task(mqtt.run())
+        ...
+        sent = mqtt.publish(topic, b"21.5", False, 1)
+        if sent is None:
+            pass  # too many unacknowledged publishes, send it again later
+        elif not sent:
+            pass  # offline, keep it for later
+    """
+
+    DEBUG = False
+    TIMEOUT = 10            # s to connect, and for a PUBACK or PINGRESP before the connection counts as lost
+    WINDOW = 16             # QoS 1 publishes waiting for their PUBACK, bigger states and discoveries take several
+    BACKOFF_MIN = 1         # s after the first failed connect, doubled with every further failure
+    BACKOFF_MAX = 300       # s, longest wait between connect attempts
+    ADDRESS_TTL = 3600      # s the resolved broker address is used
+    RESOLVE_AFTER = 3       # failed connects in a row before resolving the address again
+    POLL_S = 1              # s between acknowledgement checks while some are outstanding
+    # True while the connection is up
+    connected = False
+    # called with the session present flag after every successful (re)connect
+    on_connect = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reader = None
+        self.writer = None
+        # [pid, ticks_ms sent, packet] of unacknowledged QoS 1 publishes, oldest first
+        self.inflight = []
+        self.failures = 0
+        self._ping_ms = None
+        self._addr = None
+        self._resolved_ms = 0
+        # statistics
+        self.attempts = 0
+        self.resolves = 0
+        self.acked = 0
+
+    @property
+    def waiting(self) -> bool:
+        """True while publishes or a ping wait for their acknowledgement"""
+        return bool(self.inflight) or self._ping_ms is not None
+
+    def log(self, msg):
+        if self.DEBUG:
+            print("mqtt: " + msg)
+
+    def _resolve(self):
+        now = time.ticks_ms()
+        if (self._addr is None or self.failures >= self.RESOLVE_AFTER
+                or not 0 <= time.ticks_diff(now, self._resolved_ms) < self.ADDRESS_TTL * 1000):
+            try:
+                self._addr = socket.getaddrinfo(self.server, self.port)[0][-1]
+                self._resolved_ms = now
+                self.resolves += 1
+            except OSError:
+                # keep using the last address while the name does not resolve
+                if self._addr is None:
+                    raise
+        return self._addr
+
+    def _connect_packet(self, clean_session: bool) -> bytearray:
+        flags = clean_session << 1
+        body = _str(self.client_id)
+        if self.lw_topic:
+            flags |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3 | self.lw_retain << 5
+            body += _str(self.lw_topic) + _str(self.lw_msg)
+        if self.user is not None:
+            flags |= 0xC0
+            body += _str(self.user) + _str(self.pswd)
+        assert self.keepalive < 65536
+        return _packet(0x10, b"\x00\x04MQTT\x04" + struct.pack("!BH", flags, self.keepalive) + body)
+
+    async def connect(self, clean_session=False):
+        """Open the connection, sends the publishes still in flight again.
+        Returns the session present flag."""
+        self.attempts += 1
+        addr = self._resolve()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(addr[0], addr[1]), self.TIMEOUT)
+        self.writer.write(self._connect_packet(clean_session))
+        await self.writer.drain()
+        resp = await asyncio.wait_for(self.reader.readexactly(4), self.TIMEOUT)
+        if resp[0] != 0x20 or resp[1] != 0x02:
+            raise MQTTException("no CONNACK")
+        if resp[3] != 0:
+            raise MQTTException(resp[3])
+        self.connected = True
+        self.failures = 0
+        self._ping_ms = None
+        now = time.ticks_ms()
+        for entry in self.inflight:
+            entry[1] = now
+            entry[2][0] |= 0x08
+            self.writer.write(entry[2])
+        if self.inflight:
+            self.log(f"sending {len(self.inflight)} unacknowledged publishes again")
+        if self.on_connect is not None:
+            self.on_connect(resp[2] & 1)
+        return resp[2] & 1
+
+    async def run(self):
+        """Keep the connection up and handle incoming packets, forever"""
+        while True:
+            if not self.connected:
+                try:
+                    await self.connect(False)
+                    self.log("connected")
+                except Exception as e:
+                    self._close()
+                    delay = min(self.BACKOFF_MIN * 2 ** self.failures, self.BACKOFF_MAX)
+                    self.failures += 1
+                    self.log(f"connect failed: {e!r}, next attempt in {delay} s")
+                    await asyncio.sleep(delay)
+                    continue
+            try:
+                await self._receive()
+            except Exception as e:
+                self._lost(e)
+
+    async def _receive(self):
+        reader = self.reader
+        writer = self.writer
+        while self.connected:
+            await writer.drain()
+            timeout = self.POLL_S if self.inflight or self._ping_ms is not None else self.TIMEOUT
+            t0 = time.ticks_ms()
+            try:
+                op = await asyncio.wait_for(reader.read(1), timeout)
+            except asyncio.TimeoutError:
+                # after a blocking call elsewhere the acknowledgements may be
+                # waiting unread, only a wait that ended on time counts
+                if time.ticks_diff(time.ticks_ms(), t0) <= (timeout + self.POLL_S) * 1000:
+                    self._check_acks()
+                continue
+            if not op:
+                raise OSError("connection closed by the broker")
+            op = op[0]
+            sz = 0
+            sh = 0
+            while 1:
+                b = (await reader.readexactly(1))[0]
+                sz |= (b & 0x7f) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+            body = await reader.readexactly(sz) if sz else b""
+            kind = op & 0xf0
+            if kind == 0x40:
+                self._acked(body[0] << 8 | body[1])
+            elif kind == 0x30:
+                self._message(op, body)
+            elif kind == 0xd0:
+                self._ping_ms = None
+            elif kind == 0x90 and body[2] == 0x80:
+                self.log("subscription refused")
+
+    def _acked(self, pid: int):
+        for i, entry in enumerate(self.inflight):
+            if entry[0] == pid:
+                self.inflight.pop(i)
+                self.acked += 1
+                return
+
+    def _message(self, op: int, body: bytes):
+        topic_len = body[0] << 8 | body[1]
+        topic = body[2:2 + topic_len]
+        pos = 2 + topic_len
+        if op & 6:
+            pid = body[pos] << 8 | body[pos + 1]
+            pos += 2
+        if self.cb is not None:
+            self.cb(topic, body[pos:])
+        if op & 6 == 2:
+            self._send(b"\x40\x02" + struct.pack("!H", pid))
+
+    def _lost(self, e):
+        if self.connected:
+            self.log(f"connection lost: {e!r}")
+        self.connected = False
+        self._close()
+
+    def _close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    def _send(self, pkt) -> bool:
+        if not self.connected:
+            return False
+        try:
+            self.writer.write(pkt)
+            return True
+        except OSError as e:
+            self._lost(e)
+            return False
+
+    def _check_acks(self):
+        """OSError when the broker stopped acknowledging"""
+        now = time.ticks_ms()
+        limit = self.TIMEOUT * 1000
+        if ((self.inflight and time.ticks_diff(now, self.inflight[0][1]) > limit)
+                or (self._ping_ms is not None and time.ticks_diff(now, self._ping_ms) > limit)):
+            raise OSError("no acknowledgement within the timeout")
+
+    def _next_pid(self) -> int:
+        while True:
+            self.pid = self.pid % 65535 + 1
+            if not any(entry[0] == self.pid for entry in self.inflight):
+                return self.pid
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        """Send a message without waiting for its PUBACK. Returns True when
+        sent, False when not connected and None for QoS 1 when WINDOW
+        publishes are unacknowledged: still connected, the caller sends it
+        again once PUBACKs arrived rather than keeping it as if offline."""
+        assert 0 <= qos <= 1
+        if not self.connected:
+            return False
+        if qos and len(self.inflight) >= self.WINDOW:
+            return None
+        body = _str(topic)
+        if qos:
+            pid = self._next_pid()
+            body += struct.pack("!H", pid)
+        pkt = _packet(0x30 | qos << 1 | retain, body + msg)
+        if not self._send(pkt):
+            return False
+        if qos:
+            self.inflight.append([pid, time.ticks_ms(), pkt])
+        return True
+
+    def subscribe(self, topic, qos=0):
+        """Send a subscription, the SUBACK is handled by run()"""
+        assert self.cb is not None, "Subscribe callback is not set"
+        pkt = _packet(0x82, struct.pack("!H", self._next_pid()) + _str(topic) + bytes([qos]))
+        if not self._send(pkt):
+            raise OSError("mqtt not connected")
+
+    def ping(self):
+        """Send a PINGREQ, OSError when not connected"""
+        if not self._send(b"\xc0\0"):
+            raise OSError("mqtt not connected")
+        if self._ping_ms is None:
+            self._ping_ms = time.ticks_ms()
+
+    def reconnect(self):
+        # run() reconnects by itself, with backoff
+        pass
+
+    def check_msg(self, attempts=2):
+        # run() receives the messages
+        return None
+
+    def disconnect(self):
+        self._send(b"\xe0\0")
+        self.connected = False
+        self._close()
@@ -0,0 +1,216 @@
+import json
+import os
+import time
+from datalog import UNIX_OFFSET
+
+
+class StateQueue:
+    """Bounded store-and-forward queue in front of EntityGroup.publish_state.
+
+    States that could not be published are kept in RAM with their unix time.
+    When RAM is full the oldest states spill to a file on flash (one JSON line
+    per state), and when that file is full, states older than max_age_s are
+    evicted first, then the oldest ones.
+
+    Once a publish succeeds again, the backlog is replayed oldest first in
+    batches to the history topic (state topic + "/history"). A batch is a JSON
+    list of states with their unix time under "ts". The state topic itself
+    only gets the current state.
+
+    Example usage:
+        queue = StateQueue()
+        queue.group = setup_mqtt(user, password, url)
+        queue.publish_state(payload)
+    """
+
+    def __init__(
+        self,
+        group=None,
+        ram_size: int = 16,
+        spill_path: str = "mqtt_queue.jsonl",
+        spill_size: int = 720,
+        max_age_s: int = 86400,
+        batch_size: int = 8):
+        """
+        group: EntityGroup to publish to, may be set later
+        ram_size: states kept in RAM before spilling to flash
+        spill_size: states kept on flash (720 is 24 h of 120 s publishes)
+        max_age_s: states older than this are dropped instead of replayed
+        batch_size: states per replayed message
+        """
+        self.group = group
+        self.ram_size = ram_size
+        self.spill_path = spill_path
+        self.spill_size = spill_size
+        self.max_age_s = max_age_s
+        self.batch_size = batch_size
+        self.ram = []       # (unix time, state), oldest first
+        self.dropped = 0    # states evicted without being published
+        # states spilled before a reboot are still replayed
+        self.spilled = 0
+        try:
+            with open(spill_path) as f:
+                for _ in f:
+                    self.spilled += 1
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self.ram) + self.spilled
+
+    def _expired(self, ts: int, now: int) -> bool:
+        return now - ts > self.max_age_s
+
+    def put(self, state: dict, timestamp: int = None):
+        """Queue a state that could not be published"""
+        if timestamp is None:
+            timestamp = time.time() + UNIX_OFFSET
+        if len(self.ram) >= self.ram_size:
+            self._spill(self.ram.pop(0))
+        self.ram.append((int(timestamp), state))
+
+    def publish_state(self, state: dict, timestamp: int = None, values: dict = None) -> bool:
+        """Publish the current state, or only its values given in values
+        (e.g. the changed ones). If that works the backlog is replayed, when
+        offline the whole state is queued. Returns True if it was published,
+        False if it was queued and None if the publish window was full (the
+        values in group.unsent were not sent and are not queued either)."""
+        if values is None:
+            values = state
+        sent = self.group.publish_state(values, 1) if self.group is not None else False
+        if sent:
+            if len(self):
+                self.flush()
+            return True
+        if sent is None:
+            return None
+        self.put(state, timestamp)
+        return False
+
+    def flush(self) -> bool:
+        """Replay the backlog oldest first. Returns True if the queue is empty."""
+        if self.group is None:
+            return not len(self)
+        now = time.time() + UNIX_OFFSET
+        # spilled states are older than the ones in RAM
+        if self.spilled and not self._replay_spill(now):
+            return False
+        fresh = [entry for entry in self.ram if not self._expired(entry[0], now)]
+        self.dropped += len(self.ram) - len(fresh)
+        self.ram = fresh
+        while self.ram:
+            batch = self.ram[:self.batch_size]
+            if not self._send(batch):
+                return False
+            del self.ram[:len(batch)]
+        return True
+
+    def _send(self, batch: list) -> bool:
+        """Publish a batch of (unix time, state) as one message"""
+        states = []
+        for ts, state in batch:
+            state = dict(state)
+            state["ts"] = ts
+            states.append(state)
+        topic = self.group.state_topic + b"/history"
+        return self.group.mqtt.publish(topic, bytes(json.dumps(states), "utf-8"), False, 1)
+
+    def _spill(self, entry: tuple):
+        with open(self.spill_path, "a") as f:
+            f.write(json.dumps(entry))
+            f.write("\n")
+        self.spilled += 1
+        if self.spilled > self.spill_size:
+            self._compact()
+
+    def _compact(self):
+        """Evict expired states from the spill file, then the oldest ones
+        until it is 3/4 full, so it is not rewritten on every spill"""
+        now = time.time() + UNIX_OFFSET
+        fresh = 0
+        with open(self.spill_path) as f:
+            for line in f:
+                if not self._expired(_line_ts(line), now):
+                    fresh += 1
+        skip = max(fresh - self.spill_size * 3 // 4, 0)
+        kept = 0
+        tmp_path = self.spill_path + ".tmp"
+        with open(self.spill_path) as src, open(tmp_path, "w") as dst:
+            for line in src:
+                if self._expired(_line_ts(line), now):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                dst.write(line)
+                kept += 1
+        _replace(tmp_path, self.spill_path)
+        self.dropped += self.spilled - kept
+        self.spilled = kept
+
+    def _replay_spill(self, now: int) -> bool:
+        """Publish the spill file in batches. States that could not be sent
+        are kept in the file. Returns True if everything was sent."""
+        sent = True
+        left = 0
+        # states sent or expired, the rest is lost if the file fails
+        done = 0
+        batch = []
+        tmp_path = self.spill_path + ".tmp"
+        try:
+            with open(self.spill_path) as src, open(tmp_path, "w") as rest:
+                for line in src:
+                    if not sent:
+                        rest.write(line)
+                        left += 1
+                        continue
+                    if self._expired(_line_ts(line), now):
+                        self.dropped += 1
+                        done += 1
+                        continue
+                    batch.append(line)
+                    if len(batch) == self.batch_size:
+                        sent = self._send_lines(batch)
+                        if sent:
+                            done += len(batch)
+                        else:
+                            for line in batch:
+                                rest.write(line)
+                            left += len(batch)
+                        batch = []
+                if batch and self._send_lines(batch):
+                    done += len(batch)
+                elif batch:
+                    sent = False
+                    for line in batch:
+                        rest.write(line)
+                    left += len(batch)
+        except OSError as e:
+            print(f"could not replay {self.spill_path}: {e}")
+            self.dropped += max(self.spilled - done, 0)
+            self.spilled = 0
+            return True
+        if left:
+            _replace(tmp_path, self.spill_path)
+        else:
+            os.remove(tmp_path)
+            os.remove(self.spill_path)
+        self.spilled = left
+        return sent
+
+    def _send_lines(self, lines: list) -> bool:
+        return self._send([json.loads(line) for line in lines])
+
+
+def _line_ts(line: str) -> int:
+    """Unix time of a spilled state without parsing the whole line"""
+    return int(line[1:line.index(",")])
+
+
+def _replace(src: str, dst: str):
+    # os.rename does not overwrite on every filesystem
+    try:
+        os.remove(dst)
+    except OSError:
+        pass
+    os.rename(src, dst)
@@ -5,6 +5,14 @@ import mqtt_simple
 class MQTTClient(mqtt_simple.MQTTClient):
     DELAY = 2
     DEBUG = False
+    # seconds a socket read or write may block
+    TIMEOUT = 10
+    # True after a successful (re)connect until an operation fails
+    connected = False
+    # called with the session present flag after every successful (re)connect
+    on_connect = None
+    # set while publish/subscribe wait for their acknowledgement
+    _waiting_ack = False
 
     def delay(self, i):
         time.sleep(self.DELAY)
@@ -16,24 +24,53 @@ class MQTTClient(mqtt_simple.MQTTClient):
             else:
                 print("mqtt: %r" % e)
 
+    def connect(self, clean_session=True):
+        self.connected = False
+        result = super().connect(clean_session)
+        self.sock.settimeout(self.TIMEOUT)
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(result)
+        return result
+
     def reconnect(self):
         # try to reconnect 1 time
         try:
-            return super().connect(False)
+            return self.connect(False)
         except OSError as e:
             self.log(True, e)
             self.delay(1)
 
     def publish(self, topic, msg, retain=False, qos=0):
-        # try to publish 2 times
+        # try to publish 2 times, returns True if the message was sent
         for i in range(2):
+            self._waiting_ack = True
             try:
-                return super().publish(topic, msg, retain, qos)
+                super().publish(topic, msg, retain, qos)
+                return True
             except OSError as e:
+                self.connected = False
                 self.log(False, e)
+            finally:
+                self._waiting_ack = False
             self.reconnect()
+        return False
+
+    def subscribe(self, topic, qos=0):
+        self._waiting_ack = True
+        try:
+            return super().subscribe(topic, qos)
+        except OSError:
+            self.connected = False
+            raise
+        finally:
+            self._waiting_ack = False
 
     def wait_msg(self):
+        # a lost acknowledgement is handled by publish/subscribe,
+        # retrying it on a new connection would wait forever
+        if self._waiting_ack:
+            return super().wait_msg()
         while 1:
             try:
                 return super().wait_msg()
@@ -45,8 +82,12 @@ class MQTTClient(mqtt_simple.MQTTClient):
         while attempts:
             self.sock.setblocking(False)
             try:
-                return super().wait_msg()
+                op = super().wait_msg()
+                # wait_msg leaves the socket blocking without timeout
+                self.sock.settimeout(self.TIMEOUT)
+                return op
             except OSError as e:
+                self.connected = False
                 self.log(False, e)
             self.reconnect()
             attempts -= 1
\ No newline at end of file
@@ -0,0 +1,118 @@
+import time
+
+
+class PowerManager:
+    """Saves power between the controller tasks.
+
+    Wi-Fi runs in power save mode (modem sleep between the access point's
+    beacons) except while a task that uses the network runs. With
+    light_sleep the ESP32 goes to light sleep whenever no task is running
+    and the next one is due in more than MIN_SLEEP_MS, and wakes
+    WAKE_MARGIN_MS before it to make up for the wake latency. The radio is
+    off in light sleep, the access point drops the station and the broker
+    the MQTT connection, so the controller only light sleeps when it runs
+    without Wi-Fi (Controller.run). The vactrol LED has to stay lit
+    meanwhile: light sleep needs a PWM that runs in light sleep
+    (dualVactrol.led_retained), r2 would drift otherwise.
+
+    The active and sleep time of every control cycle (from one sensor read
+    to the next) are recorded in history, the last CYCLES of them.
+
+    Example usage:
+        power = PowerManager(wlan, light_sleep=vac.led_retained)
+        controller = Controller(..., power=power)
+    """
+
+    MIN_SLEEP_MS = 200      # shorter gaps are not worth the wake latency
+    WAKE_MARGIN_MS = 5      # woken this much before the next task is due
+    CYCLES = 32             # cycles kept in history
+    # tasks that run with Wi-Fi at full power
+    NETWORK_TASKS = ("publish", "keepalive", "mqtt", "wifi")
+
+    def __init__(self, wlan=None, light_sleep: bool = False, sleep=None):
+        """wlan: network.WLAN to switch between power save and full power
+        light_sleep: sleep between the tasks
+        sleep: function sleeping for ms, defaults to machine.lightsleep"""
+        self.wlan = wlan
+        self.light_sleep = light_sleep
+        if sleep is None and light_sleep:
+            from machine import lightsleep as sleep
+        self._sleep = sleep
+        # (active_ms, sleep_ms) of the last cycles, oldest first
+        self.history = []
+        self.cycles = 0
+        self.total_active_ms = 0
+        self.total_sleep_ms = 0
+        self.sleeps = 0
+        # longest delay of a task start behind its schedule
+        self.late_ms = 0
+        self._cycle_ms = time.ticks_ms()
+        self._sleep_ms = 0
+        self._full_power = None
+
+    def cycle(self):
+        """Start a new control cycle, records the one that ended"""
+        now = time.ticks_ms()
+        duration = time.ticks_diff(now, self._cycle_ms)
+        active = duration - self._sleep_ms
+        self.history.append((active, self._sleep_ms))
+        if len(self.history) > self.CYCLES:
+            self.history.pop(0)
+        self.cycles += 1
+        self.total_active_ms += active
+        self.total_sleep_ms += self._sleep_ms
+        self._cycle_ms = now
+        self._sleep_ms = 0
+
+    def awake(self) -> float:
+        """Percentage of the time awake over the recorded cycles"""
+        active = sum(c[0] for c in self.history)
+        total = active + sum(c[1] for c in self.history)
+        return 100 * active / total if total else 100.0
+
+    def started(self, name: str, late_ms: int):
+        """A task starts late_ms after it was due"""
+        if late_ms > self.late_ms:
+            self.late_ms = late_ms
+        self.network(name in self.NETWORK_TASKS)
+
+    def finished(self, name: str):
+        if name in self.NETWORK_TASKS:
+            self.network(False)
+
+    def network(self, full_power: bool):
+        """Wi-Fi at full power, or in power save mode"""
+        if self.wlan is None or full_power == self._full_power:
+            return
+        wlan = self.wlan
+        try:
+            wlan.config(pm=wlan.PM_NONE if full_power else wlan.PM_POWERSAVE)
+        except (AttributeError, ValueError) as e:
+            # firmware without WLAN power management
+            print(f"Wi-Fi power save is not available: {e}")
+            self.wlan = None
+            return
+        except OSError:
+            # interface not started yet, try again next time
+            return
+        self._full_power = full_power
+
+    def sleep(self, ms: int) -> int:
+        """Light sleep for about ms, returns the time slept in ms"""
+        t0 = time.ticks_ms()
+        self._sleep(ms)
+        slept = time.ticks_diff(time.ticks_ms(), t0)
+        self._sleep_ms += slept
+        self.sleeps += 1
+        return slept
+
+    def report(self) -> dict:
+        total = self.total_active_ms + self.total_sleep_ms
+        return dict(
+            cycles=self.cycles,
+            active_ms=self.total_active_ms,
+            sleep_ms=self.total_sleep_ms,
+            awake_percent=round(100 * self.total_active_ms / total, 1) if total else 100.0,
+            sleeps=self.sleeps,
+            late_ms=self.late_ms,
+        )
@@ -0,0 +1,238 @@
+import asyncio
+import time
+from datalog import UNIX_OFFSET
+from strategy import rule_strategy
+
+# datalog strategy codes
+_ACTIONS = {1: "on", 2: "off", 3: "mirror"}
+# data log records replayed between two yields to the other tasks
+FIT_BATCH = 64
+
+
+class ThermalModel:
+    """Indoor temperature response of the house, fitted online.
+
+    Over one step of step_s seconds the indoor (return air) temperature
+    changes by
+
+        dT = a * (fresh - indoor) + b * (supply - indoor) + c
+
+    a covers the losses through the building, b the ventilation and c the
+    internal and solar gains. The parameters are fitted by recursive least
+    squares with a forgetting factor, a fixed 3x3 update per sample.
+
+    The supply air follows the rotor: fresh + fan, plus efficiency times the
+    difference to the indoor air while the rotor runs. Both are tracked as
+    moving averages of the sensor values.
+    """
+
+    def __init__(self, step_s: int = 600, forgetting: float = 0.995,
+                 theta: tuple = (0.004, 0.002, 0.01), p0: float = 0.01):
+        self.step_s = step_s
+        self.forgetting = forgetting
+        self.theta = list(theta)
+        self.P = [[p0 if i == j else 0.0 for j in range(3)] for i in range(3)]
+        self.samples = 0
+        self.efficiency = 0.7
+        self.fan = 0.5
+
+    def update(self, fresh: float, indoor: float, supply: float, change: float):
+        """Add one step: mean temperatures over the step and the indoor change"""
+        x = (fresh - indoor, supply - indoor, 1.0)
+        P = self.P
+        theta = self.theta
+        Px = [P[i][0] * x[0] + P[i][1] * x[1] + P[i][2] * x[2] for i in range(3)]
+        denom = self.forgetting + x[0] * Px[0] + x[1] * Px[1] + x[2] * Px[2]
+        error = change - (theta[0] * x[0] + theta[1] * x[1] + theta[2])
+        for i in range(3):
+            theta[i] += Px[i] / denom * error
+        for i in range(3):
+            for j in range(3):
+                P[i][j] = (P[i][j] - Px[i] * Px[j] / denom) / self.forgetting
+        self.samples += 1
+
+    def track_supply(self, fresh: float, indoor: float, supply: float, rotor: bool, alpha: float = 0.05):
+        """Update the supply air model from one sensor reading"""
+        if rotor:
+            if abs(indoor - fresh) > 2:
+                efficiency = (supply - fresh - self.fan) / (indoor - fresh)
+                if 0 <= efficiency <= 1:
+                    self.efficiency += alpha * (efficiency - self.efficiency)
+        else:
+            self.fan += alpha * (supply - fresh - self.fan)
+
+    def supply(self, fresh: float, indoor: float, rotor: bool) -> float:
+        if rotor:
+            return fresh + self.fan + self.efficiency * (indoor - fresh)
+        return fresh + self.fan
+
+    def step(self, fresh: float, indoor: float, rotor: bool) -> float:
+        """Indoor temperature after one step"""
+        a, b, c = self.theta
+        return indoor + a * (fresh - indoor) + b * (self.supply(fresh, indoor, rotor) - indoor) + c
+
+    def plausible(self) -> bool:
+        """Losses and ventilation pull the indoor temperature towards the air"""
+        a, b, _ = self.theta
+        return a >= 0 and 0 < b < 1
+
+
+class PredictiveStrategy:
+    """Model predictive rotor strategy.
+
+    Learns a ThermalModel from the sensor values it is called with (and from
+    the data log with fit_log), then compares rotor schedules over the next
+    horizon_steps model steps: keep the current rotor setting, or switch it
+    after 0, 1, ... steps. Each schedule costs the squared deviation of the
+    predicted indoor temperature from the aim temperature plus switch_cost
+    per switch, and the first step of the cheapest schedule is applied.
+
+    The fresh air forecast repeats the daily profile learnt per hour of day.
+    Below 10 C and near the dew point the rules of rule_strategy apply, as
+    they do until the model has min_samples steps. A data log given as log
+    is fitted from the second evaluation on, so reading it does not delay
+    the first rotor decision after boot. The controller awaits prepare()
+    for that, which lets the other tasks run during the replay.
+
+    Has the signature of strategy.rule_strategy:
+        strategy = PredictiveStrategy()
+        action, rotor_state, strategy_state = strategy(s, dew_point, aim_temp, relaxing_temp, margin)
+    """
+
+    def __init__(self, model: ThermalModel = None, horizon_steps: int = 12,
+                 switch_cost: float = 0.5, min_samples: int = 12, log: "DataLog" = None):
+        self.model = model if model is not None else ThermalModel()
+        self.horizon_steps = horizon_steps
+        self.switch_cost = switch_cost
+        self.min_samples = min_samples
+        self.action = None
+        # fresh air temperature per hour of day
+        self.profile = [None] * 24
+        # step being accumulated: start time, start indoor, action, sums, count
+        self._step = None
+        # data log still to be fitted
+        self._log = log
+
+    def observe(self, t: int, s: dict, action: str):
+        """Add the sensor values s at time t (s) while action was applied"""
+        fresh = s.get("fresh_air_temp")
+        indoor = s.get("return_air_temp")
+        supply = s.get("supply_air_temp")
+        if fresh is None or indoor is None or supply is None or action not in ("on", "off"):
+            # the RDKR decides the rotor while r2 is mirrored
+            self._step = None
+            return
+        model = self.model
+        model.track_supply(fresh, indoor, supply, action == "on")
+
+        step = self._step
+        if step is None or step[2] != action or t - step[0] > 1.5 * model.step_s:
+            self._step = [t, indoor, action, fresh, indoor, supply, 1]
+            return
+        step[3] += fresh
+        step[4] += indoor
+        step[5] += supply
+        step[6] += 1
+        if t - step[0] >= model.step_s:
+            n = step[6]
+            change = (indoor - step[1]) * model.step_s / (t - step[0])
+            model.update(step[3] / n, step[4] / n, step[5] / n, change)
+            self._learn_profile(step[0], step[3] / n)
+            self._step = [t, indoor, action, fresh, indoor, supply, 1]
+
+    def _learn_profile(self, t: int, fresh: float, alpha: float = 0.3):
+        hour = int(t // 3600) % 24
+        if self.profile[hour] is None:
+            self.profile[hour] = fresh
+        else:
+            self.profile[hour] += alpha * (fresh - self.profile[hour])
+
+    def _replay(self, record: tuple):
+        if record[14] & 7:
+            # a stale fresh, supply or return air sensor
+            self.observe(record[1], dict(), None)
+            return
+        s = dict(fresh_air_temp=record[2] / 10, supply_air_temp=record[3] / 10,
+                 return_air_temp=record[4] / 10)
+        self.observe(record[1], s, _ACTIONS.get(record[13]))
+
+    def fit_log(self, log: "DataLog"):
+        """Learn from the history in a datalog.DataLog, oldest record first"""
+        for i in range(len(log)):
+            self._replay(log.read(i))
+        self._step = None
+
+    async def fit_log_async(self, log: "DataLog", batch: int = FIT_BATCH):
+        """Same as fit_log, but lets other asyncio tasks run every batch
+        records. A record appended meanwhile may shift the replay by one."""
+        for i in range(len(log)):
+            self._replay(log.read(i))
+            if i % batch == batch - 1:
+                await asyncio.sleep(0)
+        self._step = None
+
+    async def prepare(self):
+        """Fit the data log given as log, from the second evaluation on"""
+        if self._log is not None and self.action is not None:
+            log, self._log = self._log, None
+            await self.fit_log_async(log)
+
+    def forecast(self, t: int, fresh: float) -> list:
+        """Fresh air temperature for the next horizon_steps steps"""
+        step_s = self.model.step_s
+        profile = self.profile
+        if None in profile:
+            return [fresh] * self.horizon_steps
+        now = profile[int(t // 3600) % 24]
+        return [fresh + profile[int((t + k * step_s) // 3600) % 24] - now
+                for k in range(1, self.horizon_steps + 1)]
+
+    def plan(self, t: int, fresh: float, indoor: float, aim_temp: float, rotor: bool) -> tuple:
+        """(cost, steps before switching) of the cheapest schedule,
+        horizon_steps means keeping the current setting"""
+        model = self.model
+        forecast = self.forecast(t, fresh)
+        horizon = self.horizon_steps
+        best = None
+        # the schedule switching after k steps shares the first k steps with
+        # keeping the current setting
+        kept = indoor
+        kept_cost = 0.0
+        for k in range(horizon + 1):
+            temp = kept
+            cost = kept_cost
+            if k < horizon:
+                cost += self.switch_cost
+                for j in range(k, horizon):
+                    temp = model.step(forecast[j], temp, not rotor)
+                    cost += (temp - aim_temp) ** 2
+            if best is None or cost < best[0]:
+                best = (cost, k)
+            if k < horizon:
+                kept = model.step(forecast[k], kept, rotor)
+                kept_cost += (kept - aim_temp) ** 2
+        return best
+
+    def __call__(self, s: dict, dew_point: float, aim_temp: float, relaxing_temp: float,
+                 dew_point_margin: float, t: int = None):
+        if t is None:
+            t = time.time() + UNIX_OFFSET
+        if self._log is not None and self.action is not None:
+            # called without prepare(), outside of the controller
+            log, self._log = self._log, None
+            self.fit_log(log)
+        if self.action is not None:
+            self.observe(t, s, self.action)
+        result = rule_strategy(s, dew_point, aim_temp, relaxing_temp, dew_point_margin)
+        model = self.model
+        if (result[0] == "mirror" or s["fresh_air_temp"] < dew_point + dew_point_margin
+                or model.samples < self.min_samples or not model.plausible()):
+            self.action = result[0]
+            return result
+
+        rotor = self.action != "off"
+        _, k = self.plan(t, s["fresh_air_temp"], s["return_air_temp"], aim_temp, rotor)
+        if k == 0:
+            rotor = not rotor
+        self.action = "on" if rotor else "off"
+        return self.action, self.action, f"Predicted indoor temperature closest to aim with rotor {self.action}"
@@ -0,0 +1,89 @@
+import time
+
+# change needed before a value is published again, by key or key suffix
+DEADBANDS = dict(temp=0.2, hum=1.0, r2=100, drift=0.5,
+                 # statistics of the sensor history
+                 min=0.2, max=0.2, mean=0.2, trend=0.1,
+                 # settings, any change
+                 aim_temp=0, dew_point_margin=0, relaxing_temp=0)
+
+
+class PublishPolicy:
+    """Decides which values of a state are worth publishing.
+
+    A value is published when it moved more than its deadband (any change for
+    text values) since it was last published, but not more often than
+    min_interval_s. Unchanged values are republished every max_interval_s,
+    and the whole state every full_interval_s or after reset().
+
+    Example usage:
+        policy = PublishPolicy()
+        values = policy.select(payload)
+        if values and group.publish_state(values):
+            policy.sent(values)
+    """
+
+    def __init__(
+        self,
+        deadbands: dict = None,
+        min_interval_s: float = 30,
+        max_interval_s: float = 600,
+        full_interval_s: float = 3600):
+        self.deadbands = dict(DEADBANDS)
+        if deadbands:
+            self.deadbands.update(deadbands)
+        self.min_interval_ms = int(min_interval_s * 1000)
+        self.max_interval_ms = int(max_interval_s * 1000)
+        self.full_interval_ms = int(full_interval_s * 1000)
+        self.reset()
+
+    def reset(self):
+        """Publish the whole state next time, e.g. after Home Assistant restarted"""
+        self.last = dict()      # key -> (published value, ticks_ms)
+        self.full_ms = None     # ticks_ms of the last full state
+        self._full = False
+
+    def forget(self, key: str):
+        """Publish key next time, e.g. a setting changed from Home Assistant"""
+        self.last.pop(key, None)
+
+    def deadband(self, key: str) -> float:
+        if key in self.deadbands:
+            return self.deadbands[key]
+        return self.deadbands.get(key[key.rfind("_") + 1:], 0)
+
+    def changed(self, key: str, old, new) -> bool:
+        """True if new differs from old by more than the deadband of key"""
+        try:
+            return abs(float(new) - float(old)) > self.deadband(key)
+        except ValueError:
+            return new != old
+
+    def select(self, state: dict, now: int = None) -> dict:
+        """Values of state to publish now"""
+        if now is None:
+            now = time.ticks_ms()
+        self._full = self.full_ms is None or time.ticks_diff(now, self.full_ms) >= self.full_interval_ms
+        if self._full:
+            return dict(state)
+        selected = dict()
+        for key, value in state.items():
+            last = self.last.get(key)
+            if last is None:
+                selected[key] = value
+                continue
+            age = time.ticks_diff(now, last[1])
+            if age >= self.max_interval_ms or (
+                    age >= self.min_interval_ms and self.changed(key, last[0], value)):
+                selected[key] = value
+        return selected
+
+    def sent(self, values: dict, now: int = None):
+        """Record the values returned by select as published"""
+        if now is None:
+            now = time.ticks_ms()
+        for key, value in values.items():
+            self.last[key] = (value, now)
+        if self._full:
+            self.full_ms = now
+            self._full = False
@@ -1,80 +1,74 @@
 
 class Rdkr:
+    # emulated fresh air temperatures that force the rotor on or off
+    ROTOR_ON_TEMP = 10
+    ROTOR_OFF_TEMP = 22
+
     def __init__(
         self,
-        vac: dualVactrol,
+        vac: "dualVactrol",
         T0,
         R0,
         TCR,
-        fa_pin: Pin,
-        sa_pin: Pin,
-        ra_pin: Pin,
-        ea_pin: Pin):
+        fa_pin: "Pin",
+        sa_pin: "Pin",
+        ra_pin: "Pin",
+        ea_pin: "Pin",
+        thermistor=None):
+        """T0, R0, TCR: linear thermistor characteristic, used unless a
+        thermistor model (thermistor.py) is given"""
         
         from dht import DHT22
+        from thermistor import LinearThermistor
+        from sensors import SensorBank
         
         self.vac = vac
         self.T0 = T0
         self.R0 = R0
         self.TCR = TCR
+        self.thermistor = thermistor if thermistor is not None else LinearThermistor(T0, R0, TCR)
         # DHT sensors
         self.fresh_air_dht = DHT22(fa_pin)
         self.supply_air_dht = DHT22(sa_pin)
         self.return_air_dht = DHT22(ra_pin)
         self.exhaust_air_dht = DHT22(ea_pin)
+        self.sensors = SensorBank(
+            dict(
+                fresh_air = self.fresh_air_dht,
+                supply_air = self.supply_air_dht,
+                return_air = self.return_air_dht,
+                exhaust_air = self.exhaust_air_dht
+                ),
+            vac)
+        self.snapshot = None
 
     # sensors with mqtt matched output
-    def read_sensors(self):
-        """reads all sensors"""
-        try:
-            self.fresh_air_dht.measure()
-        except: "issue with FA DHT"
-        try:
-            self.supply_air_dht.measure()
-        except: "issue with SA DHT"
-        try:
-            self.return_air_dht.measure()
-        except: "issue with RA DHT"
-        try:
-            self.exhaust_air_dht.measure()
-        except: "issue with EA DHT"
-        
+    def read_sensors(self) -> "Snapshot":
+        """reads all sensors that are due into a new snapshot"""
+        self.snapshot = self.sensors.read()
+        return self.snapshot
+
     def extract_sensor_values(self) -> dict[str:float]:
-        # reads all sensors
-        sensors = dict(
-            fresh_air_temp = self.fresh_air_dht.temperature(),
-            supply_air_temp = self.supply_air_dht.temperature(),
-            return_air_temp = self.return_air_dht.temperature(),
-            exhaust_air_temp = self.exhaust_air_dht.temperature(),
-            fresh_air_hum = self.fresh_air_dht.humidity(),
-            supply_air_hum = self.supply_air_dht.humidity(),
-            return_air_hum = self.return_air_dht.humidity(),
-            exhaust_air_hum = self.exhaust_air_dht.humidity(),
-            r2 = self.vac.get_lsr2_res()
-            )
-        return sensors
-    
+        # values of the last snapshot, no new hardware reads
+        if self.snapshot is None:
+            self.read_sensors()
+        return self.snapshot.values
+
     def extract_sensor_payload(self) -> dict[str:str]:
-        # Make float version of payload
-        sensors = self.extract_sensor_values()
-        payload = {k: str(v) for (k, v) in sensors.items()}
-        return payload
-        
-    
+        # string version of the last snapshot
+        if self.snapshot is None:
+            self.read_sensors()
+        return self.snapshot.payload()
+
     # functions related to temperature/resistance conversion
 
     def calculate_temperature(self, r1):
         """Calculate the temperature represented by a resistance value"""
-        delta_r = r1-self.R0
-        T1 = self.T0 + delta_r/self.TCR
-        return T1
+        return self.thermistor.temperature(r1)
 
     def calculate_resistance(self, T1):
         """Calculate the resistant value representing a specific temperature"""
-        delta_t = T1-self.T0
-        delta_r = delta_t*self.TCR
-        r1 = self.R0+delta_r
-        return r1
+        return self.thermistor.resistance(T1)
 
     def set_out_temp(self, t2):
         # set LSR2 to corresponding temperature
@@ -83,10 +77,10 @@ class Rdkr:
 
     def rotor_on(self):
         # set t2 to 10C to force rotor to run
-        self.set_out_temp(10)
+        self.set_out_temp(self.ROTOR_ON_TEMP)
         print("rotor is on")
         
     def rotor_off(self):
         # set t2 to 22C to turn the rotor off
-        self.set_out_temp(22)
+        self.set_out_temp(self.ROTOR_OFF_TEMP)
         print("rotor is off")
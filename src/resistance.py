@@ -0,0 +1,82 @@
+from array import array
+
+# voltage divider of the resistance measuring units
+V0 = 5.0          # full range of voltage divider
+R_REF = 1000      # resistance of the reference resistor
+# readings at or above this are saturated (range of ADC pin is ~1 V)
+ADC_MAX_UV = 1000000
+
+
+class ResistanceMeter:
+    """Oversampled resistance measurement of a voltage divider using an ADC pin.
+
+    Each measurement bursts `samples` ADC readings into a preallocated buffer
+    and filters them with a median or a trimmed mean, so no memory is
+    allocated per measurement.
+
+    Example usage:
+        meter = ResistanceMeter(ADC(Pin(32)))
+        r, valid = meter.read()
+    """
+
+    def __init__(self, adc, samples: int = 9, method: str = "median", trim: int = 2):
+        """
+        adc: ADC of the resistance measuring unit
+        samples: number of ADC readings per measurement
+        method: "median" or "trimmed" (mean without the `trim` lowest and highest readings)
+        """
+        if method not in ("median", "trimmed"):
+            raise ValueError(f"unknown method: {method}")
+        if method == "trimmed" and samples <= 2 * trim:
+            raise ValueError("too few samples for the trim")
+        self.adc = adc
+        self.samples = samples
+        self.method = method
+        self.trim = trim
+        self.buf = array("i", [0] * samples)
+        # result of the last measurement
+        self.value = float("inf")
+        self.valid = False
+
+    def read_uv(self) -> int:
+        """Filtered ADC voltage in microvolts"""
+        buf = self.buf
+        n = self.samples
+        read = self.adc.read_uv
+        for i in range(n):
+            buf[i] = read()
+        # insertion sort in place, n is small
+        for i in range(1, n):
+            v = buf[i]
+            j = i - 1
+            while j >= 0 and buf[j] > v:
+                buf[j + 1] = buf[j]
+                j -= 1
+            buf[j + 1] = v
+
+        if self.method == "median":
+            if n % 2:
+                return buf[n // 2]
+            return (buf[n // 2 - 1] + buf[n // 2]) // 2
+        total = 0
+        for i in range(self.trim, n - self.trim):
+            total += buf[i]
+        return total // (n - 2 * self.trim)
+
+    def read(self):
+        """Measure the resistance.
+
+        returns: resistance in Ohm, valid. An open circuit gives inf and a
+        saturated ADC gives the lowest measurable resistance, both not valid."""
+        uv = self.read_uv()
+        self.valid = 0 < uv < ADC_MAX_UV
+        self.value = uv_to_res(uv)
+        return self.value, self.valid
+
+
+def uv_to_res(uv: int) -> float:
+    """Resistance of the unknown resistor given the ADC voltage over R_REF"""
+    if uv <= 0:
+        return float("inf")
+    vr1 = min(uv, ADC_MAX_UV) / 1e6
+    return R_REF * (V0 - vr1) / vr1
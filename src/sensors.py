@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+# DHT22 needs at least 2 s between two measurements
+DHT_MIN_INTERVAL_MS = 2000
+# sensor values older than this are reported as stale
+MAX_AGE_MS = 60000
+
+SENSOR_NAMES = ("fresh_air", "supply_air", "return_air", "exhaust_air")
+
+
+class SensorReading:
+    """Last good value of one DHT22 with timestamp and failure count"""
+
+    def __init__(self, name: str, dht):
+        self.name = name
+        self.dht = dht
+        self.temp = None
+        self.hum = None
+        self.ok_ms = None        # ticks_ms of the last good read
+        self.attempt_ms = None   # ticks_ms of the last read attempt
+        self.failures = 0        # consecutive failed reads
+        self.total_failures = 0
+
+    def due(self, now: int) -> bool:
+        """True if the DHT22 may be measured again"""
+        return self.attempt_ms is None or time.ticks_diff(now, self.attempt_ms) >= DHT_MIN_INTERVAL_MS
+
+    def read(self, now: int) -> bool:
+        """Measure the sensor if it is due. Returns True on a new good value."""
+        if not self.due(now):
+            return False
+        self.attempt_ms = now
+        try:
+            self.dht.measure()
+            temp = self.dht.temperature()
+            hum = self.dht.humidity()
+            if not (-40 <= temp <= 80 and 0 <= hum <= 100):
+                raise ValueError(f"out of range: {temp}C {hum}%")
+        except (OSError, ValueError) as e:
+            if not self.failures:
+                print(f"issue with {self.name} DHT: {e}")
+            self.failures += 1
+            self.total_failures += 1
+            return False
+        self.temp = temp
+        self.hum = hum
+        self.ok_ms = now
+        self.failures = 0
+        return True
+
+    def age_ms(self, now: int):
+        """Age of the cached value, None if never read"""
+        if self.ok_ms is None:
+            return None
+        return time.ticks_diff(now, self.ok_ms)
+
+    def is_stale(self, now: int, max_age_ms: int = MAX_AGE_MS) -> bool:
+        age = self.age_ms(now)
+        return age is None or age > max_age_ms
+
+
+class Snapshot:
+    """Sensor values of one control cycle.
+
+    values holds the same keys as Rdkr.extract_sensor_values. Stale sensors keep
+    their last good value (None if never read) and are listed in stale, an
+    invalid r2 measurement is listed as "r2"."""
+
+    def __init__(self, values: dict, stale: list, ms: int):
+        self.values = values
+        self.stale = stale
+        self.ms = ms
+
+    def is_stale(self, *names) -> bool:
+        """True if any of the named sensors (e.g. "fresh_air") is stale"""
+        for name in names:
+            if name in self.stale:
+                return True
+        return False
+
+    def payload(self) -> dict:
+        """String payload for MQTT. Values of stale sensors are left out and
+        the stale sensors are listed under "stale"."""
+        payload = dict()
+        for k, v in self.values.items():
+            if v is None or k in self.stale or k[:k.rfind("_")] in self.stale:
+                continue
+            payload[k] = str(v)
+        payload["stale"] = ",".join(self.stale)
+        return payload
+
+
+class SensorBank:
+    """Reads the four DHT22s and LSR2 into one Snapshot per cycle.
+
+    Each DHT22 is measured at most once per DHT_MIN_INTERVAL_MS, the last good
+    value is cached, and LSR2 is measured once per snapshot."""
+
+    def __init__(self, dhts: dict, vac, max_age_ms: int = MAX_AGE_MS):
+        """dhts: sensor name -> DHT22, vac: dualVactrol used to measure r2"""
+        self.readings = [SensorReading(name, dhts[name]) for name in SENSOR_NAMES]
+        self.vac = vac
+        self.max_age_ms = max_age_ms
+
+    def _snapshot(self, now: int) -> Snapshot:
+        values = dict()
+        stale = list()
+        for reading in self.readings:
+            values[reading.name + "_temp"] = reading.temp
+        for reading in self.readings:
+            values[reading.name + "_hum"] = reading.hum
+            if reading.is_stale(now, self.max_age_ms):
+                stale.append(reading.name)
+        r2, valid = self.vac.meter2.read()
+        values["r2"] = r2
+        if not valid:
+            stale.append("r2")
+        return Snapshot(values, stale, now)
+
+    def read(self) -> Snapshot:
+        """Read all due sensors and return a snapshot"""
+        for reading in self.readings:
+            reading.read(time.ticks_ms())
+        return self._snapshot(time.ticks_ms())
+
+    async def read_async(self) -> Snapshot:
+        """Same as read, but yields to other tasks between the sensors"""
+        for reading in self.readings:
+            reading.read(time.ticks_ms())
+            await asyncio.sleep(0)
+        return self._snapshot(time.ticks_ms())
@@ -0,0 +1,62 @@
+import math
+
+
+def calculate_dew_point(T, H):
+    """
+    Calculates the dew point in Celsius.
+    """
+    a = 17.27
+    b = 237.7
+    alpha = ((a * T) / (b + T)) + math.log(H / 100.0)
+    dew_point = (b * alpha) / (a - alpha)
+
+    return dew_point
+
+
+def rule_strategy(s: dict, dew_point: float, aim_temp: float, relaxing_temp: float, dew_point_margin: float):
+    """Decide what the rotor should do from the current sensor values.
+
+    action is "on" or "off" to force the rotor, or "mirror" to let the RDKR
+    see the resistance measured on the fresh air thermistor.
+
+    returns: action, rotor_state, strategy_state"""
+    # Find the current heating/cooling need
+    if s["return_air_temp"] > aim_temp+relaxing_temp:
+        need = "cooling"
+    elif s["return_air_temp"] < aim_temp-relaxing_temp:
+        need = "heating"
+    else:
+        need = "no_need"
+
+    # find rotor comparable effect
+    if s["return_air_temp"] > s["fresh_air_temp"]:
+        rotor = "heats"
+    else:
+        rotor = "cools"
+
+    # find air closest to aim
+    return_to_aim = s["return_air_temp"] - aim_temp
+    fresh_to_aim = s["fresh_air_temp"] - aim_temp
+
+    rotor_state = "on"  # Rotor is always off when temperature is low
+    if s["fresh_air_temp"] < 10:
+        return "mirror", rotor_state, "fresh air temperature is below 10C. Letting RDKR decide"
+
+    # If fresh air is lower than dew point, rotor on
+    if s["fresh_air_temp"] < dew_point+dew_point_margin:
+        return "on", rotor_state, "fresh air temperature is below dew point. turning rotor on"
+    elif need == "cooling":
+        if rotor == "heats":
+            return "off", "off", "Cooling needed, turning rotor off"
+        else:
+            return "on", rotor_state, "Cooling needed, turning rotor on"
+    elif need == "heating":
+        if rotor == "heats":
+            return "on", rotor_state, "Heating needed, turning rotor on"
+        else:
+            return "off", "off", "Heating needed, turning rotor off"
+    else: #no need
+        if abs(return_to_aim) < abs(fresh_to_aim):
+            return "on", rotor_state, "no heating or cooling needed, turning rotor on"
+        else:
+            return "off", "off", "no heating or cooling needed, turning rotor off"
@@ -0,0 +1,221 @@
+import math
+from array import array
+
+KELVIN = 273.15
+
+
+class LinearThermistor:
+    """R = R0 + TCR * (T - T0), accurate close to T0 only"""
+
+    name = "linear"
+
+    def __init__(self, T0: float = 22, R0: float = 10000, TCR: float = -750):
+        self.T0 = T0
+        self.R0 = R0
+        self.TCR = TCR
+
+    def resistance(self, temp: float) -> float:
+        return self.R0 + self.TCR * (temp - self.T0)
+
+    def temperature(self, r: float) -> float:
+        return self.T0 + (r - self.R0) / self.TCR
+
+    def to_config(self) -> dict:
+        return dict(model=self.name, T0=self.T0, R0=self.R0, TCR=self.TCR)
+
+
+class BetaThermistor:
+    """NTC with R = R0 * exp(beta * (1/T - 1/T0)), T in Kelvin"""
+
+    name = "beta"
+
+    def __init__(self, beta: float = 3950, R0: float = 10000, T0: float = 25):
+        self.beta = beta
+        self.R0 = R0
+        self.T0 = T0
+
+    def resistance(self, temp: float) -> float:
+        return self.R0 * math.exp(self.beta * (1 / (temp + KELVIN) - 1 / (self.T0 + KELVIN)))
+
+    def temperature(self, r: float) -> float:
+        return 1 / (1 / (self.T0 + KELVIN) + math.log(r / self.R0) / self.beta) - KELVIN
+
+    def to_config(self) -> dict:
+        return dict(model=self.name, beta=self.beta, R0=self.R0, T0=self.T0)
+
+
+class SteinhartHart:
+    """NTC with 1/T = a + b ln(R) + c ln(R)^3, T in Kelvin"""
+
+    name = "steinhart-hart"
+
+    def __init__(self, a: float, b: float, c: float):
+        self.a = a
+        self.b = b
+        self.c = c
+
+    def resistance(self, temp: float) -> float:
+        # real root of the cubic in ln(R)
+        x = (self.a - 1 / (temp + KELVIN)) / self.c
+        y = math.sqrt((self.b / (3 * self.c)) ** 3 + x * x / 4)
+        return math.exp(_cbrt(y - x / 2) - _cbrt(y + x / 2))
+
+    def temperature(self, r: float) -> float:
+        log_r = math.log(r)
+        return 1 / (self.a + self.b * log_r + self.c * log_r ** 3) - KELVIN
+
+    def to_config(self) -> dict:
+        return dict(model=self.name, a=self.a, b=self.b, c=self.c)
+
+
+def _cbrt(x: float) -> float:
+    return x ** (1 / 3) if x >= 0 else -((-x) ** (1 / 3))
+
+
+MODELS = {
+    "linear": LinearThermistor,
+    "beta": BetaThermistor,
+    "steinhart-hart": SteinhartHart,
+}
+
+
+def from_config(config: dict, default=None):
+    """Thermistor model from its to_config() dict, default if config is None.
+    Steinhart-Hart is returned as a TabulatedThermistor, its resistance() is
+    the slowest of the models."""
+    if config is None:
+        return default
+    config = dict(config)
+    model = config.pop("model")
+    if model not in MODELS:
+        raise ValueError(f"unknown thermistor model: {model}")
+    thermistor = MODELS[model](**config)
+    if model == "steinhart-hart":
+        return TabulatedThermistor(thermistor)
+    return thermistor
+
+
+def save(thermistor, path: str = "config.json"):
+    """Saves the thermistor model to config.json, used from the next boot"""
+    import json
+
+    with open(path, "r") as config_file:
+        config = json.load(config_file)
+
+    config["thermistor"] = thermistor.to_config()
+
+    with open(path, "w") as config_file:
+        json.dump(config, config_file)
+
+
+class TabulatedThermistor:
+    """Caches resistance(temp) of a model that is slow to invert.
+
+    The resistance is stored in an array('f') on a grid of `step` C from lo
+    to hi and linearly interpolated, outside the grid the model is used.
+
+    Example usage:
+        thermistor = TabulatedThermistor(SteinhartHart(a, b, c))
+        r2 = thermistor.resistance(10)
+    """
+
+    def __init__(self, model, lo: float = -40, hi: float = 60, step: float = 0.5):
+        self.model = model
+        self.name = model.name
+        self.lo = lo
+        self.step = step
+        self.n = int((hi - lo) / step) + 1
+        self.table = array("f", [model.resistance(lo + i * step) for i in range(self.n)])
+
+    def resistance(self, temp: float) -> float:
+        pos = (temp - self.lo) / self.step
+        i = int(pos)
+        if not 0 <= i < self.n - 1:
+            return self.model.resistance(temp)
+        table = self.table
+        a = table[i]
+        return a + (table[i + 1] - a) * (pos - i)
+
+    def temperature(self, r: float) -> float:
+        return self.model.temperature(r)
+
+    def to_config(self) -> dict:
+        return self.model.to_config()
+
+
+class ThermistorFit:
+    """Fits a thermistor model to (resistance, temperature) pairs with
+    constant memory, like linear.linearAccumulator.
+
+    linear and beta are straight line fits (R over T, ln R over 1/T).
+    Steinhart-Hart needs pairs over a wide temperature range (some 20 C or
+    more), otherwise its three terms can not be told apart; use beta then.
+
+    Example usage:
+        fit = ThermistorFit("beta")
+        for r2, temp in pairs:
+            fit.add(r2, temp)
+        thermistor = fit.solve()
+    """
+
+    def __init__(self, model: str = "beta", T0: float = 22):
+        """T0: reference temperature of the linear and beta models"""
+        if model not in MODELS:
+            raise ValueError(f"unknown thermistor model: {model}")
+        self.model = model
+        self.T0 = T0
+        self.reset()
+
+    def reset(self):
+        from linear import gramAccumulator, linearAccumulator
+
+        self.n = 0
+        if self.model == "steinhart-hart":
+            # normal equations of 1000/T = a + b L + c L^3 with L = ln(R) / 10
+            self.acc = gramAccumulator(2)
+        else:
+            self.acc = linearAccumulator()
+
+    def add(self, r: float, temp: float):
+        if r <= 0 or not -50 < temp < 100:
+            return
+        self.n += 1
+        if self.model == "linear":
+            self.acc.add(temp, r)
+        elif self.model == "beta":
+            self.acc.add(1 / (temp + KELVIN), math.log(r))
+        else:
+            L = math.log(r) / 10
+            self.acc.add((L, L * L * L), 1000 / (temp + KELVIN))
+
+    def solve(self):
+        """The fitted model, ValueError if the pairs do not determine it"""
+        if self.model == "linear":
+            TCR, m = self.acc.solve()
+            return LinearThermistor(self.T0, m + TCR * self.T0, TCR)
+        if self.model == "beta":
+            beta, m = self.acc.solve()
+            return BetaThermistor(beta, math.exp(m + beta / (self.T0 + KELVIN)), self.T0)
+        a, b, c = self.acc.solve(tol=1e-12)
+        # undo the scaling of L and 1/T
+        return SteinhartHart(a / 1000, b / 10000, c / 1000000)
+
+
+def fit_log(log: "DataLog", model: str = "beta", T0: float = 22):
+    """Fits a model to the measured r2 and fresh air temperature pairs in a
+    datalog.DataLog. r2 is the resistance of the fresh air thermistor, measured
+    whatever the rotor strategy.
+
+    Example usage (in the REPL):
+        import thermistor
+        model = thermistor.fit_log(DataLog("datalog.bin"), "beta")
+        thermistor.save(model)
+    """
+    fit = ThermistorFit(model, T0)
+    for i in range(len(log)):
+        record = log.read(i)
+        # skip a stale fresh air sensor or r2 measurement
+        if record[14] & 17:
+            continue
+        fit.add(record[11], record[2] / 10)
+    return fit.solve()
@@ -1,37 +1,85 @@
 #from ml import linearRegressor
-from linear import linearRegressor
+from resistance import ResistanceMeter, uv_to_res
 from machine import PWM, ADC, Pin
 import json
 import asyncio
 import math
 import time
 
+# limits for the LED pwm in the log domain (0.01-100 %)
+LOG_PWM_MIN = -2
+LOG_PWM_MAX = 2
+# largest change of log_pwm in one regulation step
+MAX_LOG_PWM_STEP = 0.5
+# log10 resistance used when no current flows through the divider
+LOG_R_MAX = 7
+
+
 class dualVactrol:
     """Representation of a dual vactrol with self regulating resistance output"""
+
+    # set_r2 regulation
+    R1_TOLERANCE = 500      # accepted LSR1 error in Ohm
+    MAX_STEPS = 25          # pwm updates before giving up
+    MAX_TIME_MS = 15000     # time budget before giving up
+    SETTLE_CHECK_MS = 20    # shortest interval between LSR1 samples while settling
+    SETTLE_MAX_MS = 1500    # longest wait for the LDR to settle
+    SETTLE_TOL = 0.005      # noise level of log10(R), changes below 3x are not extrapolated
+    FEED_FORWARD_CACHE = 8  # set_r2 targets whose feed-forward is kept
+
+    # adaptive calibration sweep
+    SWEEP_COARSE_POINTS = 11    # points of the coarse pass over log_pwm 0-2
+    SWEEP_MIN_POINTS = 8        # dense points before an early stop is allowed
+    SWEEP_MAX_POINTS = 60       # dense points at most
+    SWEEP_CI = 0.02             # 95 % confidence half width of k1 and k2 to stop at
+    SWEEP_SLOPE_TOL = 0.3       # relative slope deviation that marks a saturation knee
     
     def __init__(
         self,
         led_pin: Pin,
         lsr1_pin: Pin,
         lsr2_pin: Pin,
-        init_pwm: int=17):
+        init_pwm: int=17,
+        samples: int=9,
+        config: dict=None):
         """Instantiate a dual vactrol with photoresistor coeficients.
         
         Coeficients can be added manually, or calculated using the calibrate method.
+        samples is the number of ADC readings per resistance measurement.
+        config: parsed config.json holding the coeficients, read from flash if None
         
         """
 
-        self.led = PWM(led_pin, freq=int(1000), duty_u16=duty(init_pwm))
+        try:
+            # clocked so that it keeps running in light sleep (MicroPython 1.25+)
+            self.led = PWM(led_pin, freq=int(1000), duty_u16=duty(init_pwm), lightsleep=True)
+            self.led_retained = True
+        except TypeError:
+            self.led = PWM(led_pin, freq=int(1000), duty_u16=duty(init_pwm))
+            self.led_retained = False
         self.lsr1 = ADC(lsr1_pin)
         self.lsr2 = ADC(lsr2_pin)
+        self.meter1 = ResistanceMeter(self.lsr1, samples)
+        self.meter2 = ResistanceMeter(self.lsr2, samples)
 
         # Load stored coeficients
-        with open('config.json', 'r') as config_file:
-            config = json.load(config_file)
-            self.k1 = config.get('k1')
-            self.m1 = config.get('m1')
-            self.k2 = config.get('k2')
-            self.m2 = config.get('m2')
+        if config is None:
+            with open('config.json', 'r') as config_file:
+                config = json.load(config_file)
+        self.k1 = config.get('k1')
+        self.m1 = config.get('m1')
+        self.k2 = config.get('k2')
+        self.m2 = config.get('m2')
+
+        # LDR time constant estimates (ms) for increasing and decreasing light
+        self.tau_ms = [100, 100]
+        # telemetry of the last set_r2 call
+        self.regulation = None
+        # feed-forward rows of set_r2 by target, for the coefficients in the key
+        self._feed_forward = dict()
+        self._feed_forward_key = None
+        # drift.VactrolDrift following the coefficients during use
+        self.drift = None
     
     def run_calibration_sweep(self):
         """Run a pwm sweep and store lsr1 and lsr2 resistance"""
@@ -60,24 +108,134 @@ class dualVactrol:
             log_pwm_list.append(log_pwm)
             bit_list.append(bit_input)
             pwm_list.append(pwm)
-            r1.append(measure_res(self.lsr1))
-            r2.append(measure_res(self.lsr2))
+            r1.append(self.meter1.read()[0])
+            r2.append(self.meter2.read()[0])
         
         # calculate log values for resistance
         for r in r1:
-            r1_log.append(math.log10(r))
+            r1_log.append(log_res(r))
             
         for r in r2:
-            r2_log.append(math.log10(r))
+            r2_log.append(log_res(r))
         
         # set led to 0 again
         self.led.duty_u16(0)
         return log_pwm_list, r1_log, r2_log
     
-    def linear_regression(self, pwm: list, lsr: list, lr: float, max_iter: int):
+    def _sweep_point(self, log_pwm: float, log=None):
+        """Set the LED, wait for the LDRs and measure both.
+
+        returns: log10 r1, log10 r2, True if both measurements are valid"""
+        previous = self.led.duty_u16()
+        bit_input = duty(10**log_pwm)
+        self.led.duty_u16(bit_input)
+        if bit_input < previous:
+            # large steps to less light are slow, give the LDRs a head start
+            time.sleep_ms(self.SETTLE_MAX_MS)
+        log_r1, log_r2 = _run(self._settle(bit_input > previous, (self.meter1, self.meter2)))
+        if log is not None:
+            log.write(f"{log_pwm},{log_r1},{log_r2}\n")
+        return log_r1, log_r2, self.meter1.valid and self.meter2.valid
+
+    def find_linear_range(self, points: list):
+        """Find the log_pwm range where both LDRs are linear from a coarse sweep.
+
+        points: (log_pwm, log_r1, log_r2, valid) in increasing log_pwm
+        returns: lowest and highest log_pwm of the linear range"""
+        points = [p for p in points if p[3]]
+        assert len(points) >= 3, "too few valid datapoints. Make sure lsr measurement is connected to vactrol"
+
+        # slopes of the segments between neighbouring points
+        slopes = []
+        for a, b in zip(points, points[1:]):
+            dx = b[0] - a[0]
+            slopes.append(((b[1] - a[1]) / dx, (b[2] - a[2]) / dx))
+        median = []
+        for i in range(2):
+            ordered = sorted(s[i] for s in slopes)
+            median.append(ordered[len(ordered) // 2])
+
+        # segments whose slope is close to the median slope for both LDRs
+        linear = [
+            all(abs(s[i] - median[i]) <= self.SWEEP_SLOPE_TOL * abs(median[i]) for i in range(2))
+            for s in slopes
+        ]
+        # longest run of linear segments
+        best = (0, -1)
+        start = None
+        for i, ok in enumerate(linear + [False]):
+            if ok and start is None:
+                start = i
+            elif not ok and start is not None:
+                if i - start > best[1] - best[0] + 1:
+                    best = (start, i - 1)
+                start = None
+        assert best[1] >= best[0], "no linear range found. Make sure lsr measurement is connected to vactrol"
+
+        lo = points[best[0]][0]
+        hi = points[best[1] + 1][0]
+        # stay away from the knees, like the +5 trimming of the fixed sweep
+        margin = (hi - lo) / (2 * (best[1] - best[0] + 2))
+        return lo + margin, hi - margin
+
+    def run_adaptive_sweep(self, log=None):
+        """Calibration sweep with adaptive point placement.
+
+        A coarse pass finds the saturation knees, then points are placed in
+        the linear range only. Each dense pass runs upwards (the LDRs respond
+        fastest to more light) and fills the gaps of the previous passes, so
+        the range stays evenly covered. Points stream into one accumulator per
+        LDR and the sweep stops once k1 and k2 are known within SWEEP_CI.
+
+        log: optional file to write log_pwm,log_r1,log_r2 lines to
+        returns: accumulator for lsr1, accumulator for lsr2, sweep report"""
+        from linear import linearAccumulator
+
+        t0 = time.ticks_ms()
+        self.led.duty_u16(0)
+        time.sleep(1)
+
+        coarse = []
+        for i in range(self.SWEEP_COARSE_POINTS):
+            log_pwm = 2 * i / (self.SWEEP_COARSE_POINTS - 1)
+            coarse.append((log_pwm,) + self._sweep_point(log_pwm))
+        lo, hi = self.find_linear_range(coarse)
+        print(f"linear range: log_pwm {lo:.2f} - {hi:.2f}")
+
+        acc1 = linearAccumulator()
+        acc2 = linearAccumulator()
+        points = 0
+        ci = (float("inf"), float("inf"))
+        for log_pwm in _pass_points(lo, hi):
+            if points >= self.SWEEP_MAX_POINTS:
+                break
+            log_r1, log_r2, valid = self._sweep_point(log_pwm, log)
+            points += 1
+            if not valid:
+                continue
+            acc1.add(log_pwm, log_r1)
+            acc2.add(log_pwm, log_r2)
+            if points >= self.SWEEP_MIN_POINTS:
+                ci = (1.96 * acc1.slope_std_err(), 1.96 * acc2.slope_std_err())
+                if max(ci) < self.SWEEP_CI:
+                    break
+
+        self.led.duty_u16(0)
+        report = dict(
+            points = self.SWEEP_COARSE_POINTS + points,
+            time_ms = time.ticks_diff(time.ticks_ms(), t0),
+            linear_range = (lo, hi),
+            ci = ci,
+            r_squared = (acc1.r_squared(), acc2.r_squared())
+            )
+        return acc1, acc2, report
+
+    def linear_regression(self, pwm: list, lsr: list, lr: float, max_iter: int, solver: str = "lstsq"):
         """find linear coeficients k and m for the data.
 
         returns: k, m"""
+        from linear import linearRegressor
+
         print(len(pwm), len(lsr))
         
         # find start and stop for linear part
@@ -88,31 +246,54 @@ class dualVactrol:
         print(start_idx, end_idx)
         print(len(pwm[start_idx:end_idx]), len(lsr[start_idx:end_idx]))
         
-        reg = linearRegressor(max_iter=max_iter, lr=lr)
+        reg = linearRegressor(max_iter=max_iter, lr=lr, solver=solver)
         reg.fit(X=pwm[start_idx:end_idx], y=lsr[start_idx:end_idx])
+        print(f"R squared: {reg.r_squared:.4f}, residual std: {reg.residual_std:.4f}")
         
         m = reg.coeficients[0]
         k= reg.coeficients[1]
         return k, m
         
-    def calibrate(self, lr=0.1, max_iter=100, export_data=False):
-        """calibrate photoresistors for correct resistance output of LSR2"""
+    def calibrate(self, lr=0.1, max_iter=100, export_data=False, solver="lstsq", adaptive=False):
+        """calibrate photoresistors for correct resistance output of LSR2
+
+        solver: "lstsq" (exact, single pass) or "gd" (gradient descent using lr and max_iter)
+        adaptive: run the adaptive sweep (fewer points, linear range only) instead of
+            the fixed 100 point sweep. The fit is always exact least squares then."""
+
+        if adaptive:
+            print("Running adaptive calibration sweep")
+            log = open("calibration.csv", "w") if export_data else None
+            try:
+                acc1, acc2, report = self.run_adaptive_sweep(log)
+            finally:
+                if log is not None:
+                    log.close()
+            print(f"sweep report: {report}")
+            self.k1, self.m1 = acc1.solve()
+            self.k2, self.m2 = acc2.solve()
+            print(f"new coeficients added: k1: {self.k1}, m1: {self.m1}, k2: {self.k2}, m2: {self.m2}")
+            if self.drift is not None:
+                self.drift.reset()
+            return
         
         print("Running calibration sweep")
         log_pwm, log_r1, log_r2 = self.run_calibration_sweep()
         print(len(log_pwm), len(log_r1), len(log_r2))
         
         print("finding coeficients for lsr1")
-        k1, m1 = self.linear_regression(pwm=log_pwm, lsr=log_r1, lr=lr, max_iter=max_iter)
+        k1, m1 = self.linear_regression(pwm=log_pwm, lsr=log_r1, lr=lr, max_iter=max_iter, solver=solver)
  
         print("finding coeficients for lsr2")
-        k2, m2 = self.linear_regression(pwm=log_pwm, lsr=log_r2, lr=lr, max_iter=max_iter)
+        k2, m2 = self.linear_regression(pwm=log_pwm, lsr=log_r2, lr=lr, max_iter=max_iter, solver=solver)
         
         self.k1 = k1
         self.m1 = m1
         self.k2 = k2
         self.m2 = m2
         print(f"new coeficients added: k1: {k1}, m1: {m1}, k2: {k2}, m2: {m2}")
+        if self.drift is not None:
+            self.drift.reset()
         
         if export_data:
             with open("calibration.csv", "w") as f:
@@ -131,51 +312,177 @@ class dualVactrol:
         config["m1"] = self.m1
         config["k2"] = self.k2
         config["m2"] = self.m2
+        # light change since the last calibration sweep
+        config["drift"] = self.drift.drift if self.drift is not None else 0.0
         
         with open("config.json", "w") as config_file:
             json.dump(config, config_file)
         
 
     
-    def set_r2(self, r2):
-        """Sets resistance of LSR2 of the dual VACTROL by optimizing LSR1 resistance"""
-        #print(f"r2: {r2}")
-        # calculate the log10 representative of r2
-        log_r2 = math.log10(r2)
-        #print(f"log_r2: {log_r2}")
-        # log_pwm for given log10(res) (initial starting point)
-        log_pwm = (log_r2-self.m2)/self.k2
-        #print(f"log_pwm: {log_pwm}")
-        # calculate the pwm for given log(pwm)
-        pwm = 10**log_pwm
-        #print(f"pwm: {pwm}")
-        # find lsr1 res corresponing to lsr2 res
-        log_r1_aim = log_r2 + (self.m1-self.m2)
-        #print(f"log_r1_aim: {log_r1_aim}")
+    def set_r2(self, r2, max_steps: int = None, max_time_ms: int = None):
+        """Sets resistance of LSR2 of the dual VACTROL by optimizing LSR1 resistance.
+
+        Gives up after max_steps pwm updates or max_time_ms (defaults MAX_STEPS
+        and MAX_TIME_MS). Steps, time and final error are stored in self.regulation."""
+        for wait_ms in self._r2_steps(r2, max_steps, max_time_ms):
+            time.sleep_ms(wait_ms)
+
+    async def set_r2_async(self, r2, max_steps: int = None, max_time_ms: int = None):
+        """Same as set_r2, but lets other asyncio tasks run while the LDRs settle"""
+        for wait_ms in self._r2_steps(r2, max_steps, max_time_ms):
+            await asyncio.sleep(wait_ms / 1000)
+
+    def _settle(self, brighter: bool, meters: tuple = None):
+        """Generator waiting for the LDRs after a pwm change, returns the
+        predicted steady state log10 resistance for each meter.
+
+        The meters (default LSR1 only) are sampled four times, half a time
+        constant apart. Assuming a first order response, the samples of the
+        meter that changed most give the decay ratio q, from which the time
+        constant estimate for this direction of change is updated and the
+        rest of the response is extrapolated. If the LDR is much slower than
+        expected, it keeps sampling with a longer interval."""
+        if meters is None:
+            meters = (self.meter1,)
+        direction = 0 if brighter else 1
+        waited = 0
+        while True:
+            interval = min(max(self.tau_ms[direction] // 2, self.SETTLE_CHECK_MS), self.SETTLE_MAX_MS // 4)
+            samples = [[0.0] * 4 for _ in meters]
+            for i in range(4):
+                yield interval
+                for j, meter in enumerate(meters):
+                    samples[j][i] = log_res(meter.read()[0])
+            waited += 4 * interval
+
+            # decay ratio from the meter that changed the most
+            changes = [abs(y[2] - y[0]) for y in samples]
+            y1, y2, y3, y4 = samples[changes.index(max(changes))]
+            if abs(y3 - y1) < 3 * self.SETTLE_TOL:
+                # change too small to measure the response, use the last samples
+                return [(y[2] + y[3]) / 2 for y in samples]
+            q = (y4 - y2) / (y3 - y1)
+            if q <= 0.05:
+                return [(y[2] + y[3]) / 2 for y in samples]
+            if q < 0.8:
+                tau = -interval / math.log(q)
+                self.tau_ms[direction] = int((self.tau_ms[direction] + tau) / 2)
+                return [y[3] + (y[3] - y[1]) * q * q / (1 - q * q) for y in samples]
+            # much slower than expected, sample again with a longer interval
+            self.tau_ms[direction] = min(self.tau_ms[direction] * 2, self.SETTLE_MAX_MS)
+            if waited >= self.SETTLE_MAX_MS:
+                return [y[3] for y in samples]
+
+    def _feed_forward_row(self, r2) -> tuple:
+        """log_pwm for r2 from the LSR2 calibration, the log10 LSR1 target at
+        that light level and the log10 bounds of the LSR1 tolerance"""
+        log_pwm = (math.log10(r2) - self.m2) / self.k2
+        log_r1_aim = self.m1 + self.k1 * log_pwm
         r1_aim = 10**log_r1_aim
-        #print(f"r1_aim: {r1_aim}")
-        
-        error = 1000
-        #print("minimizing error")
-        while error > 500:
-            self.led.duty_u16(duty(pwm))
-            time.sleep_ms(200)
-            r1 = measure_res(self.lsr1)
-            error = r1 - r1_aim
-            #print(f"Error: {error}")
-            if abs(error) < 500:
+        return (log_pwm, log_r1_aim,
+                math.log10(max(r1_aim - self.R1_TOLERANCE, 1)),
+                math.log10(r1_aim + self.R1_TOLERANCE))
+
+    def feed_forward(self, r2) -> tuple:
+        """Same as _feed_forward_row, cached for the last FEED_FORWARD_CACHE
+        targets (the rotor on/off targets repeat). The cache is dropped when
+        the coefficients change."""
+        key = (self.k1, self.m1, self.k2, self.m2)
+        if key != self._feed_forward_key:
+            self._feed_forward_key = key
+            self._feed_forward = dict()
+        cache = self._feed_forward
+        row = cache.get(r2)
+        if row is None:
+            if len(cache) >= self.FEED_FORWARD_CACHE:
+                cache.clear()
+            row = cache[r2] = self._feed_forward_row(r2)
+        return row
+
+    def _r2_steps(self, r2, max_steps: int = None, max_time_ms: int = None):
+        """Generator running the LSR1 feedback loop for set_r2.
+        Yields the time in ms to wait before the next LSR1 measurement.
+
+        The first pwm comes from the LSR2 calibration (feed-forward). The
+        following steps are Newton steps in the log domain, using k1 as the
+        gain until a secant estimate from the last two steps is available.
+        The result is stored in self.regulation."""
+        if not self.k1 or not self.k2:
+            raise ValueError("vactrol is not calibrated, run calibrate()")
+        if max_steps is None:
+            max_steps = self.MAX_STEPS
+        if max_time_ms is None:
+            max_time_ms = self.MAX_TIME_MS
+        t0 = time.ticks_ms()
+
+        # log_pwm for r2 (initial starting point) and the LSR1 resistance
+        # at the same light level, with its tolerance in the log domain
+        log_pwm, log_r1_aim, log_r1_lo, log_r1_hi = self.feed_forward(r2)
+
+        drift = self.drift
+        # settle LSR2 as well if the drift tracker can use it
+        meters = (self.meter1, self.meter2) if drift is not None and drift.lsr2 else None
+        gain = self.k1
+        previous = None
+        steps = 0
+        converged = False
+        current_pwm = self.led.duty_u16()
+        log_r1 = None
+        while True:
+            log_pwm = min(max(log_pwm, LOG_PWM_MIN), LOG_PWM_MAX)
+            new_pwm = duty(10**log_pwm)
+            self.led.duty_u16(new_pwm)
+            steps += 1
+            if new_pwm != current_pwm or log_r1 is None:
+                settled = yield from self._settle(new_pwm > current_pwm, meters)
+                log_r1 = settled[0]
+                current_pwm = new_pwm
+                if drift is not None and new_pwm and LOG_PWM_MIN < log_pwm < LOG_PWM_MAX:
+                    drift.observe(math.log10(new_pwm / 655.35), log_r1, settled[1] if meters else None)
+
+            if log_r1_lo < log_r1 < log_r1_hi:
+                converged = True
                 break
-            elif error > 0: # high resistance -> needs higher pwm
-                pwm = pwm + 0.1
-            elif error < 0: # low resistance -> needs lower pwm
-                pwm = pwm - 0.1
-                
+            if steps >= max_steps or time.ticks_diff(time.ticks_ms(), t0) >= max_time_ms:
+                break
+
+            # secant estimate of the local gain, ignored if it is far off k1
+            if previous is not None and abs(log_pwm - previous[0]) > 1e-3:
+                secant = (log_r1 - previous[1]) / (log_pwm - previous[0])
+                if 0.2 < secant / self.k1 < 5:
+                    gain = secant
+            previous = (log_pwm, log_r1)
+
+            step = (log_r1_aim - log_r1) / gain
+            step = min(max(step, -MAX_LOG_PWM_STEP), MAX_LOG_PWM_STEP)
+            if (log_pwm >= LOG_PWM_MAX and step > 0) or (log_pwm <= LOG_PWM_MIN and step < 0):
+                # the LED is saturated, the target can not be reached
+                break
+            log_pwm += step
+
+        self.regulation = dict(
+            steps = steps,
+            time_ms = time.ticks_diff(time.ticks_ms(), t0),
+            error = 10**log_r1 - 10**log_r1_aim,
+            converged = converged,
+            pwm = 10**log_pwm,
+            tau_ms = tuple(self.tau_ms),
+            drift = drift.percent() if drift is not None else None
+            )
+        if not converged:
+            print(f"set_r2 did not converge: {self.regulation}")
+
     def get_lsr1_res(self):
-        r1 = measure_res(self.lsr1)
+        r1, _ = self.meter1.read()
         return r1
     
     def get_lsr2_res(self):
-        r2 = measure_res(self.lsr2)
+        r2, valid = self.meter2.read()
+        # a reading of LSR2 at the current light, if meter 2 is wired to it
+        pwm = self.led.duty_u16()
+        if self.drift is not None and self.drift.lsr2 and valid and pwm:
+            self.drift.observe_lsr2(math.log10(pwm / 655.35), log_res(r2))
         return r2
 
 
@@ -187,20 +494,39 @@ def duty(pwm: float) -> int:
     return int(duty)
 
 
+def _pass_points(lo: float, hi: float):
+    """Endless sequence of points in [lo, hi], in upward passes: the quarters,
+    then the eighths in between, then the sixteenths and so on."""
+    for i in range(5):
+        yield lo + (hi - lo) * i / 4
+    denominator = 8
+    while True:
+        for numerator in range(1, denominator, 2):
+            yield lo + (hi - lo) * numerator / denominator
+        denominator *= 2
+
+
+def _run(steps):
+    """Run a settle generator to the end, sleeping as requested.
+    returns: the value returned by the generator"""
+    try:
+        while True:
+            time.sleep_ms(next(steps))
+    except StopIteration as e:
+        return e.value
+
+
+def log_res(r) -> float:
+    """log10 of a measured resistance, LOG_R_MAX for an open circuit"""
+    if r <= 0:
+        return LOG_R_MAX
+    return min(math.log10(r), LOG_R_MAX)
+
+
 def measure_res(pin):
     """measure resistance of a voltage divider using a ADC pin.
-    Voltage divider have r1 to 1kOhm and a voltage range of 0-1."""
-    v0 = 5.0 # full range of voltage divider
-    vmax = 1 # range of ADC pin
-    r1 = 1000 # resistance of r1
-    #Vr1 = pin.read_u16() * (vmax / 65535)
-    Vr1 = pin.read_uv() / 1e6
-    
-    I: float = Vr1/r1
-    Vrx: float = v0 - Vr1
-    if I != 0:
-        Rx: float = Vrx / I
-    else:
-        Rx = "inf"
-    return Rx
+    Voltage divider have r1 to 1kOhm and a voltage range of 0-1.
 
+    Single sample, use ResistanceMeter for filtered measurements.
+    Returns inf on zero current."""
+    return uv_to_res(pin.read_uv())